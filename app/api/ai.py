@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, send_file
 from flask_login import login_required, current_user
 from app import db
 from app.models import Conversation, Message
+from app.services.telemetry import SpanRecorder, span
 from datetime import datetime
 import re
 import logging
@@ -96,6 +97,7 @@ def chat():
             'message': 'AI service not initialized'
         }), 500
     
+    recorder = SpanRecorder.start()
     try:
         data = request.json
         tab_name = data.get('tab', 'dental-brain')
@@ -124,7 +126,8 @@ def chat():
                 }), 404
         else:
             # Create new conversation with smart title
-            smart_title = generate_smart_title(message)
+            with span('title'):
+                smart_title = generate_smart_title(message)
             conversation = Conversation(
                 user_id=current_user.id,
                 title=smart_title
@@ -144,17 +147,19 @@ def chat():
         action = data.get('action')
         
         # Process message with AI
-        if action == 'generate-protocol':
-            # Special handling for protocol generation
-            result = ai_service.generate_clinical_protocol(message, user_settings)
-        else:
-            result = ai_service.process_chat_message(
-                message, 
-                tab_name, 
-                user_settings, 
-                action=action,
-                current_treatment_plan=current_treatment_plan
-            )
+        with span('ai'):
+            if action == 'generate-protocol':
+                # Special handling for protocol generation
+                result = ai_service.generate_clinical_protocol(message, user_settings)
+            else:
+                result = ai_service.process_chat_message(
+                    message, 
+                    tab_name, 
+                    user_settings, 
+                    action=action,
+                    current_treatment_plan=current_treatment_plan,
+                    conversation_id=conversation.id
+                )
         
         # Prepare metadata
         metadata = {}
@@ -163,6 +168,10 @@ def chat():
         if result.get('is_treatment_plan') and result.get('treatment_plan'):
             metadata['treatment_plan'] = result['treatment_plan']
             metadata['is_treatment_plan'] = True
+        if result.get('routing'):
+            metadata['routing'] = result['routing']
+        # Stage timings up to this point; the commit itself is only in the response and the histogram
+        metadata['timings'] = recorder.summary()
         
         # Save assistant response
         assistant_message = Message(
@@ -217,14 +226,25 @@ def chat():
                     if new_title_parts:
                         conversation.title = " ".join(new_title_parts)[:60]
         
-        db.session.commit()
+        with span('db_commit'):
+            db.session.commit()
+        
+        timings = recorder.summary()
+        ai_service.latency_stats.record(timings)
+        logger.info(f"⏱️ Chat turn {timings['total_ms']}ms: " +
+                    ", ".join(f"{item['name']}={item['ms']}ms" for item in timings['spans']))
+        
+        # Keep the conversation's cached history in sync with what was just committed
+        ai_service.history_store.append_turn(
+            conversation.id, message, result['response'], assistant_message.id
+        )
         
         response_data = {
             'status': 'success',
             'conversation_id': conversation.id,
             'response': result['response'],
             'references': result.get('references', []),
-            'metadata': metadata  # Include metadata for frontend
+            'metadata': dict(metadata, timings=timings)  # Include metadata for frontend
         }
         
         # Add treatment plan data if available
@@ -240,6 +260,44 @@ def chat():
             'status': 'error',
             'message': str(e)
         }), 500
+    finally:
+        recorder.stop()
+
+
+@ai_bp.route('/routing-stats', methods=['GET'])
+@login_required
+def get_routing_stats():
+    """Per-tier latency, token and cost accounting of the model router"""
+    from app.services import ai_service
+    
+    if ai_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'AI service not initialized'
+        }), 500
+    
+    return jsonify({
+        'status': 'success',
+        'tiers': ai_service.model_router.get_stats()
+    })
+
+
+@ai_bp.route('/latency-stats', methods=['GET'])
+@login_required
+def get_latency_stats():
+    """Rolling per-stage latency histogram of recent chat turns"""
+    from app.services import ai_service
+    
+    if ai_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'AI service not initialized'
+        }), 500
+    
+    return jsonify({
+        'status': 'success',
+        **ai_service.latency_stats.get_stats()
+    })
 
 
 @ai_bp.route('/search', methods=['POST'])
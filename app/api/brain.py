@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 import logging
 
@@ -33,7 +33,8 @@ def start_analysis():
         }), 500
     
     try:
-        result = brain_service.start_analysis()
+        data = request.get_json(silent=True) or {}
+        result = brain_service.start_analysis(full=bool(data.get('full', False)), user_id=current_user.id)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error starting analysis: {e}")
@@ -64,6 +65,73 @@ def get_analysis_progress(analysis_id):
             'message': str(e)
         }), 500
 
+@brain_bp.route('/analysis-stream/<analysis_id>', methods=['GET'])
+@login_required
+def stream_analysis(analysis_id):
+    """Push analysis progress, thoughts and rules as server-sent events"""
+    from app.services import brain_service
+    
+    if brain_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Brain service not initialized'
+        }), 500
+    
+    # EventSource sends the last received id when it reconnects
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    return Response(
+        stream_with_context(brain_service.stream_analysis_events(analysis_id, cursor)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@brain_bp.route('/resume-analysis/<analysis_id>', methods=['POST'])
+@login_required
+def resume_analysis(analysis_id):
+    """Resume a failed, interrupted or cancelled analysis from its last checkpoint"""
+    from app.services import brain_service
+    
+    if brain_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Brain service not initialized'
+        }), 500
+    
+    try:
+        result = brain_service.resume_analysis(analysis_id)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error resuming analysis: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@brain_bp.route('/cancel-analysis/<analysis_id>', methods=['POST'])
+@login_required
+def cancel_analysis(analysis_id):
+    """Cancel a running analysis"""
+    from app.services import brain_service
+    
+    if brain_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Brain service not initialized'
+        }), 500
+    
+    try:
+        result = brain_service.cancel_analysis(analysis_id)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error cancelling analysis: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @brain_bp.route('/check-analysis', methods=['GET'])
 @login_required
 def check_saved_analysis():
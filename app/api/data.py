@@ -1,8 +1,10 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from flask_login import login_required
 import os
 import json
+import hashlib
 import logging
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +48,7 @@ def get_categories():
 @data_bp.route('/items/<category>', methods=['GET'])
 @login_required
 def get_category_items(category):
-    """Get all items in a category"""
+    """Get a page of items in a category (cursor pagination, sort and field selection)"""
     from app.services import data_service
     
     try:
@@ -55,12 +57,32 @@ def get_category_items(category):
                 'status': 'error',
                 'message': 'Data service not initialized'
             }), 500
-            
-        items = data_service.get_items_by_category(category)
-        return jsonify({
+        
+        sort = request.args.get('sort', 'id')
+        cursor = request.args.get('cursor')
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        fields = _requested_fields()
+        
+        page = data_service.list_items(category, sort=sort, cursor=cursor, limit=limit, fields=fields)
+        
+        # The catalog version changes with any item of the category
+        etag = _etag(page['version'], sort, cursor, limit, fields)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+        
+        response = jsonify({
             'status': 'success',
-            'items': items
+            'items': page['items'],
+            'next_cursor': page['next_cursor'],
+            'total': page['total']
         })
+        response.set_etag(etag)
+        return response
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -70,7 +92,7 @@ def get_category_items(category):
 @data_bp.route('/item/<category>/<item_id>', methods=['GET'])
 @login_required
 def get_item(category, item_id):
-    """Get a specific item"""
+    """Get a specific item (optionally only some of its fields)"""
     from app.services import data_service
     
     try:
@@ -79,24 +101,87 @@ def get_item(category, item_id):
                 'status': 'error',
                 'message': 'Data service not initialized'
             }), 500
+        
+        # Unchanged files are answered from their mtime and size, without reading them
+        version = data_service.item_version(category, item_id)
+        fields = _requested_fields()
+        etag = _etag(version, fields) if version else None
+        if etag and request.if_none_match.contains(etag):
+            return _not_modified(etag)
             
         item = data_service.get_item(category, item_id)
         if item:
-            return jsonify({
+            if fields:
+                item = {key: value for key, value in item.items() if key in fields or key == '_metadata'}
+            response = jsonify({
                 'status': 'success',
                 'item': item
             })
+            if etag:
+                response.set_etag(etag)
+            return response
         else:
             return jsonify({
                 'status': 'error',
                 'message': 'Item not found'
             }), 404
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+def _requested_fields():
+    """Field names of the fields= query parameter, None for all fields"""
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    return fields or None
+
+def _etag(version, *params) -> str:
+    """ETag of a response built from a data version and the request parameters shaping it"""
+    payload = json.dumps([version, *params], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+def _not_modified(etag: str):
+    """Empty 304 response for a client that already has this version"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def _notify_index(category: str, item_id: str, op: str) -> Dict:
+    """Report a data change to the index worker; response fields with its generation (None if it won't be indexed)"""
+    from app.services import data_service, index_worker
+    if data_service is not None and not data_service.storage.feeds_knowledge_base:
+        return {
+            'index_generation': None,
+            'index_warning': f"{data_service.storage.name} storage is not indexed: "
+                             f"export the items to the file tree to make them searchable"
+        }
+    if index_worker is None:
+        return {'index_generation': None}
+    return {'index_generation': index_worker.notify(category, item_id, op)}
+
+@data_bp.route('/index-status', methods=['GET'])
+@login_required
+def get_index_status():
+    """Pending and applied generations of the background index updates"""
+    from app.services import index_worker
+    
+    if index_worker is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Index worker not initialized'
+        }), 500
+    
+    return jsonify({
+        'status': 'success',
+        **index_worker.status()
+    })
+
 @data_bp.route('/item/<category>/<item_id>', methods=['PUT'])
 @login_required
 def update_item(category, item_id):
@@ -114,14 +199,13 @@ def update_item(category, item_id):
         success = data_service.update_item(category, item_id, data)
         
         if success:
-            # Trigger reindexing for RAG
-            from app.services import rag_service
-            if rag_service:
-                rag_service.reindex_all()
+            # Queue the change for the background index update
+            index_fields = _notify_index(category, item_id, 'update')
             
             return jsonify({
                 'status': 'success',
-                'message': 'Item updated successfully'
+                'message': 'Item updated successfully',
+                **index_fields
             })
         else:
             return jsonify({
@@ -151,15 +235,14 @@ def create_item(category):
         item_id = data_service.create_item(category, data)
         
         if item_id:
-            # Trigger reindexing for RAG
-            from app.services import rag_service
-            if rag_service:
-                rag_service.reindex_all()
+            # Queue the change for the background index update
+            index_fields = _notify_index(category, item_id, 'create')
             
             return jsonify({
                 'status': 'success',
                 'item_id': item_id,
-                'message': 'Item created successfully'
+                'message': 'Item created successfully',
+                **index_fields
             })
         else:
             return jsonify({
@@ -188,14 +271,13 @@ def delete_item(category, item_id):
         success = data_service.delete_item(category, item_id)
         
         if success:
-            # Trigger reindexing for RAG
-            from app.services import rag_service
-            if rag_service:
-                rag_service.reindex_all()
+            # Queue the change for the background index update
+            index_fields = _notify_index(category, item_id, 'delete')
             
             return jsonify({
                 'status': 'success',
-                'message': 'Item deleted successfully'
+                'message': 'Item deleted successfully',
+                **index_fields
             })
         else:
             return jsonify({
@@ -223,12 +305,72 @@ def search_items():
             
         query = request.args.get('q', '')
         category = request.args.get('category', None)
+        page = request.args.get('page', 1, type=int)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        results = data_service.search_items(query, category, page=page, per_page=per_page)
+        
+        return jsonify({
+            'status': 'success',
+            **results
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@data_bp.route('/export', methods=['GET'])
+@login_required
+def export_items():
+    """Stream items as NDJSON (all categories, or those given with ?category=)"""
+    from app.services import data_service
+    
+    if data_service is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Data service not initialized'
+        }), 500
+    
+    try:
+        lines = data_service.export_ndjson(request.args.getlist('category') or None)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    return current_app.response_class(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="dental_data.ndjson"'}
+    )
+
+@data_bp.route('/import', methods=['POST'])
+@login_required
+def import_items():
+    """Create or replace items from an NDJSON body, then update the index once"""
+    from app.services import data_service
+    
+    try:
+        if data_service is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Data service not initialized'
+            }), 500
         
-        results = data_service.search_items(query, category)
+        # Read line by line: the body is never held in memory
+        report = data_service.import_ndjson(request.stream)
+        
+        # One event per category; the worker applies them in a single batch
+        index_fields = {'index_generation': None}
+        for category in report['imported']:
+            index_fields = _notify_index(category, None, 'import')
         
         return jsonify({
             'status': 'success',
-            'results': results
+            **report,
+            **index_fields
         })
     except Exception as e:
         return jsonify({
@@ -306,30 +448,14 @@ def save_approved_sequence():
                 except Exception as e:
                     logger.error(f"Error updating conversation: {e}")
             
-            # Update knowledge base and trigger reindexing for RAG if this is a high-quality sequence
-            if rating >= 9:
-                try:
-                    # Update the comprehensive knowledge base
-                    import subprocess
-                    result = subprocess.run(
-                        ['python3', 'update_knowledge_base_with_approved.py'],
-                        capture_output=True,
-                        text=True,
-                        cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-                    )
-                    
-                    if result.returncode == 0:
-                        logger.info("Updated knowledge base with approved sequence")
-                        
-                        # Trigger reindexing
-                        from app.services import rag_service
-                        if rag_service:
-                            rag_service.reindex_all()
-                            logger.info("Triggered RAG reindexing")
-                    else:
-                        logger.error(f"Failed to update knowledge base: {result.stderr}")
-                except Exception as e:
-                    logger.error(f"Error updating knowledge base: {e}")
+            # Add high-quality sequences to the knowledge base and the RAG index
+            from app.services.knowledge_base import is_rag_approved
+            if is_rag_approved(approved_data):
+                from app.services import rag_service
+                if rag_service:
+                    result = rag_service.ingest_approved_sequence(approved_data, f"{item_id}.json")
+                    if not result['success']:
+                        logger.error(f"Failed to update knowledge base: {result['message']}")
             
             return jsonify({
                 'status': 'success',
@@ -235,6 +235,7 @@ def get_settings():
             'knowledgeCount': 2,
             'reasoningMode': 'adaptive',
             'aiModel': 'gpt-4o',
+            'modelRouting': 'auto',
             'showSimilarityScores': True,
             'explainReasoning': True,
             'autoExpandTreatment': True,
@@ -266,7 +267,7 @@ def update_settings():
         allowed_keys = {
             'ragPreference', 'similarityThreshold', 'clinicalCasesCount',
             'idealSequencesCount', 'knowledgeCount', 'reasoningMode',
-            'aiModel', 'showSimilarityScores', 'explainReasoning', 
+            'aiModel', 'modelRouting', 'showSimilarityScores', 'explainReasoning', 
             'autoExpandTreatment', 'compactView'
         }
         
@@ -297,6 +298,11 @@ def update_settings():
             if filtered_settings['aiModel'] not in ['gpt-4o', 'o4-mini']:
                 filtered_settings['aiModel'] = 'gpt-4o'
         
+        if 'modelRouting' in filtered_settings:
+            from app.services.model_router import ROUTING_MODES
+            if filtered_settings['modelRouting'] not in ROUTING_MODES:
+                filtered_settings['modelRouting'] = 'auto'
+        
         # Update user settings
         current_settings = current_user.settings or {}
         current_settings.update(filtered_settings)
@@ -15,6 +15,16 @@ class Config:
     SQLALCHEMY_DATABASE_URI = DATABASE_URL if DATABASE_URL else 'sqlite:///' + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'dental_app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Storage of DATA categories: 'files' (one JSON file per item) or 'sqlite'.
+    # 'sqlite' is storage only: the RAG index and the brain read the file tree,
+    # so its edits are not searchable until exported (DataService.export_file_tree)
+    DATA_STORAGE_BACKEND = os.environ.get('DATA_STORAGE_BACKEND', 'files')
+    DATA_STORAGE_PATH = os.environ.get('DATA_STORAGE_PATH')  # SQLite file, default DATA/data_store.sqlite3
+    
+    # Hot-reload of the knowledge base when source files change (one watching process per deployment)
+    DATA_WATCHER_ENABLED = os.environ.get('DATA_WATCHER_ENABLED', 'False').lower() == 'true'
+    DATA_WATCH_INTERVAL = float(os.environ.get('DATA_WATCH_INTERVAL', '5'))
+    
     # Application settings
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     TESTING = os.environ.get('TESTING', 'False').lower() == 'true'
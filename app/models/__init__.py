@@ -2,7 +2,8 @@ from app.models.user import User, Conversation, Message
 from app.models.evaluation import (EvaluationTestCase, GeneratedSequence, 
                                    ManualEvaluation, AutomaticEvaluation, 
                                    EvaluationMetrics)
+from app.models.brain import BrainAnalysisJob, BrainRunnerLease
 
 __all__ = ['User', 'Conversation', 'Message', 'EvaluationTestCase', 
            'GeneratedSequence', 'ManualEvaluation', 'AutomaticEvaluation', 
-           'EvaluationMetrics']
\ No newline at end of file
+           'EvaluationMetrics', 'BrainAnalysisJob', 'BrainRunnerLease']
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Brain analysis models: durable job state shared by every worker
+"""
+from app import db
+from datetime import datetime, timedelta
+from sqlalchemy import Index, or_
+
+
+class BrainAnalysisJob(db.Model):
+    """A multi-agent analysis run, readable from any worker"""
+    __tablename__ = 'brain_analysis_jobs'
+
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    status = db.Column(db.String(20), nullable=False, default='pending')  # running, cancelling, complete, error, interrupted, cancelled
+    full = db.Column(db.Boolean, default=False)  # Full rebuild instead of incremental
+
+    # Progress
+    progress_percentage = db.Column(db.Integer, default=0)
+    stage = db.Column(db.String(200))
+    thoughts = db.Column(db.JSON, default=list)
+    new_rules = db.Column(db.JSON, default=list)
+    partial_results = db.Column(db.JSON, default=dict)  # Stage outputs of the run so far
+    error = db.Column(db.Text)
+
+    # Runner
+    runner_id = db.Column(db.String(120))
+    heartbeat_at = db.Column(db.DateTime)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_brain_job_status', 'status'),
+        Index('idx_brain_job_created', 'created_at'),
+    )
+
+    def is_stale(self, timeout_seconds: int) -> bool:
+        """A running job whose runner stopped sending heartbeats"""
+        if self.status not in ('running', 'cancelling') or not self.heartbeat_at:
+            return False
+        return datetime.utcnow() - self.heartbeat_at > timedelta(seconds=timeout_seconds)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'full': self.full,
+            'progress': {
+                'percentage': self.progress_percentage or 0,
+                'stage': self.stage or ''
+            },
+            'thought_count': len(self.thoughts or []),
+            'rule_count': len(self.new_rules or []),
+            'error': self.error,
+            'runner_id': self.runner_id,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class BrainRunnerLease(db.Model):
+    """Cluster-wide lease: at most one worker runs an analysis at a time"""
+    __tablename__ = 'brain_runner_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120))
+    job_id = db.Column(db.String(36))
+    expires_at = db.Column(db.DateTime)
+
+    @classmethod
+    def acquire(cls, name: str, holder: str, job_id: str, ttl_seconds: int) -> bool:
+        """Take the lease if it is free or expired (single conditional UPDATE)"""
+        now = datetime.utcnow()
+
+        if cls.query.get(name) is None:
+            try:
+                db.session.add(cls(name=name))
+                db.session.commit()
+            except Exception:
+                # Another worker created the row first
+                db.session.rollback()
+
+        updated = cls.query.filter(
+            cls.name == name,
+            or_(cls.holder.is_(None), cls.expires_at < now)
+        ).update({
+            'holder': holder,
+            'job_id': job_id,
+            'expires_at': now + timedelta(seconds=ttl_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        return updated == 1
+
+    @classmethod
+    def renew(cls, name: str, holder: str, ttl_seconds: int) -> bool:
+        """Extend the lease; False if it was lost to another worker"""
+        updated = cls.query.filter_by(name=name, holder=holder).update({
+            'expires_at': datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        return updated == 1
+
+    @classmethod
+    def release(cls, name: str, holder: str):
+        """Give the lease back if we still hold it"""
+        cls.query.filter_by(name=name, holder=holder).update({
+            'holder': None,
+            'job_id': None,
+            'expires_at': None
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @classmethod
+    def current_job_id(cls, name: str):
+        """Job of the active (unexpired) lease, if any"""
+        lease = cls.query.get(name)
+        if lease and lease.holder and lease.expires_at and lease.expires_at >= datetime.utcnow():
+            return lease.job_id
+        return None
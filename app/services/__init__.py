@@ -3,6 +3,9 @@ from app.services.enhanced_rag_service import EnhancedRAGService
 from app.services.data_service import DataService
 from app.services.brain_service import BrainService
 from app.services.evaluation_service import EvaluationService
+from app.services.index_maintenance import IndexMaintenanceWorker
+from app.services.data_watcher import DataWatcher
+from app.services.knowledge_base import apply_data_events, load_abbreviation_table
 import os
 
 # Service instances
@@ -11,10 +14,12 @@ rag_service = None
 data_service = None
 brain_service = None
 evaluation_service = None
+index_worker = None
+data_watcher = None
 
 def init_services(app):
     """Initialize AI services with app context"""
-    global ai_service, rag_service, data_service, brain_service, evaluation_service
+    global ai_service, rag_service, data_service, brain_service, evaluation_service, index_worker, data_watcher
     
     app.logger.info("Starting services initialization...")
     
@@ -25,15 +30,24 @@ def init_services(app):
         rag_service.initialize()
         app.logger.info("RAG service initialized successfully")
         
+        # app.root_path points to the 'app' directory, so we need to go up one level to reach DATA
+        app.logger.info(f"App root path: {app.root_path}")
+        data_dir = os.path.abspath(os.path.join(app.root_path, '..', 'DATA'))
+        
+        def apply_index_events(events):
+            # Regenerate the knowledge base entries of the edited items, then index them
+            apply_data_events(events, data_dir, load_abbreviation_table())
+            return rag_service.sync_index()
+        
+        # Data edits are applied to the RAG index in the background, in debounced batches
+        index_worker = IndexMaintenanceWorker(apply_index_events)
+        
         # Initialize AI service with RAG
         app.logger.info("Initializing AI service...")
         ai_service = AIService(rag_service)
         app.logger.info("AI service initialized successfully")
         
         # Initialize data service
-        # app.root_path points to the 'app' directory, so we need to go up one level to reach DATA
-        app.logger.info(f"App root path: {app.root_path}")
-        data_dir = os.path.abspath(os.path.join(app.root_path, '..', 'DATA'))
         app.logger.info(f"Looking for DATA directory at: {data_dir}")
         
         if not os.path.exists(data_dir):
@@ -43,8 +57,13 @@ def init_services(app):
             data_service = None
         else:
             try:
-                data_service = DataService(data_dir)
-                app.logger.info(f"DataService initialized successfully with data_dir: {data_dir}")
+                data_service = DataService(
+                    data_dir,
+                    backend=app.config.get('DATA_STORAGE_BACKEND', 'files'),
+                    database_path=app.config.get('DATA_STORAGE_PATH')
+                )
+                app.logger.info(f"DataService initialized successfully with data_dir: {data_dir} "
+                                f"({data_service.storage.name} storage)")
                 # Log available categories
                 categories = data_service.get_categories()
                 app.logger.info(f"Available data categories: {[cat['key'] for cat in categories]}")
@@ -53,6 +72,13 @@ def init_services(app):
                 app.logger.exception("DataService initialization error:")
                 data_service = None
         
+        # Optional hot-reload of knowledge base source files
+        if app.config.get('DATA_WATCHER_ENABLED') and os.path.exists(data_dir):
+            data_watcher = DataWatcher(data_dir, notify=index_worker.notify,
+                                       interval=app.config.get('DATA_WATCH_INTERVAL', 5.0))
+            data_watcher.start()
+            app.logger.info("Data watcher started")
+        
         # Initialize Brain service (simplified - no dependencies)
         app.logger.info("Initializing Brain service...")
         brain_service = BrainService()
@@ -72,6 +98,7 @@ def init_services(app):
 
 __all__ = [
     'AIService', 'EnhancedRAGService', 'DataService', 'BrainService', 'EvaluationService',
-    'init_services',
-    'ai_service', 'rag_service', 'data_service', 'brain_service', 'evaluation_service'
+    'IndexMaintenanceWorker', 'DataWatcher', 'init_services',
+    'ai_service', 'rag_service', 'data_service', 'brain_service', 'evaluation_service', 'index_worker',
+    'data_watcher'
 ]
\ No newline at end of file
@@ -1,9 +1,19 @@
 import os
+import copy
+import hashlib
+import json
+import time
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from openai import OpenAI
 from app.services.enhanced_rag_service import EnhancedRAGService
+from app.services.single_flight import SingleFlight
+from app.services.chat_history import ConversationHistoryStore
+from app.services.model_router import ModelRouter, estimate_tokens
+from app.services.telemetry import LatencyHistogram, span, record_span
+from app.services.plan_stream_parser import IncrementalPlanParser, PlanStreamError, TREATMENT_PLAN_SCHEMA
+from app.services.knowledge_base import parse_delay_days, render_appointment_line
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,6 +21,18 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Models that support JSON mode with streaming
+STRUCTURED_OUTPUT_MODELS = {'gpt-4o', 'gpt-4o-mini'}
+STRUCTURED_PLAN_ATTEMPTS = 2
+
+STRUCTURED_PLAN_INSTRUCTIONS = (
+    "FORMAT DE RÉPONSE (prioritaire sur les instructions de format ci-dessus): "
+    "répondez UNIQUEMENT avec un objet JSON, sans marqueur ni texte autour, conforme à ce schéma:\n"
+    + json.dumps(TREATMENT_PLAN_SCHEMA, ensure_ascii=False) +
+    "\nLe champ 'reasoning' contient votre explication clinique (texte qui aurait précédé le JSON). "
+    "Les rendez-vous de 'treatment_sequence' sont écrits dans l'ordre."
+)
+
 class SpecializedLLM:
     """Specialized LLM instance for each tab with focused context and prompts"""
     
@@ -18,7 +40,6 @@ class SpecializedLLM:
         self.tab_name = tab_name
         self.base_system_prompt = system_prompt
         self.rag_service = rag_service
-        self.chat_history = []
         
     def get_specialized_context(self, user_message: str, settings: Dict) -> Tuple[Dict, str]:
         """Get context specifically relevant to dental brain using enhanced RAG"""
@@ -41,11 +62,12 @@ class SpecializedLLM:
             min_confidence = settings.get('minRuleConfidence', 70)
             rule_count = settings.get('discoveredRulesCount', 3)
             logger.info(f"🔍 Searching for discovered rules: enabled=True, min_confidence={min_confidence}, count={rule_count}")
-            discovered_rules = self.rag_service.search_discovered_rules(
-                user_message,
-                n_results=rule_count,
-                confidence_threshold=min_confidence
-            )
+            with span('rules'):
+                discovered_rules = self.rag_service.search_discovered_rules(
+                    user_message,
+                    n_results=rule_count,
+                    confidence_threshold=min_confidence
+                )
             logger.info(f"✅ Found {len(discovered_rules)} discovered rules")
             for rule in discovered_rules:
                 logger.info(f"  - Rule: {rule.get('title', 'Unknown')} (confidence: {rule.get('confidence', 0)}%, similarity: {rule.get('similarity_score', 0):.2f})")
@@ -284,19 +306,11 @@ class SpecializedLLM:
                             context_parts.append(f"RÉSUMÉ: {total_rdv} RDV sur {duration_weeks}")
                             context_parts.append("SÉQUENCE STRUCTURÉE:")
                             
-                            for appt in appointments:
-                                rdv_num = appt['rdv']
-                                treatment = appt.get('traitement_expanded', appt.get('traitement', ''))
-                                duration = appt.get('duree', '')
-                                delay = appt.get('delai', '')
-                                
-                                # Format appointment concisely
-                                appt_line = f"  RDV {rdv_num}: {treatment}"
-                                if duration:
-                                    appt_line += f" ({duration})"
-                                if delay:
-                                    appt_line += f" → attendre {delay}"
-                                context_parts.append(appt_line)
+                            # Lines rendered by the knowledge base build, if it ran
+                            context_parts.extend(
+                                seq['enhanced_data'].get('context_lines')
+                                or [render_appointment_line(appt) for appt in appointments]
+                            )
                 
                 # Present high relevance sequences
                 elif high_relevance:
@@ -356,16 +370,10 @@ class SpecializedLLM:
         total_days = 0
         
         for appt in appointments:
-            delay = appt.get('delai', '')
-            if 'sem' in delay:
-                weeks = int(''.join(filter(str.isdigit, delay)) or 1)
-                total_days += weeks * 7
-            elif 'mois' in delay:
-                months = int(''.join(filter(str.isdigit, delay)) or 1)
-                total_days += months * 30
-            elif 'jour' in delay or 'j' in delay:
-                days = int(''.join(filter(str.isdigit, delay)) or 1)
-                total_days += days
+            days = appt.get('delai_days')
+            if days is None:
+                days = parse_delay_days(appt.get('delai', ''))
+            total_days += days or 0
         
         if total_days <= 14:
             return f"{total_days} jours"
@@ -374,17 +382,17 @@ class SpecializedLLM:
         else:
             return f"{total_days // 30} mois"
     
-    def format_prompt(self, user_message: str, context: str) -> str:
-        """Format the complete prompt with context"""
+    def format_prompt(self, user_message: str, context: str, history: List[Dict] = None) -> str:
+        """Format the complete prompt with context and the conversation's recent history"""
         prompt_parts = [self.base_system_prompt]
         
         if context:
             prompt_parts.append(f"\n\n--- CONTEXTE SPÉCIFIQUE ---\n{context}")
         
         # Add recent chat history for context
-        if self.chat_history:
+        if history:
             prompt_parts.append("\n\n--- HISTORIQUE RÉCENT ---")
-            for h in self.chat_history[-3:]:  # Last 3 exchanges
+            for h in history[-3:]:  # Last 3 exchanges
                 prompt_parts.append(f"User: {h['user']}")
                 prompt_parts.append(f"Assistant: {h['assistant']}")
         
@@ -397,6 +405,13 @@ class AIService:
         self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
         self.rag_service = rag_service
         self.specialized_llms = self._initialize_specialized_llms()
+        # Deduplicates identical chat turns submitted concurrently (double-clicks, retries)
+        self.inflight_requests = SingleFlight()
+        # Per-conversation history loaded from Message rows (shared by all workers)
+        self.history_store = ConversationHistoryStore(max_turns=3)
+        # Chooses a model tier / token budget per request and accounts cost per tier
+        self.model_router = ModelRouter()
+        self.latency_stats = LatencyHistogram()
     
     def _initialize_specialized_llms(self) -> Dict[str, SpecializedLLM]:
         """Initialize specialized LLM for dental brain"""
@@ -516,6 +531,12 @@ IMPORTANT:
     def get_completion(self, messages: List[Dict], tab_name: str = None, 
                       temperature: float = 0.7, max_tokens: int = 2000, model: str = None) -> str:
         """Get completion from OpenAI"""
+        response = self._create_completion(messages, temperature=temperature, max_tokens=max_tokens, model=model)
+        return response.choices[0].message.content
+    
+    def _create_completion(self, messages: List[Dict], temperature: float = 0.7,
+                           max_tokens: int = 2000, model: str = None, **kwargs):
+        """Call the chat completions API with model-specific parameters and return the raw response"""
         try:
             # Use provided model or default to gpt-4o
             selected_model = model or "gpt-4o"
@@ -526,7 +547,8 @@ IMPORTANT:
                 # O1 models don't support temperature or max_tokens parameters
                 response = self.client.chat.completions.create(
                     model=selected_model,
-                    messages=messages
+                    messages=messages,
+                    **kwargs
                 )
             elif selected_model == "o4-mini":
                 # Try O4 model - it might be similar to O1
@@ -534,7 +556,8 @@ IMPORTANT:
                     # First try without parameters
                     response = self.client.chat.completions.create(
                         model=selected_model,
-                        messages=messages
+                        messages=messages,
+                        **kwargs
                     )
                 except Exception as e:
                     # If that fails, try with max_tokens
@@ -542,7 +565,8 @@ IMPORTANT:
                     response = self.client.chat.completions.create(
                         model=selected_model,
                         messages=messages,
-                        max_tokens=max_tokens
+                        max_tokens=max_tokens,
+                        **kwargs
                     )
             else:
                 # Standard GPT-4 models
@@ -550,9 +574,10 @@ IMPORTANT:
                     model=selected_model,
                     messages=messages,
                     temperature=temperature,
-                    max_tokens=max_tokens
+                    max_tokens=max_tokens,
+                    **kwargs
                 )
-            return response.choices[0].message.content
+            return response
         except Exception as e:
             logger.error(f"Error getting AI completion with model {model}: {str(e)}")
             raise
@@ -679,8 +704,7 @@ IMPORTANT:
 
     def _parse_treatment_response(self, response: str) -> Dict:
         """Parse treatment planning response and extract reasoning and JSON"""
-        import json
-        import re
+        decoder = json.JSONDecoder()
         
         logger.debug(f"Parsing treatment response: {response[:200]}...")
         
@@ -710,17 +734,14 @@ IMPORTANT:
             logger.debug(f"Found reasoning text: {reasoning_text[:200]}...")
             logger.debug(f"Found JSON part: {json_part[:200]}...")
             
-            # Try to extract JSON from the second part
-            # First, clean up any leading/trailing whitespace and newlines
-            json_part = json_part.strip()
-            json_match = re.search(r'\{.*\}', json_part, re.DOTALL)
-            if json_match:
+            # Decode the first JSON object after the marker in a single pass
+            json_start = json_part.find('{')
+            if json_start != -1:
                 try:
-                    json_text = json_match.group()
-                    treatment_plan = json.loads(json_text)
+                    treatment_plan, _ = decoder.raw_decode(json_part, json_start)
                     
                     # Validate treatment plan structure
-                    if 'treatment_sequence' in treatment_plan and isinstance(treatment_plan['treatment_sequence'], list):
+                    if isinstance(treatment_plan, dict) and isinstance(treatment_plan.get('treatment_sequence'), list):
                         logger.info(f"Valid treatment plan found with {len(treatment_plan['treatment_sequence'])} appointments")
                         return {
                             'treatment_plan': treatment_plan,
@@ -732,46 +753,33 @@ IMPORTANT:
                         
                 except json.JSONDecodeError as e:
                     logger.error(f"JSON parsing error: {e}")
-                    logger.error(f"Failed JSON text: {json_match.group()[:500]}")
+                    logger.error(f"Failed JSON text: {json_part[json_start:json_start + 500]}")
         else:
             # Fallback to old method if no marker found
             logger.warning("No TREATMENT_PLAN_JSON marker found in any format, trying legacy parsing")
             
-            # Try to find JSON that looks like a treatment plan
-            json_matches = re.finditer(r'\{[^{}]*"treatment_sequence"[^{}]*\}', response, re.DOTALL)
-            
-            for json_match in json_matches:
-                try:
-                    # Expand the match to get the full JSON object
-                    start = json_match.start()
-                    # Find the matching closing brace
-                    brace_count = 0
-                    end = start
-                    for i, char in enumerate(response[start:], start):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end = i + 1
-                                break
-                    
-                    json_text = response[start:end]
-                    treatment_plan = json.loads(json_text)
-                    
-                    if 'treatment_sequence' in treatment_plan and isinstance(treatment_plan['treatment_sequence'], list):
-                        logger.info(f"Valid treatment plan found with {len(treatment_plan['treatment_sequence'])} appointments (legacy)")
-                        # Extract any text before JSON as reasoning
-                        reasoning_text = response[:start].strip()
+            # Decode from the opening brace of the object that owns a "treatment_sequence" key
+            key_position = response.find('"treatment_sequence"')
+            while key_position != -1:
+                start = response.rfind('{', 0, key_position)
+                if start != -1:
+                    try:
+                        treatment_plan, _ = decoder.raw_decode(response, start)
                         
-                        return {
-                            'treatment_plan': treatment_plan,
-                            'is_treatment_plan': True,
-                            'reasoning': reasoning_text
-                        }
-                except (json.JSONDecodeError, Exception) as e:
-                    logger.debug(f"Failed to parse potential treatment plan: {e}")
-                    continue
+                        if isinstance(treatment_plan, dict) and isinstance(treatment_plan.get('treatment_sequence'), list):
+                            logger.info(f"Valid treatment plan found with {len(treatment_plan['treatment_sequence'])} appointments (legacy)")
+                            # Extract any text before JSON as reasoning
+                            reasoning_text = response[:start].strip()
+                            
+                            return {
+                                'treatment_plan': treatment_plan,
+                                'is_treatment_plan': True,
+                                'reasoning': reasoning_text
+                            }
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"Failed to parse potential treatment plan: {e}")
+                
+                key_position = response.find('"treatment_sequence"', key_position + 1)
         
         return {
             'response': response,
@@ -837,7 +845,8 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
                 'references': []
             }
     
-    def process_chat_message(self, message: str, tab_name: str, settings: Dict = None, action: str = None, current_treatment_plan: Dict = None) -> Dict:
+    def process_chat_message(self, message: str, tab_name: str, settings: Dict = None, action: str = None,
+                             current_treatment_plan: Dict = None, conversation_id: int = None) -> Dict:
         """Process a chat message with specialized context"""
         if tab_name not in self.specialized_llms:
             return {
@@ -848,6 +857,41 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
         if settings is None:
             settings = {}
         
+        history = self.history_store.get_history(conversation_id)
+        
+        # Identical requests already in flight share one RAG + LLM execution
+        request_key = self._request_key(message, tab_name, settings, action, current_treatment_plan, history)
+        result, shared = self.inflight_requests.do(
+            request_key,
+            lambda: self._process_chat_message(message, tab_name, settings, action, current_treatment_plan, history)
+        )
+        
+        if shared:
+            # Every waiter gets its own copy so callers can't mutate each other's result
+            logger.info(f"Coalesced duplicate chat request: {message[:50]}")
+            result = copy.deepcopy(result)
+        
+        return result
+    
+    def _request_key(self, message: str, tab_name: str, settings: Dict, action: str = None,
+                     current_treatment_plan: Dict = None, history: List[Dict] = None) -> str:
+        """Build the coalescing key from the message, settings hash, current plan hash and history"""
+        def _hash(value) -> str:
+            payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+            return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        
+        return _hash({
+            'tab': tab_name,
+            'action': action,
+            'message': message.strip(),
+            'settings': _hash(settings),
+            'plan': _hash(current_treatment_plan) if current_treatment_plan else None,
+            'history': _hash(history) if history else None
+        })
+    
+    def _process_chat_message(self, message: str, tab_name: str, settings: Dict, action: str = None,
+                              current_treatment_plan: Dict = None, history: List[Dict] = None) -> Dict:
+        """Run RAG retrieval and the LLM call for a single chat turn"""
         llm = self.specialized_llms[tab_name]
         
         # Get specialized context
@@ -869,7 +913,9 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
             context += "4. Retourner le plan COMPLET modifié au format JSON habituel\n"
         
         # Format prompt
-        system_prompt = llm.format_prompt(message, context)
+        with span('prompt') as prompt_span:
+            system_prompt = llm.format_prompt(message, context, history)
+            prompt_span['chars'] = len(system_prompt)
         
         # Get AI response
         messages = [
@@ -877,28 +923,44 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
             {"role": "user", "content": message}
         ]
         
-        # Get model from settings, default to gpt-4o
-        model = settings.get('aiModel', 'gpt-4o')
-        response = self.get_completion(messages, tab_name, model=model)
+        # Route to a model tier based on the request kind and retrieval confidence
+        # Check if it's a new treatment plan request OR a modification of existing plan
+        is_new_plan = self._is_treatment_planning_request(message)
+        is_modification = bool(current_treatment_plan) and self._is_treatment_modification_request(message)
+        route = self.model_router.route(
+            settings, is_new_plan, is_modification,
+            ModelRouter.retrieval_confidence(rag_results)
+        )
+        logger.info(f"Model route: tier={route['tier']} model={route['model']} "
+                    f"max_tokens={route['max_tokens']} ({route['reason']})")
+        
+        is_planning = tab_name == 'dental-brain' and (is_new_plan or is_modification)
         
-        # Update chat history
-        llm.chat_history.append({
-            'user': message,
-            'assistant': response
-        })
+        # Plans are generated in JSON mode and validated while streaming when the model supports it;
+        # the free-form completion below is the fallback
+        parsed_response = None
+        if is_planning and route['model'] in STRUCTURED_OUTPUT_MODELS:
+            parsed_response = self._generate_structured_plan(messages, route)
         
-        # Keep history limited
-        if len(llm.chat_history) > 10:
-            llm.chat_history = llm.chat_history[-10:]
+        if parsed_response:
+            response = parsed_response['raw_response']
+        else:
+            response, finish_reason = self._complete_routed(messages, route)
+            # A cheaper tier ran out of tokens: answer again with the planning budget
+            escalation = self.model_router.escalate(route, settings) if finish_reason == 'length' else None
+            if escalation:
+                logger.warning(f"Truncated answer on tier '{route['tier']}', retrying on tier 'planning'")
+                route = escalation
+                response, _ = self._complete_routed(messages, route)
+        routing = {'tier': route['tier'], 'model': route['model'], 'max_tokens': route['max_tokens']}
         
         # Handle treatment planning responses specially
-        # Check if it's a new treatment plan request OR a modification of existing plan
-        is_new_plan = self._is_treatment_planning_request(message)
-        is_modification = current_treatment_plan and self._is_treatment_modification_request(message)
         
-        if tab_name == 'dental-brain' and (is_new_plan or is_modification):
+        if is_planning:
             logger.info(f"Treatment planning request detected: {message} (new={is_new_plan}, modification={is_modification})")
-            parsed_response = self._parse_treatment_response(response)
+            if not parsed_response:
+                with span('parse'):
+                    parsed_response = self._parse_treatment_response(response)
             logger.info(f"Treatment plan parsing result: is_treatment_plan={parsed_response.get('is_treatment_plan', False)}")
             logger.info(f"Full parsed response keys: {list(parsed_response.keys())}")
             if parsed_response.get('treatment_plan'):
@@ -914,7 +976,8 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
                     logger.info("Using AI's provided reasoning")
                 else:
                     # Fallback to generated explanation
-                    explanation = self._generate_treatment_explanation(parsed_response['treatment_plan'], rag_results, settings)
+                    with span('explanation'):
+                        explanation = self._generate_treatment_explanation(parsed_response['treatment_plan'], rag_results, settings)
                     response_text = explanation
                     logger.info("Using generated explanation (no AI reasoning found)")
             else:
@@ -925,14 +988,108 @@ IMPORTANT: Fournissez un protocole que même un jeune dentiste pourrait suivre a
                 'response': response_text,
                 'references': self._format_references(rag_results, settings),
                 'is_treatment_plan': parsed_response.get('is_treatment_plan', False),
-                'treatment_plan': parsed_response.get('treatment_plan', None)
+                'treatment_plan': parsed_response.get('treatment_plan', None),
+                'routing': routing
             }
         
         return {
             'response': response,
-            'references': self._format_references(rag_results, settings)
+            'references': self._format_references(rag_results, settings),
+            'routing': routing
         }
     
+    def _complete_routed(self, messages: List[Dict], route: Dict) -> Tuple[str, Optional[str]]:
+        """Run a completion for a routing decision and record its latency and token usage; content and finish reason"""
+        with span('llm', model=route['model']) as llm_span:
+            start_time = time.time()
+            response = self._create_completion(messages, max_tokens=route['max_tokens'], model=route['model'])
+            latency_ms = int((time.time() - start_time) * 1000)
+            
+            content = response.choices[0].message.content or ''
+            usage = getattr(response, 'usage', None)
+            if usage:
+                prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+            else:
+                prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+                completion_tokens = estimate_tokens(content)
+            llm_span.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        
+        self.model_router.record(route, latency_ms, prompt_tokens, completion_tokens)
+        return content, response.choices[0].finish_reason
+    
+    def _generate_structured_plan(self, messages: List[Dict], route: Dict,
+                                  max_attempts: int = STRUCTURED_PLAN_ATTEMPTS) -> Optional[Dict]:
+        """Stream a treatment plan in JSON mode, validating appointments as they arrive.
+        
+        A response that can no longer match the schema is abandoned as soon as it is
+        detected and retried. Returns None when no attempt produced a valid plan.
+        """
+        structured_messages = [
+            {"role": "system", "content": messages[0]['content'] + "\n\n" + STRUCTURED_PLAN_INSTRUCTIONS},
+            *messages[1:]
+        ]
+        prompt_tokens = sum(estimate_tokens(m['content']) for m in structured_messages)
+        
+        for attempt in range(1, max_attempts + 1):
+            parser = IncrementalPlanParser()
+            start_time = time.time()
+            stream = None
+            try:
+                stream = self._create_completion(
+                    structured_messages,
+                    temperature=0.3,
+                    max_tokens=route['max_tokens'],
+                    model=route['model'],
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    for appointment in parser.feed(chunk.choices[0].delta.content):
+                        logger.debug(f"Streamed RDV {appointment['rdv']}: {appointment['traitement']}")
+                with span('parse', streamed=True):
+                    plan = parser.finish()
+            except PlanStreamError as e:
+                logger.warning(f"⚠️ Structured plan attempt {attempt}/{max_attempts} rejected "
+                               f"after {len(parser.text)} chars: {e}")
+                self._close_stream(stream)
+                continue
+            except Exception as e:
+                logger.warning(f"Structured plan generation unavailable for {route['model']}, "
+                               f"falling back to free-form completion: {e}")
+                self._close_stream(stream)
+                return None
+            finally:
+                # Streaming responses don't report usage with this client, so estimate it
+                latency_ms = int((time.time() - start_time) * 1000)
+                completion_tokens = estimate_tokens(parser.text)
+                self.model_router.record(route, latency_ms, prompt_tokens, completion_tokens)
+                record_span('llm', latency_ms, model=route['model'], streamed=True,
+                            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            
+            reasoning = str(plan.pop('reasoning', '') or '').strip()
+            logger.info(f"✅ Structured plan with {len(plan['treatment_sequence'])} appointments (attempt {attempt})")
+            return {
+                'treatment_plan': plan,
+                'is_treatment_plan': True,
+                'reasoning': reasoning,
+                'raw_response': parser.text
+            }
+        
+        logger.error(f"No valid structured plan after {max_attempts} attempts")
+        return None
+    
+    @staticmethod
+    def _close_stream(stream):
+        """Release the HTTP connection of an abandoned streaming response"""
+        response = getattr(stream, 'response', None)
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+    
     def _format_references(self, rag_results: Dict, settings: Dict) -> List[Dict]:
         """Format enhanced RAG results as references with similarity scores"""
         references = []
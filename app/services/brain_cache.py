@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def content_hash(value) -> str:
+    """Stable hash of any JSON-serializable value"""
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chunk_key(chunk: Dict) -> str:
+    """Identity of a data chunk across runs"""
+    return f"{chunk['type']}:{chunk['name']}"
+
+
+class AnalysisCache:
+    """Manifest and agent result cache for incremental brain analyses.
+
+    - chunks: content hash of every data chunk seen by the last run
+    - scanner: patterns per scanner batch, keyed by the hash of its members
+    - analyzer: insights keyed by the hash of their inputs (patterns + evidence)
+
+    A scanner batch is reused while all of its member chunks are unchanged;
+    chunks that are new, changed, or belonged to an invalidated batch are
+    rescanned. Entries not used by a run are dropped when it is saved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.chunks: Dict[str, str] = {}
+        self.scanner: Dict[str, Dict] = {}
+        self.analyzer: Dict[str, Dict] = {}
+        self.current: Dict[str, str] = {}
+        self._used_batches = set()
+        self._used_insights = set()
+
+    def load(self) -> 'AnalysisCache':
+        """Read the cache file; a missing or incompatible file means a cold cache"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.chunks = data.get('chunks', {})
+                    self.scanner = data.get('scanner', {})
+                    self.analyzer = data.get('analyzer', {})
+                    logger.info(f"Loaded brain cache: {len(self.chunks)} chunks, "
+                                f"{len(self.scanner)} scanner batches, {len(self.analyzer)} insights")
+        except Exception as e:
+            logger.error(f"Error loading brain cache, starting cold: {e}")
+            self.chunks, self.scanner, self.analyzer = {}, {}, {}
+        return self
+
+    def begin_run(self, chunks: List[Dict]) -> Dict[str, List[str]]:
+        """Hash the chunks of this run; returns what was added, changed and removed since the last one"""
+        self.current = {chunk_key(chunk): content_hash(chunk['content']) for chunk in chunks}
+        hashes = self.current
+        return {
+            'added': [key for key in hashes if key not in self.chunks],
+            'changed': [key for key, value in hashes.items() if key in self.chunks and self.chunks[key] != value],
+            'removed': [key for key in self.chunks if key not in hashes]
+        }
+
+    def plan_scan(self, chunks: List[Dict], batch_size: int) -> Tuple[List[Dict], List[List[Dict]]]:
+        """Split chunks into cached patterns and batches that still need scanning.
+
+        Returns (cached_patterns, dirty_batches). Chunks are expected in a stable
+        order so dirty batches are reproducible.
+        """
+        hashes = self.current
+        covered = set()
+        cached_patterns = []
+
+        # Reuse valid batches in chunk order so the pattern list is stable
+        position = {chunk_key(chunk): index for index, chunk in enumerate(chunks)}
+        valid = [
+            (min(position[key] for key in entry['members']), batch_key)
+            for batch_key, entry in self.scanner.items()
+            if entry['members'] and all(hashes.get(key) == value for key, value in entry['members'].items())
+        ]
+        for _, batch_key in sorted(valid):
+            entry = self.scanner[batch_key]
+            covered.update(entry['members'])
+            cached_patterns.extend(entry['patterns'])
+            self._used_batches.add(batch_key)
+
+        dirty = [chunk for chunk in chunks if chunk_key(chunk) not in covered]
+        batches = [dirty[i:i + batch_size] for i in range(0, len(dirty), batch_size)]
+        return cached_patterns, batches
+
+    def batch_key(self, batch: List[Dict]) -> str:
+        """Hash of a batch's members and their content"""
+        return content_hash({chunk_key(chunk): self.current[chunk_key(chunk)] for chunk in batch})
+
+    def store_batch(self, batch: List[Dict], patterns: List[Dict]):
+        """Remember the patterns found in a scanned batch"""
+        members = {chunk_key(chunk): self.current[chunk_key(chunk)] for chunk in batch}
+        batch_key = self.batch_key(batch)
+        self.scanner[batch_key] = {'members': members, 'patterns': patterns}
+        self._used_batches.add(batch_key)
+
+    def insight_key(self, pattern_type: str, patterns: List[Dict], evidence: List[Dict]) -> str:
+        """Hash of everything the analyzer sees for a pattern type"""
+        return content_hash({
+            'pattern_type': pattern_type,
+            # Order-independent: the same patterns may arrive from batches in a different order
+            'patterns': sorted(content_hash(pattern) for pattern in patterns),
+            'evidence': sorted(self.current.get(chunk_key(chunk), '') for chunk in evidence)
+        })
+
+    def get_insight(self, key: str):
+        """Cached insight for these inputs, if any"""
+        insight = self.analyzer.get(key)
+        if insight is not None:
+            self._used_insights.add(key)
+        return insight
+
+    def store_insight(self, key: str, insight: Dict):
+        """Remember an analyzer insight"""
+        self.analyzer[key] = insight
+        self._used_insights.add(key)
+
+    def save(self, prune: bool = True):
+        """Persist the cache (atomic replace).
+
+        With prune, entries not used by this run are dropped; intermediate
+        saves between stages keep them.
+        """
+        self.chunks = dict(self.current)
+        if prune:
+            self.scanner = {key: value for key, value in self.scanner.items() if key in self._used_batches}
+            self.analyzer = {key: value for key, value in self.analyzer.items() if key in self._used_insights}
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': CACHE_VERSION,
+                    'updated_at': datetime.now().isoformat(),
+                    'chunks': self.chunks,
+                    'scanner': self.scanner,
+                    'analyzer': self.analyzer
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving brain cache: {e}")
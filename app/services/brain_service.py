@@ -2,129 +2,427 @@ import os
 import json
 import logging
 import threading
+import socket
 import uuid
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Iterator, Tuple
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import re
 from openai import OpenAI
 from dotenv import load_dotenv
-import time
+from app.services.rate_limiter import RateLimiter
+from app.services.model_router import estimate_tokens
+from app.services.brain_cache import AnalysisCache, content_hash
+from app.services.chunk_index import ChunkIndex
+from app.services.rule_store import RuleStore
+from app.services.prompt_packing import (
+    ANALYZER_EVIDENCE_BUDGET, ANALYZER_MAX_EVIDENCE, ANALYZER_PATTERN_BUDGET, VALIDATOR_CASE_BUDGET,
+    compact_json, pack_lines, rank_evidence, split_by_budget
+)
+from app.services.rule_dedup import EMBEDDING_MODEL, EmbeddingCache, deduplicate_rules
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Cluster-wide single runner
+ANALYSIS_LEASE = 'brain_analysis'
+LEASE_TTL_SECONDS = 60
+HEARTBEAT_INTERVAL_SECONDS = 10
+STALE_AFTER_SECONDS = 90
+CANCEL_CHECK_INTERVAL_SECONDS = 1
+SCANNER_BATCH_SIZE = 5
+RESUMABLE_STATUSES = ('error', 'interrupted', 'cancelled')
+FINISHED_STATUSES = ('complete', 'error', 'interrupted', 'cancelled')
+STREAM_POLL_INTERVAL_SECONDS = 0.5
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_MAX_SECONDS = 300  # Clients reconnect with their cursor after this
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside the runner when a cancel was requested for its job"""
+
+
 class BrainService:
     """Multi-Agent AI Brain Service for Deep Dental Knowledge Analysis"""
     
     def __init__(self):
         self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.analyses = {}  # Store ongoing analyses
-        self.discovered_rules = []  # Persistent rule storage
+        self.analyses = {}  # Runner-local state of analyses executed by this worker (jobs live in the database)
+        self.rule_store = RuleStore(  # Persistent rule storage, read lazily
+            os.path.join(os.path.dirname(__file__), '../../DATA/discovered_rules.jsonl'),
+            legacy_path=os.path.join(os.path.dirname(__file__), '../../DATA/discovered_rules.json')
+        )
         self.agent_memory = defaultdict(list)  # Memory for each agent
-        logger.info("Multi-agent Brain service initialized")
         
-        # Load saved rules if they exist
-        self._load_saved_rules()
+        # Agent batches run concurrently under a shared OpenAI rate budget
+        self.max_concurrency = max(1, int(os.getenv('BRAIN_MAX_CONCURRENCY', '4')))
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=int(os.getenv('BRAIN_RPM', '60')),
+            tokens_per_minute=int(os.getenv('BRAIN_TPM', '150000'))
+        )
         
-    def _load_saved_rules(self):
-        """Load previously discovered rules from storage"""
+        # Identity of this worker for the cluster-wide runner lease
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        logger.info(f"Multi-agent Brain service initialized (concurrency={self.max_concurrency})")
+    
+    @property
+    def discovered_rules(self) -> List[Dict]:
+        """Previously discovered rules (loaded on first access)"""
         try:
-            rules_file = os.path.join(os.path.dirname(__file__), '../../DATA/discovered_rules.json')
-            if os.path.exists(rules_file):
-                with open(rules_file, 'r', encoding='utf-8') as f:
-                    self.discovered_rules = json.load(f)
-                logger.info(f"Loaded {len(self.discovered_rules)} saved rules")
+            return self.rule_store.all()
         except Exception as e:
             logger.error(f"Error loading saved rules: {e}")
+            return []
             
-    def _save_rules(self):
-        """Save discovered rules to persistent storage"""
+    def _save_rules(self, rules: List[Dict]):
+        """Save discovered rules to persistent storage (appends only what changed)"""
         try:
-            rules_file = os.path.join(os.path.dirname(__file__), '../../DATA/discovered_rules.json')
-            os.makedirs(os.path.dirname(rules_file), exist_ok=True)
-            with open(rules_file, 'w', encoding='utf-8') as f:
-                json.dump(self.discovered_rules, f, ensure_ascii=False, indent=2)
-            logger.info(f"Saved {len(self.discovered_rules)} rules")
+            changes = self.rule_store.sync(rules)
+            logger.info(f"Saved {len(rules)} rules ({changes['put']} written, {changes['deleted']} removed)")
         except Exception as e:
             logger.error(f"Error saving rules: {e}")
     
-    def start_analysis(self) -> Dict:
-        """Start a new multi-agent analysis"""
+    def start_analysis(self, full: bool = False, user_id: int = None) -> Dict:
+        """Start a new multi-agent analysis (incremental unless full is set)"""
+        from app import db
+        from app.models import BrainAnalysisJob, BrainRunnerLease
+        
         analysis_id = str(uuid.uuid4())
         
-        self.analyses[analysis_id] = {
-            'id': analysis_id,
+        # Only one analysis runs cluster-wide
+        busy = self._acquire_lease(analysis_id)
+        if busy:
+            return busy
+        
+        try:
+            job = BrainAnalysisJob(
+                id=analysis_id,
+                status='running',
+                full=full,
+                progress_percentage=0,
+                stage='Initialisation de l\'analyse...',
+                thoughts=[],
+                new_rules=[],
+                partial_results={},
+                runner_id=self.runner_id,
+                heartbeat_at=datetime.utcnow(),
+                started_at=datetime.utcnow(),
+                created_by_id=user_id
+            )
+            db.session.add(job)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            BrainRunnerLease.release(ANALYSIS_LEASE, self.runner_id)
+            raise
+        
+        self._launch(analysis_id, full, thoughts=[], checkpoint={})
+        
+        return {
+            'status': 'success',
+            'analysisId': analysis_id,
+            'message': 'Analyse multi-agents démarrée'
+        }
+    
+    def resume_analysis(self, analysis_id: str) -> Dict:
+        """Continue a failed, interrupted or cancelled analysis from its last checkpoint"""
+        from app import db
+        from app.models import BrainAnalysisJob, BrainRunnerLease
+        
+        job = BrainAnalysisJob.query.get(analysis_id)
+        if job is None:
+            return {
+                'status': 'error',
+                'message': 'Analysis not found'
+            }
+        
+        if job.is_stale(STALE_AFTER_SECONDS):
+            job.status = 'cancelled' if job.status == 'cancelling' else 'interrupted'
+            db.session.commit()
+        
+        if job.status not in RESUMABLE_STATUSES:
+            return {
+                'status': 'error',
+                'message': f"Impossible de reprendre une analyse au statut '{job.status}'"
+            }
+        
+        busy = self._acquire_lease(analysis_id)
+        if busy:
+            return busy
+        
+        # Conditional update so two workers can't resume the same job
+        updated = BrainAnalysisJob.query.filter(
+            BrainAnalysisJob.id == analysis_id,
+            BrainAnalysisJob.status.in_(RESUMABLE_STATUSES)
+        ).update({
             'status': 'running',
-            'progress': {
-                'percentage': 0,
-                'stage': 'Initialisation de l\'analyse...'
-            },
-            'thoughts': [],
-            'new_rules': [],
-            'start_time': datetime.now()
+            'error': None,
+            'finished_at': None,
+            'runner_id': self.runner_id,
+            'heartbeat_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if updated != 1:
+            BrainRunnerLease.release(ANALYSIS_LEASE, self.runner_id)
+            return {
+                'status': 'error',
+                'message': 'Analyse déjà reprise'
+            }
+        
+        checkpoint = dict(job.partial_results or {})
+        self._launch(analysis_id, job.full, thoughts=list(job.thoughts or []), checkpoint=checkpoint)
+        
+        completed = checkpoint.get('completed_stages', [])
+        return {
+            'status': 'success',
+            'analysisId': analysis_id,
+            'message': f"Analyse reprise ({len(completed)} étapes déjà terminées)"
         }
+    
+    def cancel_analysis(self, analysis_id: str) -> Dict:
+        """Ask the runner to stop; in-flight batches finish and are checkpointed"""
+        from app import db
+        from app.models import BrainAnalysisJob
         
-        # Start analysis in background thread
-        analysis_thread = threading.Thread(target=self._run_analysis, args=(analysis_id,))
-        analysis_thread.daemon = True
-        analysis_thread.start()
+        job = BrainAnalysisJob.query.get(analysis_id)
+        if job is None:
+            return {
+                'status': 'error',
+                'message': 'Analysis not found'
+            }
+        
+        if job.status in ('running', 'cancelling') and job.is_stale(STALE_AFTER_SECONDS):
+            # Nobody is running it anymore: cancel directly
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        elif job.status == 'running':
+            BrainAnalysisJob.query.filter_by(id=analysis_id, status='running').update(
+                {'status': 'cancelling'}, synchronize_session=False)
+            db.session.commit()
+        elif job.status != 'cancelling':
+            return {
+                'status': 'error',
+                'message': f"L'analyse n'est pas en cours ({job.status})"
+            }
         
         return {
             'status': 'success',
             'analysisId': analysis_id,
-            'message': 'Analyse multi-agents démarrée'
+            'message': 'Annulation demandée'
+        }
+    
+    def _acquire_lease(self, analysis_id: str) -> Optional[Dict]:
+        """Take the cluster-wide runner lease; returns an error response if another analysis holds it"""
+        from app.models import BrainRunnerLease
+        
+        if BrainRunnerLease.acquire(ANALYSIS_LEASE, self.runner_id, analysis_id, LEASE_TTL_SECONDS):
+            return None
+        
+        return {
+            'status': 'error',
+            'message': 'Une analyse est déjà en cours',
+            'analysisId': BrainRunnerLease.current_job_id(ANALYSIS_LEASE)
         }
     
-    def _run_analysis(self, analysis_id: str):
-        """Run the complete multi-agent analysis pipeline"""
+    def _launch(self, analysis_id: str, full: bool, thoughts: List[Dict], checkpoint: Dict):
+        """Start the runner and heartbeat threads for a job we hold the lease for"""
+        from flask import current_app
+        
+        self.analyses[analysis_id] = {
+            'thoughts': thoughts,
+            'new_rules': [],
+            'checkpoint': checkpoint,
+            'last_cancel_check': 0.0,
+            'stop_heartbeat': threading.Event()
+        }
+        
+        # Start analysis in background thread
+        app = current_app._get_current_object()
+        analysis_thread = threading.Thread(target=self._run_job, args=(app, analysis_id, full))
+        analysis_thread.daemon = True
+        analysis_thread.start()
+        
+        heartbeat_thread = threading.Thread(target=self._heartbeat,
+                                            args=(app, analysis_id, self.analyses[analysis_id]['stop_heartbeat']))
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+    
+    def _run_job(self, app, analysis_id: str, full: bool):
+        """Background entry point: run the pipeline with an app context, then release the lease"""
+        from app import db
+        from app.models import BrainRunnerLease
+        
+        with app.app_context():
+            try:
+                self._run_analysis(analysis_id, full)
+            finally:
+                self.analyses[analysis_id]['stop_heartbeat'].set()
+                try:
+                    BrainRunnerLease.release(ANALYSIS_LEASE, self.runner_id)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error releasing analysis lease: {e}")
+                self.analyses.pop(analysis_id, None)
+                db.session.remove()
+    
+    def _heartbeat(self, app, analysis_id: str, stop: threading.Event):
+        """Refresh the job heartbeat and the runner lease while the analysis runs"""
+        from app import db
+        from app.models import BrainAnalysisJob, BrainRunnerLease
+        
+        with app.app_context():
+            while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+                try:
+                    BrainAnalysisJob.query.filter_by(id=analysis_id).update(
+                        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                    if not BrainRunnerLease.renew(ANALYSIS_LEASE, self.runner_id, LEASE_TTL_SECONDS):
+                        logger.warning(f"Analysis lease lost by {self.runner_id}")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Heartbeat error for analysis {analysis_id}: {e}")
+            db.session.remove()
+    
+    def _run_analysis(self, analysis_id: str, full: bool = False):
+        """Run the complete multi-agent analysis pipeline, skipping stages already checkpointed"""
         try:
-            analysis = self.analyses[analysis_id]
+            checkpoint = self.analyses[analysis_id]['checkpoint']
+            completed = checkpoint.setdefault('completed_stages', [])
+            if completed:
+                self._add_agent_thought(analysis_id, 'scanner',
+                    f"Reprise de l'analyse après: {', '.join(completed)}")
             
             # Stage 1: Data Collection
             self._update_progress(analysis_id, 5, "Collecte des données...")
-            data_chunks = self._collect_data_chunks()
+            chunk_index = self._collect_data_chunks()
+            data_chunks = chunk_index.chunks
+            
+            # Agent results are cached by input hash; a full run starts from an empty cache
+            cache = AnalysisCache(self._analysis_cache_path())
+            if not full:
+                cache.load()
+            changes = cache.begin_run(data_chunks)
+            if not completed:
+                self._add_agent_thought(analysis_id, 'scanner',
+                    f"{len(data_chunks)} éléments: {len(changes['added'])} nouveaux, "
+                    f"{len(changes['changed'])} modifiés, {len(changes['removed'])} supprimés depuis la dernière analyse")
             
             # Stage 2: Scanner Agent - Quick pattern identification
-            self._update_progress(analysis_id, 15, "Scanner Agent: Identification des patterns...")
-            patterns = self._scanner_agent(analysis_id, data_chunks)
+            if 'scanner' in completed:
+                patterns = checkpoint['patterns']
+                # Mark the reused scanner batches so the final cache save keeps them
+                cache.plan_scan(data_chunks, SCANNER_BATCH_SIZE)
+            else:
+                self._update_progress(analysis_id, 15, "Scanner Agent: Identification des patterns...")
+                patterns = self._scanner_agent(analysis_id, data_chunks, cache)
+                cache.save(prune=False)
+                self._complete_stage(analysis_id, 'scanner', patterns=patterns)
             
             # Stage 3: Analyzer Agent - Deep analysis of patterns
-            self._update_progress(analysis_id, 40, "Analyzer Agent: Analyse approfondie...")
-            deep_insights = self._analyzer_agent(analysis_id, patterns, data_chunks)
+            if 'analyzer' in completed:
+                deep_insights = checkpoint['insights']
+                for insight in deep_insights:
+                    for part in insight.get('parts') or [insight]:
+                        if part.get('input_key'):
+                            cache.store_insight(part['input_key'], {'analysis': part['analysis']})
+            else:
+                self._update_progress(analysis_id, 40, "Analyzer Agent: Analyse approfondie...")
+                deep_insights = self._analyzer_agent(analysis_id, patterns, chunk_index, cache)
+                self._complete_stage(analysis_id, 'analyzer', insights=deep_insights)
             
             # Stage 4: Synthesizer Agent - Rule generation
-            self._update_progress(analysis_id, 65, "Synthesizer Agent: Génération des règles...")
-            rules = self._synthesizer_agent(analysis_id, deep_insights)
+            # Insights reused from the cache already produced their rules in an earlier run
+            if 'synthesizer' in completed:
+                rules = checkpoint['rules']
+            else:
+                self._update_progress(analysis_id, 65, "Synthesizer Agent: Génération des règles...")
+                rules = self._synthesizer_agent(analysis_id, [i for i in deep_insights if not i.get('cached')])
+                self._complete_stage(analysis_id, 'synthesizer', rules=rules)
             
             # Stage 5: Validator Agent - Rule validation
-            self._update_progress(analysis_id, 85, "Validator Agent: Validation des règles...")
-            validated_rules = self._validator_agent(analysis_id, rules, data_chunks)
+            if 'validator' in completed:
+                validated_rules = checkpoint['validated_rules']
+            else:
+                self._update_progress(analysis_id, 85, "Validator Agent: Validation des règles...")
+                validated_rules = self._validator_agent(analysis_id, rules, chunk_index)
+                self._complete_stage(analysis_id, 'validator', validated_rules=validated_rules)
             
             # Stage 6: Save and complete
             self._update_progress(analysis_id, 95, "Sauvegarde des résultats...")
             self._save_analysis_results(analysis_id, validated_rules)
+            cache.save()
+            self._complete_stage(analysis_id, 'save')
             
             # Complete
             self._update_progress(analysis_id, 100, "Analyse terminée")
-            analysis['status'] = 'complete'
+            self._update_job(analysis_id, status='complete', finished_at=datetime.utcnow())
+            
+        except AnalysisCancelled:
+            logger.info(f"Analysis {analysis_id} cancelled")
+            self._add_agent_thought(analysis_id, 'validator', "Analyse annulée; elle peut être reprise")
+            self._update_job(analysis_id, status='cancelled', finished_at=datetime.utcnow())
             
         except Exception as e:
             logger.error(f"Error in analysis {analysis_id}: {e}")
-            analysis['status'] = 'error'
-            analysis['error'] = str(e)
+            self._update_job(analysis_id, status='error', error=str(e), finished_at=datetime.utcnow())
+    
+    def _update_job(self, analysis_id: str, **fields):
+        """Persist job fields (single-row UPDATE by primary key)"""
+        from app import db
+        from app.models import BrainAnalysisJob
+        
+        try:
+            BrainAnalysisJob.query.filter_by(id=analysis_id).update(fields, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error updating analysis job {analysis_id}: {e}")
+    
+    def _complete_stage(self, analysis_id: str, stage: str, **outputs):
+        """Checkpoint the output of a finished stage and drop its batch checkpoints"""
+        checkpoint = self.analyses[analysis_id]['checkpoint']
+        checkpoint.update(outputs)
+        checkpoint.setdefault('completed_stages', []).append(stage)
+        checkpoint.get('batches', {}).pop(stage, None)
+        self._update_job(analysis_id, partial_results=checkpoint)
+    
+    def _checkpoint_batch(self, analysis_id: str, stage: str, key: str, result):
+        """Checkpoint the result of one batch of a running stage"""
+        checkpoint = self.analyses[analysis_id]['checkpoint']
+        checkpoint.setdefault('batches', {}).setdefault(stage, {})[key] = result
+        self._update_job(analysis_id, partial_results=checkpoint)
+    
+    def _check_cancelled(self, analysis_id: str):
+        """Raise AnalysisCancelled if a cancel was requested (database read at most once per second)"""
+        from app.models import BrainAnalysisJob
+        
+        state = self.analyses.get(analysis_id)
+        if state is None or time.monotonic() - state['last_cancel_check'] < CANCEL_CHECK_INTERVAL_SECONDS:
+            return
+        state['last_cancel_check'] = time.monotonic()
+        
+        job = BrainAnalysisJob.query.with_entities(BrainAnalysisJob.status).filter_by(id=analysis_id).first()
+        if job and job.status == 'cancelling':
+            raise AnalysisCancelled()
     
-    def _collect_data_chunks(self) -> List[Dict]:
-        """Collect and organize data into analyzable chunks"""
+    def _analysis_cache_path(self) -> str:
+        """Location of the incremental analysis cache"""
+        return os.path.join(os.path.dirname(__file__), '../../DATA/brain_cache/analysis_cache.json')
+    
+    def _collect_data_chunks(self) -> ChunkIndex:
+        """Collect and organize data into analyzable chunks, indexed for evidence lookups"""
         chunks = []
         
         try:
             # Load from TRAITEMENTS_JSON (actual clinical cases)
             cases_dir = os.path.join(os.path.dirname(__file__), '../../DATA/TRAITEMENTS_JSON')
             if os.path.exists(cases_dir):
-                for filename in os.listdir(cases_dir):
+                for filename in sorted(os.listdir(cases_dir)):
                     if filename.endswith('.json'):
                         with open(os.path.join(cases_dir, filename), 'r', encoding='utf-8') as f:
                             case = json.load(f)
@@ -137,7 +435,7 @@ class BrainService:
             # Load ideal sequences
             sequences_dir = os.path.join(os.path.dirname(__file__), '../../DATA/IDEAL_SEQUENCES')
             if os.path.exists(sequences_dir):
-                for filename in os.listdir(sequences_dir):
+                for filename in sorted(os.listdir(sequences_dir)):
                     if filename.endswith('.json'):
                         with open(os.path.join(sequences_dir, filename), 'r', encoding='utf-8') as f:
                             sequence = json.load(f)
@@ -150,7 +448,7 @@ class BrainService:
             # Load approved sequences
             approved_dir = os.path.join(os.path.dirname(__file__), '../../DATA/APPROVED_SEQUENCES')
             if os.path.exists(approved_dir):
-                for filename in os.listdir(approved_dir):
+                for filename in sorted(os.listdir(approved_dir)):
                     if filename.endswith('.json'):
                         with open(os.path.join(approved_dir, filename), 'r', encoding='utf-8') as f:
                             sequence = json.load(f)
@@ -163,7 +461,7 @@ class BrainService:
             # Load from IDEAL_SEQUENCES_JSON (ideal cases given by dentist - very important!)
             ideal_cases_dir = os.path.join(os.path.dirname(__file__), '../../DATA/IDEAL_SEQUENCES_JSON')
             if os.path.exists(ideal_cases_dir):
-                for filename in os.listdir(ideal_cases_dir):
+                for filename in sorted(os.listdir(ideal_cases_dir)):
                     if filename.endswith('.json'):
                         with open(os.path.join(ideal_cases_dir, filename), 'r', encoding='utf-8') as f:
                             ideal_case = json.load(f)
@@ -176,7 +474,7 @@ class BrainService:
             # Load from IDEAL_SEQUENCES_ENHANCED
             enhanced_dir = os.path.join(os.path.dirname(__file__), '../../DATA/IDEAL_SEQUENCES_ENHANCED')
             if os.path.exists(enhanced_dir):
-                for filename in os.listdir(enhanced_dir):
+                for filename in sorted(os.listdir(enhanced_dir)):
                     if filename.endswith('.json'):
                         with open(os.path.join(enhanced_dir, filename), 'r', encoding='utf-8') as f:
                             enhanced = json.load(f)
@@ -188,34 +486,131 @@ class BrainService:
             
             logger.info(f"Collected {len(chunks)} data chunks from multiple sources")
             logger.info(f"Types: {dict([(t, sum(1 for c in chunks if c['type'] == t)) for t in set(c['type'] for c in chunks)])}")
-            return chunks
+            return ChunkIndex(chunks)
             
         except Exception as e:
             logger.error(f"Error collecting data chunks: {e}")
-            return []
+            return ChunkIndex([])
+    
+    def _call_llm(self, messages: List[Dict], expected_output_tokens: int = 1000, **kwargs):
+        """Chat completion that waits for the shared rate budget and reports actual usage back"""
+        estimated = sum(estimate_tokens(m['content']) for m in messages) + expected_output_tokens
+        waited = self.rate_limiter.acquire(estimated)
+        if waited > 0:
+            logger.info(f"⏳ Waited {waited:.1f}s for rate budget ({estimated} tokens)")
+        
+        response = self.client.chat.completions.create(messages=messages, **kwargs)
+        
+        usage = getattr(response, 'usage', None)
+        self.rate_limiter.settle(estimated, usage.total_tokens if usage else None)
+        return response
     
-    def _scanner_agent(self, analysis_id: str, data_chunks: List[Dict]) -> List[Dict]:
+    def _run_batches(self, agent: str, items: List[Any], worker: Callable[[Any], Any],
+                     analysis_id: str = None, key: Callable[[Any], str] = None) -> Iterator[Tuple[Any, Any]]:
+        """Run worker over items with bounded concurrency.
+        
+        Yields (item, result) in input order as results become available, so the
+        caller can emit agent thoughts in a stable order. Failed items are
+        logged and skipped. With an analysis_id and a key function, results are
+        checkpointed per batch, batches already checkpointed are not sent again,
+        and a cancel request stops the stage between batches.
+        """
+        if not items:
+            return
+        
+        state = self.analyses.get(analysis_id) if analysis_id else None
+        done = state['checkpoint'].get('batches', {}).get(agent, {}) if state and key else {}
+        keys = [key(item) if state and key else None for item in items]
+        
+        pending = [(item, item_key) for item, item_key in zip(items, keys) if item_key not in done]
+        if len(pending) < len(items):
+            logger.info(f"{agent.capitalize()}: {len(items) - len(pending)} batch(es) restored from checkpoint")
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(pending))),
+                                      thread_name_prefix=f"brain-{agent}")
+        futures = {item_key if item_key is not None else index: executor.submit(worker, item)
+                   for index, (item, item_key) in enumerate(pending)}
+        consumed = set()
+        
+        try:
+            pending_index = 0
+            for item, item_key in zip(items, keys):
+                if item_key in done:
+                    yield item, done[item_key]
+                    continue
+                
+                future = futures[item_key if item_key is not None else pending_index]
+                pending_index += 1
+                while True:
+                    if analysis_id:
+                        self._check_cancelled(analysis_id)
+                    try:
+                        result = future.result(timeout=CANCEL_CHECK_INTERVAL_SECONDS)
+                        break
+                    except FutureTimeoutError:
+                        continue
+                    except Exception as e:
+                        logger.error(f"{agent.capitalize()} agent error: {e}")
+                        result = None
+                        break
+                
+                consumed.add(id(future))
+                if future.exception() is not None:
+                    continue
+                if item_key is not None:
+                    self._checkpoint_batch(analysis_id, agent, item_key, result)
+                yield item, result
+        finally:
+            # Stop queued batches; running calls finish and are kept for a resume
+            executor.shutdown(wait=True, cancel_futures=True)
+            if state and key:
+                for item_key, future in futures.items():
+                    if (id(future) not in consumed and future.done() and not future.cancelled()
+                            and future.exception() is None):
+                        self._checkpoint_batch(analysis_id, agent, item_key, future.result())
+    
+    def _scanner_agent(self, analysis_id: str, data_chunks: List[Dict],
+                       cache: Optional[AnalysisCache] = None) -> List[Dict]:
         """Scanner Agent: Quickly identify interesting patterns"""
         patterns = []
         
-        # Process chunks in batches
-        batch_size = 5
-        for i in range(0, len(data_chunks), batch_size):
-            batch = data_chunks[i:i+batch_size]
-            
-            # Prepare batch summary
-            batch_summary = []
-            for chunk in batch:
-                if chunk['type'] == 'clinical_case':
-                    summary = f"Cas clinique {chunk['name']}: {chunk['content'].get('consultation', '')}"
-                elif chunk['type'] in ['ideal_sequence', 'approved_sequence']:
-                    treatments = [t.get('traitement', '') for t in chunk['content'].get('steps', [])]
-                    summary = f"Séquence {chunk['name']}: {' → '.join(treatments[:5])}"
-                else:
-                    summary = f"{chunk['type']}: {chunk['name']}"
-                batch_summary.append(summary)
+        # Process chunks in batches; with a cache only new or changed chunks are scanned
+        batch_size = SCANNER_BATCH_SIZE
+        if cache is not None:
+            cached_patterns, batches = cache.plan_scan(data_chunks, batch_size)
+            patterns.extend(cached_patterns)
+            self._add_agent_thought(analysis_id, 'scanner',
+                f"{len(cached_patterns)} patterns repris du cache, {len(batches)} lots à analyser")
+        else:
+            batches = [data_chunks[i:i+batch_size] for i in range(0, len(data_chunks), batch_size)]
+        
+        for batch, result in self._run_batches('scanner', batches, self._scan_batch,
+                                               analysis_id=analysis_id, key=cache.batch_key if cache is not None else None):
+            patterns.extend(result.get('patterns_found', []))
+            if cache is not None:
+                cache.store_batch(batch, result.get('patterns_found', []))
             
-            prompt = f"""En tant que Scanner Agent spécialisé en analyse dentaire, identifie rapidement les patterns intéressants dans ces données:
+            # Log agent thought
+            self._add_agent_thought(analysis_id, 'scanner', 
+                f"Analysé {len(batch)} éléments, trouvé {len(result.get('patterns_found', []))} patterns intéressants")
+        
+        return patterns
+    
+    def _scan_batch(self, batch: List[Dict]) -> Dict:
+        """Scanner Agent call for one batch of chunks"""
+        # Prepare batch summary
+        batch_summary = []
+        for chunk in batch:
+            if chunk['type'] == 'clinical_case':
+                summary = f"Cas clinique {chunk['name']}: {chunk['content'].get('consultation', '')}"
+            elif chunk['type'] in ['ideal_sequence', 'approved_sequence']:
+                treatments = [t.get('traitement', '') for t in chunk['content'].get('steps', [])]
+                summary = f"Séquence {chunk['name']}: {' → '.join(treatments[:5])}"
+            else:
+                summary = f"{chunk['type']}: {chunk['name']}"
+            batch_summary.append(summary)
+        
+        prompt = f"""En tant que Scanner Agent spécialisé en analyse dentaire, identifie rapidement les patterns intéressants dans ces données:
 
 {chr(10).join(batch_summary)}
 
@@ -239,49 +634,96 @@ Format de réponse JSON:
   "quick_insights": ["insight1", "insight2"]
 }}"""
 
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0.7
-                )
-                
-                result = json.loads(response.choices[0].message.content)
-                patterns.extend(result.get('patterns_found', []))
-                
-                # Log agent thought
-                self._add_agent_thought(analysis_id, 'scanner', 
-                    f"Analysé {len(batch)} éléments, trouvé {len(result.get('patterns_found', []))} patterns intéressants")
-                
-                # Small delay to avoid rate limits
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Scanner agent error: {e}")
+        response = self._call_llm(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            temperature=0.7
+        )
         
-        return patterns
+        return json.loads(response.choices[0].message.content)
     
-    def _analyzer_agent(self, analysis_id: str, patterns: List[Dict], data_chunks: List[Dict]) -> List[Dict]:
+    def _analyzer_agent(self, analysis_id: str, patterns: List[Dict], chunk_index: ChunkIndex,
+                        cache: Optional[AnalysisCache] = None) -> List[Dict]:
         """Analyzer Agent: Deep dive into identified patterns"""
-        deep_insights = []
-        
         # Group patterns by type for efficient analysis
         patterns_by_type = defaultdict(list)
         for pattern in patterns:
             patterns_by_type[pattern.get('type', 'unknown')].append(pattern)
         
+        # Groups too large for one prompt are split into parts analyzed concurrently
+        groups = []
+        parts_by_type = {}
         for pattern_type, type_patterns in patterns_by_type.items():
-            # Find relevant data chunks for this pattern type
-            relevant_chunks = self._find_relevant_chunks(type_patterns, data_chunks)
+            parts = split_by_budget(type_patterns, ANALYZER_PATTERN_BUDGET)
+            parts_by_type[pattern_type] = [None] * len(parts)
+            for index, part_patterns in enumerate(parts):
+                evidence = self._select_evidence(part_patterns, chunk_index)
+                key = cache.insight_key(pattern_type, part_patterns, evidence) if cache is not None else None
+                cached_part = cache.get_insight(key) if cache is not None else None
+                if cached_part is not None:
+                    parts_by_type[pattern_type][index] = {'input_key': key, 'analysis': cached_part['analysis'], 'cached': True}
+                else:
+                    groups.append({
+                        'pattern_type': pattern_type,
+                        'part': index,
+                        'parts': len(parts),
+                        'patterns': part_patterns,
+                        'evidence': evidence,
+                        'key': key
+                    })
+        
+        cached_count = sum(1 for parts in parts_by_type.values() for part in parts if part is not None)
+        if cached_count:
+            self._add_agent_thought(analysis_id, 'analyzer',
+                f"{cached_count} analyses inchangées reprises du cache")
+        
+        for group, analysis in self._run_batches(
+                'analyzer', groups, self._analyze_group,
+                analysis_id=analysis_id, key=lambda group: group['key'] or f"{group['pattern_type']}:{group['part']}"):
+            parts_by_type[group['pattern_type']][group['part']] = {'input_key': group['key'], 'analysis': analysis}
+            if cache is not None:
+                cache.store_insight(group['key'], {'analysis': analysis})
             
-            prompt = f"""En tant qu'Analyzer Agent expert en dentisterie, effectue une analyse approfondie de ces patterns de type '{pattern_type}':
+            # Log agent thought
+            part_label = f" (partie {group['part'] + 1}/{group['parts']})" if group['parts'] > 1 else ''
+            self._add_agent_thought(analysis_id, 'analyzer',
+                f"Analyse approfondie du pattern '{group['pattern_type']}'{part_label} avec {len(group['evidence'])} preuves")
+        
+        # One insight per pattern type, whatever the number of parts
+        deep_insights = []
+        for pattern_type, parts in parts_by_type.items():
+            type_patterns = patterns_by_type[pattern_type]
+            deep_insights.append({
+                'pattern_type': pattern_type,
+                'analysis': '\n\n'.join(part['analysis'] for part in parts),
+                'patterns': type_patterns,
+                'evidence_count': len(rank_evidence(type_patterns, chunk_index.by_reference)),
+                'parts': [{'input_key': part['input_key'], 'analysis': part['analysis']} for part in parts],
+                'cached': all(part.get('cached') for part in parts)
+            })
+        
+        return deep_insights
+    
+    def _select_evidence(self, patterns: List[Dict], chunk_index: ChunkIndex) -> List[Dict]:
+        """Most relevant chunks for these patterns that fit the analyzer evidence budget"""
+        ranked = rank_evidence(patterns, chunk_index.by_reference)
+        lines = pack_lines([self._summarize_chunk(chunk) for chunk in ranked],
+                           ANALYZER_EVIDENCE_BUDGET, limit=ANALYZER_MAX_EVIDENCE)
+        return ranked[:len(lines)]
+    
+    def _analyze_group(self, group: Dict) -> str:
+        """Analyzer Agent call for one pattern type (or one part of it)"""
+        pattern_type = group['pattern_type']
+        part_note = f" (partie {group['part'] + 1} sur {group['parts']})" if group['parts'] > 1 else ''
+        
+        prompt = f"""En tant qu'Analyzer Agent expert en dentisterie, effectue une analyse approfondie de ces patterns de type '{pattern_type}'{part_note}:
 
 Patterns identifiés:
-{json.dumps(type_patterns, ensure_ascii=False, indent=2)}
+{compact_json(group['patterns'])}
 
 Données pertinentes:
-{self._summarize_chunks(relevant_chunks[:10])}  
+{self._summarize_chunks(group['evidence'])}  
 
 Analyse demandée:
 1. Identifie les règles cliniques sous-jacentes
@@ -292,38 +734,39 @@ Analyse demandée:
 
 Pense étape par étape et sois très précis dans ton analyse."""
 
-            try:
-                # Use o1-mini for deep thinking
-                response = self.client.chat.completions.create(
-                    model="o1-mini",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                
-                insight = {
-                    'pattern_type': pattern_type,
-                    'analysis': response.choices[0].message.content,
-                    'patterns': type_patterns,
-                    'evidence_count': len(relevant_chunks)
-                }
-                deep_insights.append(insight)
-                
-                # Log agent thought
-                self._add_agent_thought(analysis_id, 'analyzer',
-                    f"Analyse approfondie du pattern '{pattern_type}' avec {len(relevant_chunks)} preuves")
-                
-                time.sleep(1)  # Rate limiting
-                
-            except Exception as e:
-                logger.error(f"Analyzer agent error: {e}")
+        # Use o1-mini for deep thinking (reasoning tokens count against the budget too)
+        response = self._call_llm(
+            model="o1-mini",
+            messages=[{"role": "user", "content": prompt}],
+            expected_output_tokens=4000
+        )
         
-        return deep_insights
+        return response.choices[0].message.content
     
     def _synthesizer_agent(self, analysis_id: str, deep_insights: List[Dict]) -> List[Dict]:
         """Synthesizer Agent: Generate clinical rules from insights"""
         rules = []
         
-        for insight in deep_insights:
-            prompt = f"""En tant que Synthesizer Agent, transforme cette analyse en règles cliniques claires et applicables:
+        for insight, generated_rules in self._run_batches('synthesizer', deep_insights, self._synthesize_insight,
+                                                          analysis_id=analysis_id, key=lambda insight: insight['pattern_type']):
+            # Add metadata to each rule
+            for rule in generated_rules:
+                rule['id'] = str(uuid.uuid4())
+                rule['discoveredAt'] = datetime.now().isoformat()
+                rule['evidenceCount'] = insight['evidence_count']
+                rule['summary'] = rule['description'][:150] + '...' if len(rule['description']) > 150 else rule['description']
+            
+            rules.extend(generated_rules)
+            
+            # Log agent thought
+            self._add_agent_thought(analysis_id, 'synthesizer',
+                f"Généré {len(generated_rules)} règles à partir du pattern '{insight['pattern_type']}'")
+        
+        return rules
+    
+    def _synthesize_insight(self, insight: Dict) -> List[Dict]:
+        """Synthesizer Agent call for one insight"""
+        prompt = f"""En tant que Synthesizer Agent, transforme cette analyse en règles cliniques claires et applicables:
 
 Type de pattern: {insight['pattern_type']}
 Analyse: {insight['analysis']}
@@ -352,49 +795,50 @@ Assure-toi que chaque règle est:
 - Cliniquement pertinente
 - Facilement applicable en pratique"""
 
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0.5
-                )
-                
-                result = json.loads(response.choices[0].message.content)
-                generated_rules = result.get('rules', [])
-                
-                # Add metadata to each rule
-                for rule in generated_rules:
-                    rule['id'] = str(uuid.uuid4())
-                    rule['discoveredAt'] = datetime.now().isoformat()
-                    rule['evidenceCount'] = insight['evidence_count']
-                    rule['summary'] = rule['description'][:150] + '...' if len(rule['description']) > 150 else rule['description']
-                
-                rules.extend(generated_rules)
-                
-                # Log agent thought
-                self._add_agent_thought(analysis_id, 'synthesizer',
-                    f"Généré {len(generated_rules)} règles à partir du pattern '{insight['pattern_type']}'")
-                
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Synthesizer agent error: {e}")
+        response = self._call_llm(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            temperature=0.5,
+            expected_output_tokens=1500
+        )
         
-        return rules
+        result = json.loads(response.choices[0].message.content)
+        return result.get('rules', [])
     
-    def _validator_agent(self, analysis_id: str, rules: List[Dict], data_chunks: List[Dict]) -> List[Dict]:
+    def _validator_agent(self, analysis_id: str, rules: List[Dict], chunk_index: ChunkIndex) -> List[Dict]:
         """Validator Agent: Test and validate generated rules"""
         validated_rules = []
         
-        for rule in rules:
-            # Find test cases for validation
-            test_cases = self._find_test_cases(rule, data_chunks)
-            
-            prompt = f"""En tant que Validator Agent, valide cette règle clinique contre des cas réels:
+        # Find test cases for validation
+        candidates = [(rule, self._find_test_cases(rule, chunk_index)) for rule in rules]
+        
+        for (rule, test_cases), validation_result in self._run_batches('validator', candidates, self._validate_rule,
+                                                                       analysis_id=analysis_id, key=lambda candidate: candidate[0]['id']):
+            # Update rule based on validation
+            if "valide" in validation_result.lower() or "confirmé" in validation_result.lower():
+                rule['validated'] = True
+                rule['validationNotes'] = validation_result
+                validated_rules.append(rule)
+                
+                # Log agent thought
+                self._add_agent_thought(analysis_id, 'validator',
+                    f"✓ Règle validée: '{rule['title']}' avec {len(test_cases)} cas de test")
+            else:
+                # Log rejection
+                self._add_agent_thought(analysis_id, 'validator',
+                    f"✗ Règle rejetée: '{rule['title']}' - validation échouée")
+        
+        return validated_rules
+    
+    def _validate_rule(self, candidate: Tuple[Dict, List[Dict]]) -> str:
+        """Validator Agent call for one rule"""
+        rule, test_cases = candidate
+        
+        prompt = f"""En tant que Validator Agent, valide cette règle clinique contre des cas réels:
 
 Règle à valider:
-{json.dumps(rule, ensure_ascii=False, indent=2)}
+{compact_json(rule)}
 
 Cas de test ({len(test_cases)} cas):
 {self._summarize_test_cases(test_cases[:5])}
@@ -408,44 +852,18 @@ Effectue les validations suivantes:
 
 Retourne ton analyse et une version validée de la règle."""
 
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3
-                )
-                
-                validation_result = response.choices[0].message.content
-                
-                # Update rule based on validation
-                if "valide" in validation_result.lower() or "confirmé" in validation_result.lower():
-                    rule['validated'] = True
-                    rule['validationNotes'] = validation_result
-                    validated_rules.append(rule)
-                    
-                    # Log agent thought
-                    self._add_agent_thought(analysis_id, 'validator',
-                        f"✓ Règle validée: '{rule['title']}' avec {len(test_cases)} cas de test")
-                else:
-                    # Log rejection
-                    self._add_agent_thought(analysis_id, 'validator',
-                        f"✗ Règle rejetée: '{rule['title']}' - validation échouée")
-                
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Validator agent error: {e}")
+        response = self._call_llm(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3
+        )
         
-        return validated_rules
+        return response.choices[0].message.content
     
     def _update_progress(self, analysis_id: str, percentage: int, stage: str):
         """Update analysis progress"""
-        if analysis_id in self.analyses:
-            self.analyses[analysis_id]['progress'] = {
-                'percentage': percentage,
-                'stage': stage
-            }
-            logger.info(f"Analysis {analysis_id}: {percentage}% - {stage}")
+        self._update_job(analysis_id, progress_percentage=percentage, stage=stage)
+        logger.info(f"Analysis {analysis_id}: {percentage}% - {stage}")
     
     def _add_agent_thought(self, analysis_id: str, agent: str, content: str):
         """Add a thought from an agent"""
@@ -456,6 +874,7 @@ Retourne ton analyse et une version validée de la règle."""
                 'timestamp': datetime.now().isoformat()
             }
             self.analyses[analysis_id]['thoughts'].append(thought)
+            self._update_job(analysis_id, thoughts=list(self.analyses[analysis_id]['thoughts']))
             
             # Also store in agent memory for future reference
             self.agent_memory[agent].append({
@@ -464,32 +883,12 @@ Retourne ton analyse et une version validée de la règle."""
                 'analysis_id': analysis_id
             })
     
-    def _find_relevant_chunks(self, patterns: List[Dict], data_chunks: List[Dict]) -> List[Dict]:
-        """Find data chunks relevant to given patterns"""
-        relevant = []
-        
-        for pattern in patterns:
-            pattern_refs = pattern.get('occurrences', [])
-            for chunk in data_chunks:
-                # Check if chunk is referenced in pattern
-                if chunk['name'] in str(pattern_refs) or any(ref in chunk['name'] for ref in pattern_refs):
-                    relevant.append(chunk)
-        
-        return list({chunk['name']: chunk for chunk in relevant}.values())  # Remove duplicates
-    
-    def _find_test_cases(self, rule: Dict, data_chunks: List[Dict]) -> List[Dict]:
+    def _find_test_cases(self, rule: Dict, chunk_index: ChunkIndex) -> List[Dict]:
         """Find test cases for rule validation"""
-        test_cases = []
-        
         # Search for cases that might match rule conditions
         rule_keywords = self._extract_keywords(rule)
         
-        for chunk in data_chunks:
-            chunk_text = json.dumps(chunk['content'], ensure_ascii=False).lower()
-            if any(keyword.lower() in chunk_text for keyword in rule_keywords):
-                test_cases.append(chunk)
-        
-        return test_cases[:10]  # Limit to 10 test cases
+        return chunk_index.by_keywords(rule_keywords, limit=10)  # Limit to 10 test cases
     
     def _extract_keywords(self, rule: Dict) -> List[str]:
         """Extract keywords from a rule for matching"""
@@ -505,21 +904,18 @@ Retourne ton analyse et une version validée de la règle."""
         
         return list(set(keywords))
     
+    def _summarize_chunk(self, chunk: Dict) -> str:
+        """One-line summary of a data chunk"""
+        if chunk['type'] == 'clinical_case':
+            return f"- Cas {chunk['name']}: {chunk['content'].get('consultation', 'N/A')[:100]}..."
+        return f"- {chunk['type']} {chunk['name']}"
+    
     def _summarize_chunks(self, chunks: List[Dict]) -> str:
-        """Create a summary of data chunks"""
-        summaries = []
-        
-        for chunk in chunks[:5]:  # Limit to 5 for brevity
-            if chunk['type'] == 'clinical_case':
-                summary = f"- Cas {chunk['name']}: {chunk['content'].get('consultation', 'N/A')[:100]}..."
-            else:
-                summary = f"- {chunk['type']} {chunk['name']}"
-            summaries.append(summary)
-        
-        return "\n".join(summaries)
+        """Create a summary of data chunks (selected beforehand to fit the prompt budget)"""
+        return "\n".join(self._summarize_chunk(chunk) for chunk in chunks)
     
     def _summarize_test_cases(self, test_cases: List[Dict]) -> str:
-        """Summarize test cases for validation"""
+        """Summarize the most relevant test cases that fit the validator budget"""
         summaries = []
         
         for case in test_cases:
@@ -531,81 +927,218 @@ Retourne ton analyse et une version validée de la règle."""
                 summary = f"- {case['name']}: {len(steps)} étapes"
             summaries.append(summary)
         
-        return "\n".join(summaries)
+        return "\n".join(pack_lines(summaries, VALIDATOR_CASE_BUDGET))
     
     def _save_analysis_results(self, analysis_id: str, validated_rules: List[Dict]):
         """Save analysis results"""
         if analysis_id in self.analyses:
-            # Prepare rules for RAG indexing
-            for rule in validated_rules:
+            # Add new rules to persistent storage, merging paraphrases of known rules
+            known_rules = self.discovered_rules
+            unique_rules = self._deduplicate_rules(known_rules + validated_rules)
+            merged = len(known_rules) + len(validated_rules) - len(unique_rules)
+            if merged:
+                self._add_agent_thought(analysis_id, 'validator',
+                    f"{merged} règles redondantes fusionnées avec des règles existantes")
+            
+            # Prepare new and merged rules for RAG indexing, once merging settled their conditions and confidence
+            known_by_id = {rule.get('id'): rule for rule in known_rules}
+            for rule in unique_rules:
+                if 'rag_text' in rule and known_by_id.get(rule.get('id')) == rule:
+                    continue
                 # Extract keywords for better search
                 rule['keywords'] = self._extract_rule_keywords(rule)
                 # Format for ChromaDB
                 rule['rag_text'] = self._format_rule_for_rag(rule)
             
-            # Add new rules to persistent storage
-            self.discovered_rules.extend(validated_rules)
-            
-            # Remove duplicates based on title
-            seen_titles = set()
-            unique_rules = []
-            for rule in self.discovered_rules:
-                if rule['title'] not in seen_titles:
-                    seen_titles.add(rule['title'])
-                    unique_rules.append(rule)
-            
-            self.discovered_rules = unique_rules
-            
             # Save to disk
-            self._save_rules()
+            self._save_rules(unique_rules)
             
             # Index rules in ChromaDB for RAG
             self._index_rules_in_chromadb(unique_rules)
             
-            # Update analysis
-            self.analyses[analysis_id]['new_rules'] = validated_rules
+            # Update analysis with the new rules that were not merged into existing ones
+            new_ids = {rule.get('id') for rule in validated_rules}
+            new_rules = [rule for rule in unique_rules if rule.get('id') in new_ids]
+            self.analyses[analysis_id]['new_rules'] = new_rules
+            self._update_job(analysis_id, new_rules=new_rules)
+    
+    def _deduplicate_rules(self, rules: List[Dict]) -> List[Dict]:
+        """Merge semantically duplicate rules; falls back to exact titles if embeddings are unavailable"""
+        try:
+            cache = EmbeddingCache(self._rule_embeddings_path()).load()
+            return deduplicate_rules(rules, self._embed_texts, cache)
+        except Exception as e:
+            logger.error(f"Error in semantic rule deduplication, using titles: {e}")
+        
+        seen_titles = set()
+        unique_rules = []
+        for rule in rules:
+            if rule['title'] not in seen_titles:
+                seen_titles.add(rule['title'])
+                unique_rules.append(rule)
+        return unique_rules
+    
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts with the knowledge base embedding model"""
+        response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    def _rule_embeddings_path(self) -> str:
+        """Location of the rule embedding cache"""
+        return os.path.join(os.path.dirname(__file__), '../../DATA/brain_cache/rule_embeddings.json')
+    
+    def _load_job(self, analysis_id: str):
+        """Read a job's progress, settling it if its runner stopped sending heartbeats.
+        
+        The checkpoint (partial_results) grows with every batch and is only
+        needed to resume a run, so it is not loaded here: progress polls and
+        event streams read this on every tick.
+        """
+        from app.models import BrainAnalysisJob
+        from sqlalchemy.orm import defer
+        
+        query = BrainAnalysisJob.query.options(defer(BrainAnalysisJob.partial_results))
+        job = query.get(analysis_id)
+        
+        # A runner that stopped sending heartbeats died with its worker
+        if job is not None and job.is_stale(STALE_AFTER_SECONDS):
+            if job.status == 'cancelling':
+                self._update_job(analysis_id, status='cancelled', finished_at=datetime.utcnow())
+            else:
+                self._update_job(analysis_id, status='interrupted',
+                                 error='Le processus d\'analyse ne répond plus')
+            job = query.get(analysis_id)
+        return job
     
     def get_analysis_progress(self, analysis_id: str) -> Dict:
         """Get current progress of an analysis"""
-        if analysis_id not in self.analyses:
+        job = self._load_job(analysis_id)
+        if job is None:
             return {
                 'status': 'error',
                 'message': 'Analysis not found'
             }
         
-        analysis = self.analyses[analysis_id]
-        
-        # Get new thoughts since last check
-        new_thoughts = analysis['thoughts'][-5:]  # Last 5 thoughts
-        
-        # Get new rules since last check
-        new_rules = analysis['new_rules'][-5:]  # Last 5 rules
+        thoughts = job.thoughts or []
+        new_rules = job.new_rules or []
         
-        return {
+        response = {
             'status': 'success',
-            'progress': analysis['progress'],
-            'isComplete': analysis['status'] == 'complete',
-            'newThoughts': new_thoughts,
-            'newRules': new_rules
+            'analysisStatus': job.status,
+            'progress': {
+                'percentage': job.progress_percentage or 0,
+                'stage': job.stage or ''
+            },
+            'isComplete': job.status == 'complete',
+            'newThoughts': thoughts[-5:],  # Last 5 thoughts
+            'newRules': new_rules[-5:]  # Last 5 rules
         }
+        if job.status in ('error', 'interrupted'):
+            response['error'] = job.error
+        return response
+    
+    def stream_analysis_events(self, analysis_id: str, cursor: Optional[str] = None) -> Iterator[str]:
+        """Server-sent events for an analysis: progress changes, each new thought and rule, then 'done'.
+        
+        Every thought and rule event carries an id '<thoughts>:<rules>' counting
+        what the client has received; passing it back as cursor (or
+        Last-Event-ID) resumes the stream without repeating anything.
+        """
+        from app import db
+        
+        seen_thoughts, seen_rules = self._parse_cursor(cursor)
+        last_progress = None
+        started = last_sent = time.monotonic()
+        
+        yield f"retry: {int(STREAM_POLL_INTERVAL_SECONDS * 2000)}\n\n"
+        while True:
+            # End the read transaction so the next query sees the runner's commits
+            db.session.rollback()
+            job = self._load_job(analysis_id)
+            if job is None:
+                yield self._sse('error', {'message': 'Analysis not found'})
+                return
+            
+            events = []
+            progress = {
+                'analysisStatus': job.status,
+                'progress': {'percentage': job.progress_percentage or 0, 'stage': job.stage or ''}
+            }
+            if progress != last_progress:
+                events.append(self._sse('progress', progress))
+                last_progress = progress
+            
+            for thought in (job.thoughts or [])[seen_thoughts:]:
+                seen_thoughts += 1
+                events.append(self._sse('thought', thought, f"{seen_thoughts}:{seen_rules}"))
+            for rule in (job.new_rules or [])[seen_rules:]:
+                seen_rules += 1
+                events.append(self._sse('rule', rule, f"{seen_thoughts}:{seen_rules}"))
+            
+            if job.status in FINISHED_STATUSES:
+                events.append(self._sse('done', {
+                    'analysisStatus': job.status,
+                    'isComplete': job.status == 'complete',
+                    'error': job.error if job.status in ('error', 'interrupted') else None
+                }, f"{seen_thoughts}:{seen_rules}"))
+            
+            now = time.monotonic()
+            if events:
+                yield ''.join(events)
+                last_sent = now
+            elif now - last_sent >= STREAM_KEEPALIVE_SECONDS:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                last_sent = now
+            
+            if job.status in FINISHED_STATUSES or now - started >= STREAM_MAX_SECONDS:
+                return
+            time.sleep(STREAM_POLL_INTERVAL_SECONDS)
+    
+    def _parse_cursor(self, cursor: Optional[str]) -> Tuple[int, int]:
+        """Counts of thoughts and rules already delivered; malformed cursors restart from zero"""
+        try:
+            thoughts, rules = (cursor or '0:0').split(':')
+            return max(0, int(thoughts)), max(0, int(rules))
+        except ValueError:
+            return 0, 0
+    
+    def _sse(self, event: str, data: Any, event_id: Optional[str] = None) -> str:
+        """Format one server-sent event"""
+        lines = [f"event: {event}"]
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+        return '\n'.join(lines) + '\n\n'
     
     def check_saved_analysis(self) -> Dict:
         """Check if there are saved analysis results"""
+        rules = self.discovered_rules
         return {
             'status': 'success',
-            'hasAnalysis': len(self.discovered_rules) > 0,
-            'rules': self.discovered_rules
+            'hasAnalysis': len(rules) > 0,
+            'rules': rules
         }
     
     def get_status(self) -> Dict:
         """Get current status of brain service"""
         return {
             'status': 'ready',
-            'discovered_rules_count': len(self.discovered_rules),
-            'active_analyses': len([a for a in self.analyses.values() if a['status'] == 'running']),
+            'discovered_rules_count': len(self.rule_store),
+            'active_analyses': self._count_active_analyses(),
             'agent_memory_size': {agent: len(memories) for agent, memories in self.agent_memory.items()}
         }
     
+    def _count_active_analyses(self) -> int:
+        """Running analyses across all workers"""
+        from app.models import BrainAnalysisJob
+        
+        try:
+            return BrainAnalysisJob.query.filter_by(status='running').count()
+        except Exception as e:
+            logger.error(f"Error counting active analyses: {e}")
+            return 0
+    
     def _extract_rule_keywords(self, rule: Dict) -> List[str]:
         """Extract keywords from rule for better search"""
         keywords = []
@@ -657,8 +1190,12 @@ Retourne ton analyse et une version validée de la règle."""
         
         return '\n'.join(parts)
     
+    def _rule_id(self, rule: Dict) -> str:
+        """Stable index id: assigned at synthesis, or derived from the title for rules saved without one"""
+        return rule.get('id') or content_hash([rule.get('title', ''), rule.get('type', '')])[:32]
+    
     def _index_rules_in_chromadb(self, rules: List[Dict]):
-        """Index discovered rules in ChromaDB for RAG"""
+        """Sync discovered rules into ChromaDB: upsert new or changed rules, delete removed ones"""
         try:
             # Import here to avoid circular imports
             from app.services import rag_service
@@ -667,19 +1204,17 @@ Retourne ton analyse et une version validée de la règle."""
                 logger.warning("RAG service not available for rule indexing")
                 return
             
-            # Get or create discovered_rules collection
-            collection_name = "discovered_rules"
+            collection = rag_service.client.get_or_create_collection(
+                name="discovered_rules",
+                embedding_function=rag_service.embedding_function
+            )
             
-            # Check if collection exists, create if not
-            try:
-                collection = rag_service.client.get_collection(collection_name)
-                # Clear existing rules to avoid duplicates
-                collection.delete(where={})
-            except:
-                collection = rag_service.client.create_collection(
-                    name=collection_name,
-                    embedding_function=rag_service.embedding_function
-                )
+            # Content hashes of what is indexed now
+            indexed = collection.get(include=['metadatas'])
+            indexed_hashes = {
+                rule_id: (metadata or {}).get('content_hash')
+                for rule_id, metadata in zip(indexed['ids'], indexed['metadatas'])
+            }
             
             # Prepare documents for indexing
             documents = []
@@ -687,9 +1222,10 @@ Retourne ton analyse et une version validée de la règle."""
             ids = []
             
             for rule in rules:
+                rule_id = self._rule_id(rule)
+                
                 # Document text for embedding
                 doc_text = rule.get('rag_text', self._format_rule_for_rag(rule))
-                documents.append(doc_text)
                 
                 # Metadata for filtering and display
                 metadata = {
@@ -708,19 +1244,29 @@ Retourne ton analyse et une version validée de la règle."""
                     'discovered_at': rule.get('discoveredAt', ''),
                     'keywords': json.dumps(rule.get('keywords', [])[:20])  # Limit keywords
                 }
-                metadatas.append(metadata)
+                metadata['content_hash'] = content_hash([doc_text, metadata])
                 
-                # Unique ID
-                ids.append(rule.get('id', str(uuid.uuid4())))
+                # Unchanged rules keep their embedding
+                if indexed_hashes.get(rule_id) == metadata['content_hash'] or rule_id in ids:
+                    continue
+                documents.append(doc_text)
+                metadatas.append(metadata)
+                ids.append(rule_id)
+            
+            current_ids = {self._rule_id(rule) for rule in rules}
+            removed_ids = [rule_id for rule_id in indexed_hashes if rule_id not in current_ids]
             
-            # Add to ChromaDB
             if documents:
-                collection.add(
+                collection.upsert(
                     documents=documents,
                     metadatas=metadatas,
                     ids=ids
                 )
-                logger.info(f"Indexed {len(documents)} discovered rules in ChromaDB")
+            if removed_ids:
+                collection.delete(ids=removed_ids)
+            
+            logger.info(f"Synced discovered rules in ChromaDB: {len(documents)} upserted, "
+                        f"{len(removed_ids)} removed, {len(rules) - len(documents)} unchanged")
             
         except Exception as e:
             logger.error(f"Error indexing rules in ChromaDB: {e}")
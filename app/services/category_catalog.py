@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FILE_RECHECK_SECONDS = 5  # How often unchanged directories have their files re-stat'ed
+
+
+def file_signature(stat: os.stat_result) -> Tuple[int, int]:
+    """What identifies a version of a file without reading it"""
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CategoryCatalog:
+    """Parsed item summaries per category directory, kept in memory.
+
+    Each file's summary is cached with the (mtime, size) it was built from.
+    A listing stats only the directory; its files are re-listed when the
+    directory mtime changes (files added, removed or renamed) and re-stat'ed
+    at most every FILE_RECHECK_SECONDS to catch in-place edits. Writes made
+    through DataService invalidate their file right away.
+
+    on_change(category, filename, data, summary) is called whenever a file is
+    parsed, and with data and summary None when it disappears, so derived
+    indexes can follow the catalog incrementally.
+    """
+
+    def __init__(self, summarize: Callable[[str, Dict, str], Dict],
+                 on_change: Optional[Callable[[str, str, Any, Optional[Dict]], None]] = None):
+        self.summarize = summarize
+        self.on_change = on_change
+        self._categories: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def items(self, category: str, path: str) -> List[Dict]:
+        """Summaries of the category's items in filename order (copies, safe to modify)"""
+        with self._lock:
+            entry = self._refresh(category, path)
+            if entry is None:
+                return []
+            return [dict(summary) for _, summary in entry['files'].values() if summary is not None]
+
+    def listing(self, category: str, path: str) -> Tuple[List[Dict], Optional[str]]:
+        """Items (shared, do not modify) and the catalog version of the category"""
+        with self._lock:
+            entry = self._refresh(category, path)
+            if entry is None:
+                return [], None
+            return [summary for _, summary in entry['files'].values() if summary is not None], entry['version']
+
+    def refresh(self, category: str, path: str):
+        """Pick up changed files without building a listing"""
+        with self._lock:
+            self._refresh(category, path)
+
+    def count(self, category: str, path: str) -> Optional[int]:
+        """Number of items in the category; None if its directory does not exist"""
+        with self._lock:
+            entry = self._refresh(category, path, summaries=False)
+            return None if entry is None else len(entry['names'])
+
+    def invalidate(self, category: str, filename: Optional[str] = None):
+        """Forget a file (or a whole category) so the next listing reads it again"""
+        with self._lock:
+            entry = self._categories.get(category)
+            if entry is None:
+                return
+            if filename is None:
+                # Stale signatures: every file is parsed again on the next listing
+                entry['files'] = {name: (None, summary) for name, (_, summary) in entry['files'].items()}
+            elif filename in entry['files']:
+                entry['files'][filename] = (None, entry['files'][filename][1])
+            entry['dir_mtime'] = None
+
+    def _refresh(self, category: str, path: str, summaries: bool = True) -> Optional[Dict]:
+        """Bring the category entry up to date with the directory (lock held)"""
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            entry = self._categories.pop(category, None)
+            for filename in (entry['files'] if entry else {}):
+                self._notify(category, filename, None, None)
+            return None
+
+        entry = self._categories.get(category)
+        if entry is None or entry['path'] != path:
+            entry = {'path': path, 'dir_mtime': None, 'names': [], 'files': {}, 'checked_at': 0.0,
+                     'complete': False, 'version': None}
+            self._categories[category] = entry
+
+        now = time.monotonic()
+        listing_changed = entry['dir_mtime'] != dir_mtime
+        if listing_changed:
+            entry['names'] = sorted(
+                filename for filename in os.listdir(path)
+                if filename.endswith('.json') and not filename.startswith('_')
+            )
+            entry['dir_mtime'] = dir_mtime
+
+        if not summaries:
+            return entry
+        if not listing_changed and entry['complete'] and now - entry['checked_at'] < FILE_RECHECK_SECONDS:
+            return entry
+
+        files = {}
+        for filename in entry['names']:
+            file_path = os.path.join(path, filename)
+            try:
+                signature = file_signature(os.stat(file_path))
+            except FileNotFoundError:
+                continue
+            cached = entry['files'].get(filename)
+            if cached is not None and cached[0] == signature:
+                files[filename] = cached
+            else:
+                files[filename] = (signature, self._summarize_file(category, file_path, filename))
+        for filename in entry['files']:
+            if filename not in files:
+                self._notify(category, filename, None, None)
+        if entry['version'] is None or files.keys() != entry['files'].keys() or any(
+                files[filename][0] != entry['files'][filename][0] for filename in files):
+            # Same files with the same signatures means the same content, in any worker
+            fingerprint = json.dumps([[filename, files[filename][0]] for filename in files])
+            entry['version'] = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+        entry['files'] = files
+        entry['checked_at'] = now
+        entry['complete'] = True
+        return entry
+
+    def _summarize_file(self, category: str, file_path: str, filename: str) -> Optional[Dict]:
+        """Parse one file into its summary; None (cached until the file changes) if it can't be read"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            summary = self.summarize(category, data, filename)
+            summary['id'] = filename.replace('.json', '')
+            summary['filename'] = filename
+        except Exception as e:
+            logger.error(f"Error reading {file_path}: {e}")
+            data, summary = None, None
+        self._notify(category, filename, data, summary)
+        return summary
+
+    def _notify(self, category: str, filename: str, data, summary: Optional[Dict]):
+        """Report a parsed or removed file to on_change; its errors never break a listing"""
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(category, filename, data, summary)
+        except Exception as e:
+            logger.error(f"Error handling change of {category}/{filename}: {e}")
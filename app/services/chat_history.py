@@ -0,0 +1,138 @@
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationHistoryStore:
+    """Conversation-scoped chat history loaded lazily from Message rows.
+
+    The database is the source of truth, so every worker sees the same history.
+    A small in-memory LRU avoids reloading a conversation on every turn; an entry
+    is only reused while its last assistant message is still the latest one in
+    the database, and entries are evicted by count and by total text size.
+    """
+
+    def __init__(self, max_turns: int = 3, max_conversations: int = 256, max_chars: int = 2_000_000):
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.max_chars = max_chars
+        self._cache: "OrderedDict[int, Dict]" = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get_history(self, conversation_id: Optional[int]) -> List[Dict]:
+        """Return the last turns of a conversation as [{'user': ..., 'assistant': ...}]"""
+        if not conversation_id:
+            return []
+
+        try:
+            latest_id = self._latest_assistant_message_id(conversation_id)
+        except Exception as e:
+            logger.error(f"Error checking history for conversation {conversation_id}: {e}")
+            return []
+
+        if latest_id is None:
+            return []
+
+        with self._lock:
+            entry = self._cache.get(conversation_id)
+            if entry and entry['last_message_id'] == latest_id:
+                self._cache.move_to_end(conversation_id)
+                return list(entry['turns'])
+
+        try:
+            turns = self._load_turns(conversation_id)
+        except Exception as e:
+            logger.error(f"Error loading history for conversation {conversation_id}: {e}")
+            return []
+
+        self._put(conversation_id, turns, latest_id)
+        return list(turns)
+
+    def append_turn(self, conversation_id: int, user_content: str, assistant_content: str,
+                    assistant_message_id: int):
+        """Record a committed turn so the next request doesn't have to reload it"""
+        if not conversation_id:
+            return
+
+        with self._lock:
+            entry = self._cache.get(conversation_id)
+            turns = list(entry['turns']) if entry else None
+
+        if turns is None:
+            # Not cached yet: the next get_history() will load it from the database
+            return
+
+        turns.append({'user': user_content, 'assistant': assistant_content})
+        self._put(conversation_id, turns[-self.max_turns:], assistant_message_id)
+
+    def invalidate(self, conversation_id: int):
+        """Drop a conversation from the cache"""
+        with self._lock:
+            entry = self._cache.pop(conversation_id, None)
+            if entry:
+                self._total_chars -= entry['size']
+
+    def get_stats(self) -> Dict:
+        """Cache occupancy"""
+        with self._lock:
+            return {
+                'conversations': len(self._cache),
+                'total_chars': self._total_chars,
+                'max_conversations': self.max_conversations,
+                'max_chars': self.max_chars
+            }
+
+    def _put(self, conversation_id: int, turns: List[Dict], last_message_id: int):
+        """Insert or replace a cache entry and evict least recently used ones"""
+        size = sum(len(t['user']) + len(t['assistant']) for t in turns)
+
+        with self._lock:
+            previous = self._cache.pop(conversation_id, None)
+            if previous:
+                self._total_chars -= previous['size']
+
+            self._cache[conversation_id] = {
+                'turns': turns,
+                'last_message_id': last_message_id,
+                'size': size
+            }
+            self._total_chars += size
+
+            while self._cache and (len(self._cache) > self.max_conversations or
+                                   self._total_chars > self.max_chars):
+                _, evicted = self._cache.popitem(last=False)
+                self._total_chars -= evicted['size']
+
+    def _latest_assistant_message_id(self, conversation_id: int) -> Optional[int]:
+        """Cheap indexed lookup used to validate a cached entry"""
+        from app import db
+        from app.models import Message
+
+        return db.session.query(db.func.max(Message.id)).filter(
+            Message.conversation_id == conversation_id,
+            Message.role == 'assistant'
+        ).scalar()
+
+    def _load_turns(self, conversation_id: int) -> List[Dict]:
+        """Load the last N user/assistant pairs of a conversation"""
+        from app.models import Message
+
+        rows = Message.query.filter_by(conversation_id=conversation_id)\
+            .order_by(Message.id.desc())\
+            .limit(self.max_turns * 2 + 2)\
+            .all()
+
+        turns = []
+        pending_user = None
+        for row in reversed(rows):
+            if row.role == 'user':
+                pending_user = row.content
+            elif row.role == 'assistant' and pending_user is not None:
+                turns.append({'user': pending_user, 'assistant': row.content})
+                pending_user = None
+
+        return turns[-self.max_turns:]
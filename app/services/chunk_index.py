@@ -0,0 +1,95 @@
+import re
+import json
+import bisect
+import unicodedata
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'[^\W_]+')  # Words; '_' separates them too, as in file names
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents so 'Résine' and 'resine' match"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalized word tokens of a text, in order ('composite_1_face.json' -> composite, 1, face, json)"""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+class ChunkIndex:
+    """Inverted indexes over the data chunks of one analysis run.
+
+    - names: every contiguous run of tokens of a chunk name (e.g. 'case 12'
+      for 'case_12.json'), so a pattern reference resolves with one lookup
+    - terms: sorted vocabulary of the normalized chunk contents with postings,
+      so rule keywords match by prefix ('implant' finds 'implants')
+
+    Built once per run; lookups cost in proportion to their hits, not to the
+    number of chunks.
+    """
+
+    def __init__(self, chunks: List[Dict]):
+        self.chunks = chunks
+        self._name_parts: Dict[Tuple[str, ...], Set[int]] = defaultdict(set)
+        self._full_names: Dict[Tuple[str, ...], Set[int]] = defaultdict(set)
+        self._longest_name = 0
+        postings: Dict[str, Set[int]] = defaultdict(set)
+
+        for position, chunk in enumerate(chunks):
+            name_tokens = tuple(tokenize(chunk['name']))
+            self._full_names[name_tokens].add(position)
+            self._longest_name = max(self._longest_name, len(name_tokens))
+            for start in range(len(name_tokens)):
+                for end in range(start + 1, len(name_tokens) + 1):
+                    self._name_parts[name_tokens[start:end]].add(position)
+
+            text = json.dumps(chunk['content'], ensure_ascii=False)
+            for token in set(tokenize(text)):
+                postings[token].add(position)
+
+        self._vocabulary = sorted(postings)
+        self._postings = postings
+        logger.info(f"Indexed {len(chunks)} chunks: {len(self._vocabulary)} terms, {len(self._name_parts)} name keys")
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def by_reference(self, refs: Iterable[str]) -> List[Dict]:
+        """Chunks whose name contains a reference, or that a reference names"""
+        hits = set()
+        for ref in refs:
+            ref_tokens = tuple(tokenize(str(ref)))
+            if not ref_tokens:
+                continue
+            # Reference is part of a chunk name ('case_12' -> 'case_12.json')
+            hits.update(self._name_parts.get(ref_tokens, ()))
+            # Reference mentions a full chunk name ('voir case_12.json')
+            for start in range(len(ref_tokens)):
+                for end in range(start + 1, min(len(ref_tokens), start + self._longest_name) + 1):
+                    hits.update(self._full_names.get(ref_tokens[start:end], ()))
+        return [self.chunks[position] for position in sorted(hits)]
+
+    def by_keywords(self, keywords: Iterable[str], limit: int = None) -> List[Dict]:
+        """Chunks whose content has a word starting with any keyword.
+
+        Ranked by the number of keywords matched, then chunk order.
+        """
+        scores: Dict[int, int] = defaultdict(int)
+        for keyword in set(keywords):
+            matched = set()
+            for prefix in tokenize(keyword):
+                position = bisect.bisect_left(self._vocabulary, prefix)
+                while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+                    matched.update(self._postings[self._vocabulary[position]])
+                    position += 1
+            for chunk_position in matched:
+                scores[chunk_position] += 1
+        ranked = sorted(scores, key=lambda position: (-scores[position], position))
+        matches = [self.chunks[position] for position in ranked]
+        return matches[:limit] if limit is not None else matches
@@ -1,11 +1,24 @@
 import os
+import re
 import json
 import uuid
+import base64
+import bisect
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable, Iterator
+from app.services.data_storage import STORAGE_BACKENDS, FileTreeStorage, SQLiteStorage, copy_items
+from app.services.search_index import DataSearchIndex
+from app.services.chunk_index import normalize_text
+
+# Sort keys of item listings ('-' prefix for descending)
+SORT_KEYS = ('id', 'title', 'created_at', 'rating')
+MAX_ID_ATTEMPTS = 20
+# Ids double as file names: no separators, no leading dot
+ITEM_ID_PATTERN = re.compile(r'^\w[\w.-]*$')
+MAX_REPORTED_IMPORT_ERRORS = 20
 
 class DataService:
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, backend: str = 'files', database_path: Optional[str] = None):
         self.data_dir = data_dir
         
         # Verify data directory exists
@@ -49,6 +62,103 @@ class DataService:
                 'file_pattern': 'approved_sequence_*.json'
             }
         }
+        
+        # Parsed item summaries, shared by listings, counts and search; the
+        # search index follows every item the storage loads or loses
+        self.search_index = DataSearchIndex(self._load_abbreviations())
+        self.storage = self._create_storage(backend, database_path)
+    
+    def _create_storage(self, backend: str, database_path: Optional[str]):
+        """The file tree (default) or an SQLite database, seeded from the file tree when new"""
+        if backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Invalid storage backend: {backend}")
+        if backend == 'files':
+            storage = FileTreeStorage(self.data_dir, self.categories, self._extract_item_summary,
+                                      on_change=self._on_item_change)
+            try:
+                storage.compact_trash()
+            except OSError as e:
+                print(f"Error compacting the trash: {e}")
+            return storage
+        
+        storage = SQLiteStorage(database_path or os.path.join(self.data_dir, 'data_store.sqlite3'),
+                                self.categories, self._extract_item_summary, on_change=self._on_item_change)
+        if storage.is_empty():
+            copied = copy_items(self._file_tree(), storage, list(self.categories))
+            print(f"Imported {sum(copied.values())} items from the file tree into {storage.path}")
+        print("SQLite storage does not feed the knowledge base: edits are not indexed until exported to the file tree")
+        return storage
+    
+    def _file_tree(self, data_dir: Optional[str] = None) -> FileTreeStorage:
+        """A plain view of the DATA file layout, whatever the active backend"""
+        return FileTreeStorage(data_dir or self.data_dir, self.categories, self._extract_item_summary)
+    
+    def import_file_tree(self) -> Dict[str, int]:
+        """Copy every item of the DATA file layout into the active storage"""
+        if isinstance(self.storage, FileTreeStorage):
+            raise ValueError("The file tree is already the active storage")
+        return copy_items(self._file_tree(), self.storage, list(self.categories))
+    
+    def export_file_tree(self, data_dir: Optional[str] = None) -> Dict[str, int]:
+        """Write every item of the active storage as files of the DATA layout (in data_dir, default DATA)"""
+        if isinstance(self.storage, FileTreeStorage) and data_dir in (None, self.data_dir):
+            raise ValueError("The file tree is already the active storage")
+        return copy_items(self.storage, self._file_tree(data_dir), list(self.categories))
+
+    def export_ndjson(self, categories: Optional[List[str]] = None) -> Iterator[str]:
+        """Every item as one JSON line {"category", "id", "data"}, read one item at a time"""
+        categories = categories or list(self.categories)
+        for category in categories:
+            if category not in self.categories:
+                raise ValueError(f"Invalid category: {category}")
+        
+        # Validated up front: the lines are produced lazily, once the response is streaming
+        return (
+            json.dumps({'category': category, 'id': item_id, 'data': data}, ensure_ascii=False) + '\n'
+            for category in categories
+            for item_id, data in self.storage.iter_items(category)
+        )
+    
+    def import_ndjson(self, lines: Iterable) -> Dict[str, Any]:
+        """Create or replace the items of NDJSON lines as one storage write.
+        
+        Invalid rows are skipped and reported with their line number; valid
+        rows are streamed to the storage, so memory use does not grow with
+        the input.
+        """
+        report = {'imported': {}, 'rejected': 0, 'errors': []}
+        
+        def valid_rows():
+            for number, line in enumerate(lines, 1):
+                try:
+                    if isinstance(line, bytes):
+                        line = line.decode('utf-8')
+                    if not line.strip():
+                        continue
+                    yield self._parse_import_row(line)
+                except ValueError as e:
+                    report['rejected'] += 1
+                    if len(report['errors']) < MAX_REPORTED_IMPORT_ERRORS:
+                        report['errors'].append({'line': number, 'error': str(e)})
+        
+        report['imported'] = self.storage.import_rows(valid_rows())
+        return report
+    
+    def _parse_import_row(self, line: str):
+        """(category, id, data) of an NDJSON row; ValueError if it is not a valid item"""
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError("Row is not an object")
+        category, item_id, data = row.get('category'), row.get('id'), row.get('data')
+        if category not in self.categories:
+            raise ValueError(f"Invalid category: {category}")
+        if not isinstance(item_id, str) or not ITEM_ID_PATTERN.match(item_id):
+            raise ValueError(f"Invalid id: {item_id}")
+        if not isinstance(data, (dict, list)):
+            raise ValueError("data must be an object or an array")
+        if isinstance(data, dict):
+            data.pop('_metadata', None)
+        return category, item_id, data
 
     def get_categories(self) -> List[Dict[str, Any]]:
         """Get all available categories with their metadata"""
@@ -60,12 +170,10 @@ class DataService:
         for key, info in self.categories.items():
             category_path = os.path.join(self.data_dir, info['path'])
             
-            if os.path.exists(category_path):
+            if self.storage.available(key):
                 try:
                     # Count items in category
-                    files = os.listdir(category_path)
-                    item_count = len([f for f in files 
-                                    if f.endswith('.json') and not f.startswith('_')])
+                    item_count = self.storage.count(key) or 0
                     
                     categories_list.append({
                         'key': key,  # Changed from 'id' to 'key' to match what the logging expects
@@ -88,55 +196,108 @@ class DataService:
         if category not in self.categories:
             raise ValueError(f"Invalid category: {category}")
         
-        category_info = self.categories[category]
-        category_path = os.path.join(self.data_dir, category_info['path'])
-        
-        items = []
-        if os.path.exists(category_path):
-            for filename in sorted(os.listdir(category_path)):
-                if filename.endswith('.json') and not filename.startswith('_'):
-                    file_path = os.path.join(category_path, filename)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            
-                        # Extract summary info based on category
-                        item_summary = self._extract_item_summary(category, data, filename)
-                        item_summary['id'] = filename.replace('.json', '')
-                        item_summary['filename'] = filename
-                        items.append(item_summary)
-                    except Exception as e:
-                        print(f"Error reading {file_path}: {e}")
-        
-        return items
+        # Summaries are parsed once per item version and served from memory
+        return self.storage.items(category)
 
-    def get_item(self, category: str, item_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific item by category and ID"""
+    def list_items(self, category: str, sort: str = 'id', cursor: Optional[str] = None,
+                   limit: int = 50, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """One page of a category listing, in a stable sort order.
+        
+        The cursor encodes the sort key and id of the last item returned, so
+        pages stay consistent while items are added or removed. 'version'
+        changes whenever any item of the category does.
+        """
         if category not in self.categories:
             raise ValueError(f"Invalid category: {category}")
+        descending = sort.startswith('-')
+        sort_key = sort.lstrip('-')
+        if sort_key not in SORT_KEYS:
+            raise ValueError(f"Invalid sort key: {sort_key}")
+        
+        items, version = self.storage.listing(category)
         
-        category_info = self.categories[category]
-        category_path = os.path.join(self.data_dir, category_info['path'])
-        file_path = os.path.join(category_path, f"{item_id}.json")
+        ordered = sorted((self._sort_value(item, sort_key), item['id'], item) for item in items)
+        keys = [(value, item_id) for value, item_id, _ in ordered]
+        
+        position = self._decode_cursor(cursor, sort)
+        if descending:
+            end = bisect.bisect_left(keys, position) if position else len(keys)
+            page = ordered[max(0, end - limit):end][::-1]
+            has_more = end - limit > 0
+        else:
+            start = bisect.bisect_right(keys, position) if position else 0
+            page = ordered[start:start + limit]
+            has_more = start + limit < len(keys)
+        
+        next_cursor = self._encode_cursor(sort, page[-1][:2]) if page and has_more else None
+        return {
+            'items': [self._project(item, fields) for _, _, item in page],
+            'next_cursor': next_cursor,
+            'total': len(items),
+            'version': version
+        }
+    
+    def item_version(self, category: str, item_id: str) -> Optional[str]:
+        """Version of an item, without reading it"""
+        if category not in self.categories:
+            raise ValueError(f"Invalid category: {category}")
         
-        if os.path.exists(file_path):
+        return self.storage.version(category, item_id)
+    
+    def _sort_value(self, item: Dict[str, Any], sort_key: str):
+        """Comparable value of an item's sort key (missing values sort first)"""
+        if sort_key == 'rating':
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                return float(item.get('rating') or 0)
+            except (TypeError, ValueError):
+                return 0.0
+        if sort_key == 'title':
+            return normalize_text(str(item.get('title') or ''))
+        return str(item.get(sort_key) or '')
+    
+    def _encode_cursor(self, sort: str, position) -> str:
+        """Opaque cursor for the (sort value, id) of the last item of a page"""
+        return base64.urlsafe_b64encode(json.dumps([sort, *position]).encode('utf-8')).decode('ascii')
+    
+    def _decode_cursor(self, cursor: Optional[str], sort: str):
+        """(sort value, id) a page starts after; None for the first page"""
+        if not cursor:
+            return None
+        try:
+            cursor_sort, value, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if cursor_sort != sort:
+            raise ValueError("Cursor does not match the sort order")
+        return value, item_id
+    
+    def _project(self, item: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+        """Copy of an item restricted to the requested fields (id is always kept)"""
+        if not fields:
+            return dict(item)
+        return {key: item[key] for key in ['id'] + [f for f in fields if f != 'id'] if key in item}
+    
+    def get_item(self, category: str, item_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific item by category and ID"""
+        if category not in self.categories:
+            raise ValueError(f"Invalid category: {category}")
+        
+        try:
+            stored = self.storage.read(category, item_id)
+            if stored is not None:
+                data, last_modified = stored
                 
                 # Add metadata
                 data['_metadata'] = {
                     'id': item_id,
                     'category': category,
                     'filename': f"{item_id}.json",
-                    'last_modified': datetime.fromtimestamp(
-                        os.path.getmtime(file_path)
-                    ).isoformat()
+                    'last_modified': last_modified
                 }
                 
                 return data
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
+        except Exception as e:
+            print(f"Error reading {category}/{item_id}: {e}")
         
         return None
 
@@ -145,13 +306,6 @@ class DataService:
         if category not in self.categories:
             raise ValueError(f"Invalid category: {category}")
         
-        category_info = self.categories[category]
-        category_path = os.path.join(self.data_dir, category_info['path'])
-        file_path = os.path.join(category_path, f"{item_id}.json")
-        
-        if not os.path.exists(file_path):
-            return False
-        
         try:
             # Remove metadata if present
             if '_metadata' in data:
@@ -160,13 +314,9 @@ class DataService:
             # Add update timestamp
             data['last_updated'] = datetime.now().isoformat()
             
-            # Write updated data
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            return True
+            return self.storage.update(category, item_id, data)
         except Exception as e:
-            print(f"Error updating {file_path}: {e}")
+            print(f"Error updating {category}/{item_id}: {e}")
             return False
 
     def create_item(self, category: str, data: Dict[str, Any]) -> Optional[str]:
@@ -174,25 +324,17 @@ class DataService:
         if category not in self.categories:
             raise ValueError(f"Invalid category: {category}")
         
-        category_info = self.categories[category]
-        category_path = os.path.join(self.data_dir, category_info['path'])
-        
-        # Ensure directory exists
-        os.makedirs(category_path, exist_ok=True)
-        
         try:
-            # Generate ID based on category
-            item_id = self._generate_item_id(category, category_path)
-            
             # Add creation timestamp
             data['created_at'] = datetime.now().isoformat()
             
-            # Write data
-            file_path = os.path.join(category_path, f"{item_id}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            return item_id
+            # A taken id (same-second timestamp, concurrent create) moves on to the next candidate
+            for attempt in range(MAX_ID_ATTEMPTS):
+                item_id = self._generate_item_id(category, attempt)
+                if self.storage.create(category, item_id, data):
+                    return item_id
+            print(f"Error creating item: no free id in {category}")
+            return None
         except Exception as e:
             print(f"Error creating item: {e}")
             return None
@@ -202,45 +344,56 @@ class DataService:
         if category not in self.categories:
             raise ValueError(f"Invalid category: {category}")
         
-        category_info = self.categories[category]
-        category_path = os.path.join(self.data_dir, category_info['path'])
-        file_path = os.path.join(category_path, f"{item_id}.json")
-        
-        if os.path.exists(file_path):
-            try:
-                # Create backup before deletion
-                backup_path = file_path + '.backup'
-                os.rename(file_path, backup_path)
-                return True
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
-                return False
-        
-        return False
+        try:
+            return self.storage.delete(category, item_id)
+        except Exception as e:
+            print(f"Error deleting {category}/{item_id}: {e}")
+            return False
 
-    def search_items(self, query: str, category: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Search items across categories"""
-        query_lower = query.lower()
-        results = []
-        
-        categories_to_search = [category] if category else self.categories.keys()
+    def search_items(self, query: str, category: Optional[str] = None,
+                     page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+        """Ranked full-text search across categories, one page at a time"""
+        categories_to_search = [cat for cat in ([category] if category else self.categories.keys())
+                                if cat in self.categories]
         
+        # Index only items changed since the last search (no reads otherwise)
         for cat in categories_to_search:
-            if cat not in self.categories:
-                continue
-                
-            items = self.get_items_by_category(cat)
-            for item in items:
-                # Search in title and description
-                if (query_lower in item.get('title', '').lower() or 
-                    query_lower in item.get('description', '').lower() or
-                    query_lower in item.get('treatment_type', '').lower()):
-                    
-                    item['category'] = cat
-                    item['category_name'] = self.categories[cat]['name']
-                    results.append(item)
+            self.storage.refresh(cat)
+        
+        page = max(1, page)
+        hits, total = self.search_index.search(
+            query, categories_to_search, offset=(page - 1) * per_page, limit=per_page
+        )
+        results = [
+            dict(summary, category=cat, category_name=self.categories[cat]['name'], score=score)
+            for score, cat, summary in hits
+        ]
         
-        return results
+        return {
+            'results': results,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }
+    
+    def _on_item_change(self, category: str, filename: str, data: Any, summary: Optional[Dict]):
+        """Keep the search index in step with the storage"""
+        item_id = filename.replace('.json', '')
+        if summary is None:
+            self.search_index.remove(category, item_id)
+        else:
+            self.search_index.add(category, item_id, data, summary)
+    
+    def _load_abbreviations(self) -> Dict[str, str]:
+        """Dental abbreviations used to expand indexed texts and queries"""
+        abbrev_path = os.path.join(self.data_dir, 'IDEAL_SEQUENCES', 'dental_abbreviations.json')
+        try:
+            if os.path.exists(abbrev_path):
+                with open(abbrev_path, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('abbreviations', {})
+        except Exception as e:
+            print(f"Error loading abbreviations: {e}")
+        return {}
 
     def _extract_item_summary(self, category: str, data: Dict[str, Any], filename: str) -> Dict[str, Any]:
         """Extract summary information based on category type"""
@@ -287,6 +440,10 @@ class DataService:
             summary['approved_date'] = data.get('approved_date', '')
             summary['tags'] = data.get('keywords', [])
         
+        # Sort key of listings
+        if isinstance(data, dict):
+            summary['created_at'] = data.get('created_at') or data.get('approved_date') or ''
+        
         return summary
 
     def _extract_first_content(self, data: Any) -> str:
@@ -301,30 +458,24 @@ class DataService:
         
         return ''
 
-    def _generate_item_id(self, category: str, category_path: str) -> str:
-        """Generate a unique ID for a new item"""
+    def _generate_item_id(self, category: str, attempt: int = 0) -> str:
+        """Generate a unique ID for a new item (attempt > 0 after the previous candidate was taken)"""
         if category == 'clinical_cases':
-            # Find the highest number
-            max_num = 0
-            for filename in os.listdir(category_path):
-                if filename.startswith('treatment_planning_') and filename.endswith('.json'):
-                    try:
-                        num = int(filename.replace('treatment_planning_', '').replace('.json', ''))
-                        max_num = max(max_num, num)
-                    except:
-                        pass
-            return f"treatment_planning_{max_num + 1}"
+            # Next number of the clinical case sequence
+            return f"treatment_planning_{self.storage.next_sequence(category, 'treatment_planning_')}"
         
-        elif category == 'ideal_sequences':
+        # Timestamps get a counter suffix when the same second is already taken
+        suffix = f"_{attempt + 1}" if attempt else ''
+        if category == 'ideal_sequences':
             # Use timestamp for ideal sequences
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            return f"ideal_sequence_custom_{timestamp}"
+            return f"ideal_sequence_custom_{timestamp}{suffix}"
         
         elif category == 'approved_sequences':
             # Use timestamp for approved sequences
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            return f"approved_sequence_{timestamp}"
+            return f"approved_sequence_{timestamp}{suffix}"
         
         else:
             # Use UUID for other categories
-            return f"custom_{uuid.uuid4().hex[:8]}"
\ No newline at end of file
+            return f"custom_{uuid.uuid4().hex[:8]}"
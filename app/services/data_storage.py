@@ -0,0 +1,560 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.category_catalog import CategoryCatalog
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ('files', 'sqlite')
+IMPORT_BATCH_SIZE = 200  # Rows per statement (and per read) when importing or exporting
+TRASH_DIRECTORY = '.trash'  # Under DATA: deleted items, out of the category directories
+LOCK_DIRECTORY = '.locks'  # Under DATA: per-category write locks
+TRASH_RETENTION_DAYS = 30
+
+Summarize = Callable[[str, Any, str], Dict]
+OnChange = Callable[[str, str, Any, Optional[Dict]], None]
+
+
+class FileTreeStorage:
+    """Items as one pretty-printed JSON file each, in a directory per category.
+
+    This is the historic DATA layout that the knowledge base scripts and the
+    brain read directly. Summaries are served by a CategoryCatalog.
+
+    Writes go to a temporary file that is fsync'ed and renamed over the item,
+    so readers never see a partial file, under a per-category lock shared by
+    all workers. Deleted items move to DATA/.trash/<category>/ (kept
+    TRASH_RETENTION_DAYS) so they stay out of the listings.
+    """
+
+    name = 'files'
+    feeds_knowledge_base = True  # The knowledge base build, watcher and brain read these files
+
+    def __init__(self, data_dir: str, categories: Dict[str, Dict], summarize: Summarize,
+                 on_change: Optional[OnChange] = None):
+        self.data_dir = data_dir
+        self.categories = categories
+        self.catalog = CategoryCatalog(summarize, on_change=on_change)
+
+    def _path(self, category: str) -> str:
+        return os.path.join(self.data_dir, self.categories[category]['path'])
+
+    def _file(self, category: str, item_id: str) -> str:
+        return os.path.join(self._path(category), f"{item_id}.json")
+
+    # Reading
+
+    def available(self, category: str) -> bool:
+        return os.path.exists(self._path(category))
+
+    def count(self, category: str) -> Optional[int]:
+        return self.catalog.count(category, self._path(category))
+
+    def items(self, category: str) -> List[Dict]:
+        return self.catalog.items(category, self._path(category))
+
+    def listing(self, category: str) -> Tuple[List[Dict], Optional[str]]:
+        return self.catalog.listing(category, self._path(category))
+
+    def refresh(self, category: str):
+        self.catalog.refresh(category, self._path(category))
+
+    def version(self, category: str, item_id: str) -> Optional[str]:
+        """mtime and size of the item file, without reading it"""
+        try:
+            stat = os.stat(self._file(category, item_id))
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def read(self, category: str, item_id: str) -> Optional[Tuple[Any, str]]:
+        """Item data and last modification time; None if it does not exist"""
+        file_path = self._file(category, item_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data, datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+
+    def iter_items(self, category: str) -> Iterator[Tuple[str, Any]]:
+        """(id, data) of every item, one file at a time"""
+        path = self._path(category)
+        if not os.path.exists(path):
+            return
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith('.json') or filename.startswith('_'):
+                continue
+            try:
+                with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                    yield filename[:-len('.json')], json.load(f)
+            except Exception as e:
+                logger.error(f"Skipping unreadable {category}/{filename}: {e}")
+
+    def next_sequence(self, category: str, prefix: str) -> int:
+        """One more than the largest number among ids with this prefix"""
+        path = self._path(category)
+        filenames = os.listdir(path) if os.path.exists(path) else []
+        return _max_sequence((filename[:-len('.json')] for filename in filenames if filename.endswith('.json')), prefix) + 1
+
+    # Writing
+
+    def create(self, category: str, item_id: str, data: Any) -> bool:
+        """Write a new item; False if the id is already taken"""
+        with self._category_lock(category):
+            os.makedirs(self._path(category), exist_ok=True)
+            if not self._write_json(self._file(category, item_id), data, exclusive=True):
+                return False
+        self.catalog.invalidate(category, f"{item_id}.json")
+        return True
+
+    def update(self, category: str, item_id: str, data: Any) -> bool:
+        """Replace an existing item; False if it does not exist"""
+        file_path = self._file(category, item_id)
+        with self._category_lock(category):
+            if not os.path.exists(file_path):
+                return False
+            self._write_json(file_path, data)
+        self.catalog.invalidate(category, f"{item_id}.json")
+        return True
+
+    def delete(self, category: str, item_id: str) -> bool:
+        """Move an item to the trash"""
+        file_path = self._file(category, item_id)
+        with self._category_lock(category):
+            if not os.path.exists(file_path):
+                return False
+            trash_dir = os.path.join(self.data_dir, TRASH_DIRECTORY, category)
+            os.makedirs(trash_dir, exist_ok=True)
+            deleted_at = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            os.rename(file_path, os.path.join(trash_dir, f"{item_id}.{deleted_at}.json"))
+            _fsync_directory(self._path(category))
+        self.catalog.invalidate(category, f"{item_id}.json")
+        return True
+
+    def import_rows(self, rows: Iterable[Tuple[str, str, Any]]) -> Dict[str, int]:
+        """Create or replace (category, id, data) rows, one file at a time; counts per category"""
+        counts: Dict[str, int] = {}
+        for category, item_id, data in rows:
+            with self._category_lock(category):
+                if category not in counts:
+                    os.makedirs(self._path(category), exist_ok=True)
+                    counts[category] = 0
+                self._write_json(self._file(category, item_id), data)
+            counts[category] += 1
+        for category in counts:
+            self.catalog.invalidate(category)
+        return counts
+
+    def compact_trash(self, retention_days: int = TRASH_RETENTION_DAYS) -> Dict[str, int]:
+        """Purge trashed items past retention and move legacy .backup files out of the category directories"""
+        counts = {'moved': 0, 'purged': 0}
+        for category in self.categories:
+            path = self._path(category)
+            if not os.path.exists(path):
+                continue
+            backups = [filename for filename in os.listdir(path) if filename.endswith('.json.backup')]
+            if not backups:
+                continue
+            trash_dir = os.path.join(self.data_dir, TRASH_DIRECTORY, category)
+            os.makedirs(trash_dir, exist_ok=True)
+            with self._category_lock(category):
+                for filename in backups:
+                    item_id = filename[:-len('.json.backup')]
+                    # Retention starts now: a backup's mtime is the item's last write, not its deletion
+                    deleted_at = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                    os.rename(os.path.join(path, filename), os.path.join(trash_dir, f"{item_id}.{deleted_at}.json"))
+                    counts['moved'] += 1
+
+        # The deletion time is in the trash file name
+        cutoff = (datetime.now() - timedelta(days=retention_days)).timestamp()
+        trash_root = os.path.join(self.data_dir, TRASH_DIRECTORY)
+        for category in (os.listdir(trash_root) if os.path.exists(trash_root) else []):
+            trash_dir = os.path.join(trash_root, category)
+            for filename in os.listdir(trash_dir):
+                trashed_at = _trashed_at(filename)
+                if trashed_at is not None and trashed_at.timestamp() < cutoff:
+                    os.remove(os.path.join(trash_dir, filename))
+                    counts['purged'] += 1
+
+        if any(counts.values()):
+            logger.info(f"Trash compaction: {counts['moved']} backups moved, {counts['purged']} purged")
+        return counts
+
+    def _write_json(self, file_path: str, data: Any, exclusive: bool = False) -> bool:
+        """Durably write a JSON file via a temporary file; with exclusive, False if it already exists"""
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            if exclusive:
+                try:
+                    os.link(tmp_path, file_path)  # Atomic, and fails if the name is taken
+                except FileExistsError:
+                    return False
+            else:
+                os.replace(tmp_path, file_path)
+            _fsync_directory(os.path.dirname(file_path))
+            return True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @contextmanager
+    def _category_lock(self, category: str):
+        """Exclusive write lock of a category, shared by all workers"""
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(self.data_dir, LOCK_DIRECTORY)
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{category}.lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLiteStorage:
+    """Items as JSON rows of an embedded SQLite database.
+
+    Every write is one transaction and bumps the revision of its category;
+    rows carry the revision they were written at. Summaries are computed on
+    write and kept in memory per category; a listing only compares the
+    category revision, then loads the rows written since (by any process).
+    Numbered ids come from a per-prefix sequence, so they never need a scan
+    and never repeat.
+
+    Storage only: the knowledge base, its watcher and build, and the brain
+    read the DATA file tree, so edits made here are not searchable until
+    they are exported to it (DataService.export_file_tree).
+    """
+
+    name = 'sqlite'
+    feeds_knowledge_base = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            category TEXT NOT NULL,
+            id TEXT NOT NULL,
+            data TEXT NOT NULL CHECK (json_valid(data)),
+            summary TEXT NOT NULL CHECK (json_valid(summary)),
+            created_at TEXT NOT NULL DEFAULT '',
+            updated_at TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            PRIMARY KEY (category, id)
+        );
+        CREATE INDEX IF NOT EXISTS items_by_created ON items (category, created_at);
+        CREATE INDEX IF NOT EXISTS items_by_revision ON items (category, revision);
+        CREATE TABLE IF NOT EXISTS categories (
+            category TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, categories: Dict[str, Dict], summarize: Summarize,
+                 on_change: Optional[OnChange] = None):
+        self.path = path
+        self.categories = categories
+        self.summarize = summarize
+        self.on_change = on_change
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Dict] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def _connection(self) -> '_Transaction':
+        """This thread's connection (WAL, so readers never wait for the writer)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA busy_timeout=30000')
+            self._local.connection = connection
+        return _Transaction(connection)
+
+    # Reading
+
+    def available(self, category: str) -> bool:
+        return category in self.categories
+
+    def is_empty(self) -> bool:
+        with self._connection() as connection:
+            return connection.execute('SELECT 1 FROM items LIMIT 1').fetchone() is None
+
+    def count(self, category: str) -> Optional[int]:
+        with self._lock:
+            return len(self._refresh(category)['items'])
+
+    def items(self, category: str) -> List[Dict]:
+        with self._lock:
+            return [dict(summary) for summary in self._refresh(category)['items'].values()]
+
+    def listing(self, category: str) -> Tuple[List[Dict], Optional[str]]:
+        with self._lock:
+            entry = self._refresh(category)
+            return list(entry['items'].values()), f"{entry['revision']:x}"
+
+    def refresh(self, category: str):
+        with self._lock:
+            self._refresh(category)
+
+    def version(self, category: str, item_id: str) -> Optional[str]:
+        """Revision the item was last written at"""
+        with self._connection() as connection:
+            row = connection.execute(
+                'SELECT revision FROM items WHERE category = ? AND id = ?', (category, item_id)
+            ).fetchone()
+        return None if row is None else f"{row[0]:x}"
+
+    def read(self, category: str, item_id: str) -> Optional[Tuple[Any, str]]:
+        with self._connection() as connection:
+            row = connection.execute(
+                'SELECT data, updated_at FROM items WHERE category = ? AND id = ?', (category, item_id)
+            ).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def iter_items(self, category: str) -> Iterator[Tuple[str, Any]]:
+        """(id, data) of every item in id order, fetched in batches"""
+        last_id = ''
+        while True:
+            with self._connection() as connection:
+                rows = connection.execute(
+                    'SELECT id, data FROM items WHERE category = ? AND id > ? ORDER BY id LIMIT ?',
+                    (category, last_id, IMPORT_BATCH_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            for item_id, data in rows:
+                yield item_id, json.loads(data)
+            last_id = rows[-1][0]
+
+    def next_sequence(self, category: str, prefix: str) -> int:
+        """Next number of the category's sequence for this id prefix (seeded from existing ids)"""
+        name = f"{category}:{prefix}"
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT value FROM sequences WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                ids = connection.execute(
+                    "SELECT id FROM items WHERE category = ? AND substr(id, 1, ?) = ?",
+                    (category, len(prefix), prefix)
+                ).fetchall()
+                value = _max_sequence((item_id for item_id, in ids), prefix) + 1
+                connection.execute('INSERT INTO sequences (name, value) VALUES (?, ?)', (name, value))
+            else:
+                value = row[0] + 1
+                connection.execute('UPDATE sequences SET value = ? WHERE name = ?', (value, name))
+            return value
+
+    # Writing
+
+    def create(self, category: str, item_id: str, data: Any) -> bool:
+        """Insert a new item; False if the id is already taken"""
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            revision = self._bump(connection, category)
+            try:
+                connection.execute(
+                    'INSERT INTO items (category, id, data, summary, created_at, updated_at, revision) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    self._row(category, item_id, data, revision)
+                )
+            except sqlite3.IntegrityError:
+                connection.rollback()
+                return False
+        return True
+
+    def update(self, category: str, item_id: str, data: Any) -> bool:
+        """Replace an existing item; False if it does not exist"""
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            revision = self._bump(connection, category)
+            _, _, payload, summary, created_at, updated_at, _ = self._row(category, item_id, data, revision)
+            cursor = connection.execute(
+                'UPDATE items SET data = ?, summary = ?, created_at = ?, updated_at = ?, revision = ? '
+                'WHERE category = ? AND id = ?',
+                (payload, summary, created_at, updated_at, revision, category, item_id)
+            )
+            if cursor.rowcount == 0:
+                connection.rollback()
+                return False
+        return True
+
+    def delete(self, category: str, item_id: str) -> bool:
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._bump(connection, category)
+            cursor = connection.execute('DELETE FROM items WHERE category = ? AND id = ?', (category, item_id))
+            if cursor.rowcount == 0:
+                connection.rollback()
+                return False
+        return True
+
+    def import_rows(self, rows: Iterable[Tuple[str, str, Any]]) -> Dict[str, int]:
+        """Create or replace (category, id, data) rows in one transaction, written in batches"""
+        counts: Dict[str, int] = {}
+        revisions: Dict[str, int] = {}
+        batch = []
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            for category, item_id, data in rows:
+                if category not in revisions:
+                    revisions[category] = self._bump(connection, category)
+                    counts[category] = 0
+                batch.append(self._row(category, item_id, data, revisions[category]))
+                counts[category] += 1
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self._insert_or_replace(connection, batch)
+                    batch = []
+            if batch:
+                self._insert_or_replace(connection, batch)
+        return counts
+
+    # Internals
+
+    def _insert_or_replace(self, connection: sqlite3.Connection, rows: List[Tuple]):
+        connection.executemany(
+            'INSERT OR REPLACE INTO items (category, id, data, summary, created_at, updated_at, revision) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    def _row(self, category: str, item_id: str, data: Any, revision: int) -> Tuple:
+        """Column values of an item"""
+        filename = f"{item_id}.json"
+        summary = self.summarize(category, data, filename)
+        summary['id'] = item_id
+        summary['filename'] = filename
+        return (
+            category, item_id,
+            json.dumps(data, ensure_ascii=False),
+            json.dumps(summary, ensure_ascii=False),
+            summary.get('created_at') or '',
+            datetime.now().isoformat(),
+            revision
+        )
+
+    def _bump(self, connection: sqlite3.Connection, category: str) -> int:
+        """Increment and return the category revision (inside the write transaction)"""
+        connection.execute(
+            'INSERT INTO categories (category, revision) VALUES (?, 1) '
+            'ON CONFLICT (category) DO UPDATE SET revision = revision + 1',
+            (category,)
+        )
+        return connection.execute('SELECT revision FROM categories WHERE category = ?', (category,)).fetchone()[0]
+
+    def _refresh(self, category: str) -> Dict:
+        """Bring the in-memory summaries of a category up to its revision (lock held)"""
+        entry = self._cache.setdefault(category, {'revision': 0, 'items': {}})
+        with self._connection() as connection:
+            row = connection.execute('SELECT revision FROM categories WHERE category = ?', (category,)).fetchone()
+            revision = row[0] if row else 0
+            if revision == entry['revision']:
+                return entry
+
+            changed = connection.execute(
+                'SELECT id, data, summary FROM items WHERE category = ? AND revision > ? ORDER BY id',
+                (category, entry['revision'])
+            ).fetchall()
+            live = {item_id for item_id, in connection.execute(
+                'SELECT id FROM items WHERE category = ?', (category,)
+            )}
+
+        for item_id in [item_id for item_id in entry['items'] if item_id not in live]:
+            del entry['items'][item_id]
+            self._notify(category, item_id, None, None)
+        for item_id, data, summary in changed:
+            entry['items'][item_id] = json.loads(summary)
+            self._notify(category, item_id, json.loads(data), entry['items'][item_id])
+        if changed:
+            entry['items'] = dict(sorted(entry['items'].items()))
+        entry['revision'] = revision
+        return entry
+
+    def _notify(self, category: str, item_id: str, data, summary: Optional[Dict]):
+        """Report a loaded or removed item to on_change; its errors never break a listing"""
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(category, f"{item_id}.json", data, summary)
+        except Exception as e:
+            logger.error(f"Error handling change of {category}/{item_id}: {e}")
+
+
+class _Transaction:
+    """Context manager over a connection in autocommit mode: commits an open transaction on success"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.connection.in_transaction:
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        return False
+
+
+def _fsync_directory(path: str):
+    """Persist renames in a directory (no-op where directories can't be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _trashed_at(filename: str) -> Optional[datetime]:
+    """Deletion time encoded in a trash file name (<id>.<YYYYmmdd_HHMMSS_ffffff>.json)"""
+    try:
+        return datetime.strptime(filename.rsplit('.', 2)[-2], '%Y%m%d_%H%M%S_%f')
+    except (IndexError, ValueError):
+        return None
+
+
+def _max_sequence(item_ids: Iterator[str], prefix: str) -> int:
+    """Largest number n among ids of the form prefix + n (0 if none)"""
+    largest = 0
+    for item_id in item_ids:
+        if item_id.startswith(prefix) and item_id[len(prefix):].isdigit():
+            largest = max(largest, int(item_id[len(prefix):]))
+    return largest
+
+
+def copy_items(source, target, categories: List[str]) -> Dict[str, int]:
+    """Copy every item of the categories from one storage to another, streaming"""
+    counts = target.import_rows(
+        (category, item_id, data) for category in categories for item_id, data in source.iter_items(category)
+    )
+    return {category: counts.get(category, 0) for category in categories}
@@ -0,0 +1,171 @@
+import os
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.category_catalog import file_signature
+from app.services.knowledge_base import (
+    KNOWLEDGE_BASE_PATH, SOURCE_DIRECTORIES, apply_source_changes, load_abbreviation_table
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+WATCH_INTERVAL_SECONDS = 5.0
+
+
+class DataWatcher:
+    """Polls the knowledge base source directories and hot-reloads changed files.
+
+    Every interval, each source directory is listed and its files stat'ed;
+    (mtime, size) signatures are compared with the previous snapshot to find
+    added, changed and removed files. Only their knowledge base entries are
+    regenerated, then notify() queues one incremental index update.
+
+    Only the process holding the watcher lock (a non-blocking flock) scans
+    and writes; the others retry the lock every interval and take over if
+    the leader exits. The snapshot is persisted, so files dropped in while
+    no process was watching are picked up on the next start.
+    """
+
+    def __init__(self, data_dir: str, notify: Optional[Callable[..., int]] = None,
+                 interval: float = WATCH_INTERVAL_SECONDS, knowledge_base_path: str = KNOWLEDGE_BASE_PATH):
+        self.data_dir = data_dir
+        self.notify = notify
+        self.interval = interval
+        self.knowledge_base_path = knowledge_base_path
+        self.snapshot_path = f"{knowledge_base_path}.watch.json"
+        self.lock_path = f"{knowledge_base_path}.watcher.lock"
+        self.is_leader = False
+        self._lock_file = None
+        self._snapshot: Optional[Dict[str, Dict[str, List[int]]]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the flock
+            self._lock_file = None
+            self.is_leader = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.is_leader or self._acquire_leadership():
+                    self.poll()
+            except Exception as e:
+                logger.error(f"❌ Data watcher poll failed: {e}")
+            self._stop.wait(self.interval)
+
+    def _acquire_leadership(self) -> bool:
+        """Try to become the one process that watches (non-blocking)"""
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.is_leader = True
+        logger.info(f"👀 Watching {', '.join(SOURCE_DIRECTORIES.values())} for knowledge base changes")
+        return True
+
+    def poll(self) -> Dict[str, int]:
+        """Scan once and apply what changed since the last snapshot"""
+        current = self._scan()
+        previous = self._snapshot if self._snapshot is not None else self._load_snapshot()
+        if previous is None:
+            # First run ever: the knowledge base was built from these files
+            self._snapshot = current
+            self._save_snapshot()
+            return {'added': 0, 'updated': 0, 'removed': 0}
+
+        changes = self._diff(previous, current)
+        if not changes:
+            self._snapshot = current
+            return {'added': 0, 'updated': 0, 'removed': 0}
+
+        counts = apply_source_changes(changes, load_abbreviation_table(), self.knowledge_base_path)
+        self._snapshot = current
+        self._save_snapshot()
+        logger.info(f"🔄 Knowledge base hot-reload: {counts['added']} added, {counts['updated']} updated, "
+                    f"{counts['removed']} removed")
+        if any(counts.values()) and self.notify is not None:
+            self.notify('knowledge_base', None, 'watch')
+        return counts
+
+    def _scan(self) -> Dict[str, Dict[str, List[int]]]:
+        """Signature of every source file, per entry type"""
+        snapshot = {}
+        for entry_type, directory in SOURCE_DIRECTORIES.items():
+            path = os.path.join(self.data_dir, directory)
+            files = {}
+            for filename in (os.listdir(path) if os.path.exists(path) else []):
+                if not filename.endswith('.json') or filename.startswith('_'):
+                    continue
+                try:
+                    files[filename] = list(file_signature(os.stat(os.path.join(path, filename))))
+                except FileNotFoundError:
+                    continue
+            snapshot[entry_type] = files
+        return snapshot
+
+    def _diff(self, previous: Dict, current: Dict) -> List[Tuple[str, str, Optional[Dict]]]:
+        """(entry type, filename, data) of added or changed files, with data None for removed ones"""
+        changes = []
+        for entry_type, files in current.items():
+            before = previous.get(entry_type, {})
+            for filename in sorted(files):
+                if before.get(filename) == files[filename]:
+                    continue
+                # Unreadable files are skipped until their signature changes again (end of a write)
+                data = self._read(entry_type, filename)
+                if data is not None:
+                    changes.append((entry_type, filename, data))
+            changes.extend((entry_type, filename, None) for filename in sorted(before) if filename not in files)
+        return changes
+
+    def _read(self, entry_type: str, filename: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.data_dir, SOURCE_DIRECTORIES[entry_type], filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else None
+        except Exception as e:
+            logger.warning(f"Could not read {filename}: {e}")
+            return None
+
+    def _load_snapshot(self) -> Optional[Dict]:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading watcher snapshot, starting over: {e}")
+            return None
+
+    def _save_snapshot(self):
+        try:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._snapshot, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.error(f"Error saving watcher snapshot: {e}")
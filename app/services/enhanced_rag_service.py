@@ -2,12 +2,18 @@ import os
 import json
 import logging
 import re
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import chromadb
 from chromadb.utils import embedding_functions
 from openai import OpenAI
 from dotenv import load_dotenv
+from app.services.telemetry import span
+from app.services.brain_cache import content_hash
+from app.services.knowledge_base import (
+    KNOWLEDGE_BASE_PATH, approved_sequence_entry, expand_abbreviations, load_abbreviation_table, upsert_entry
+)
 
 # Load environment variables
 load_dotenv()
@@ -36,6 +42,9 @@ class EnhancedRAGService:
         # Load dental abbreviations
         self.abbreviations = self._load_abbreviations()
         
+        # Serializes full reindexes and incremental syncs
+        self._index_lock = threading.Lock()
+        
     def initialize(self):
         """Initialize or get existing collections with enhanced data"""
         try:
@@ -86,7 +95,7 @@ class EnhancedRAGService:
     
     def _load_enhanced_knowledge_base(self):
         """Load the enhanced knowledge base from disk"""
-        knowledge_base_file = Path("DATA/ENHANCED_KNOWLEDGE/comprehensive_knowledge_base.json")
+        knowledge_base_file = Path(KNOWLEDGE_BASE_PATH)
         
         if not knowledge_base_file.exists():
             logger.warning(f"Enhanced knowledge base not found at {knowledge_base_file}")
@@ -109,66 +118,7 @@ class EnhancedRAGService:
             logger.warning("No enhanced knowledge base data to index")
             return
         
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, entry in enumerate(self.enhanced_knowledge_base['data']):
-            # OPTIMIZATION: Use ONLY consultation text for embedding
-            # This ensures direct consultation-to-consultation matching
-            consultation_text = entry.get('consultation_text', entry.get('title', ''))
-            
-            if not consultation_text:
-                logger.warning(f"Skipping entry {i} - no consultation text found")
-                continue
-            
-            # Create two versions: original and expanded
-            original_consultation = consultation_text
-            expanded_consultation = self._expand_abbreviations(consultation_text)
-            
-            # Combine both for better matching flexibility
-            # This allows matching both "26 CC + TR" and "26 Couronne céramique + Traitement de racine"
-            if original_consultation != expanded_consultation:
-                document = f"{original_consultation}\n{expanded_consultation}"
-            else:
-                document = original_consultation
-            
-            # Create comprehensive metadata with better titles
-            # Use the entry's title if available (especially important for approved sequences)
-            title = entry.get('title', consultation_text)
-            
-            # Make ideal sequence titles more descriptive if no title provided
-            if not entry.get('title') and entry.get('type') == 'ideal_sequence':
-                filename = entry.get('filename', f'entry_{i}')
-                if 'sequence' in filename.lower():
-                    # Extract meaningful part from filename
-                    clean_filename = filename.replace('_', ' ').replace('.docx', '').replace('.json', '')
-                    title = f"{clean_filename} - {consultation_text}".strip(' -')
-            
-            metadata = {
-                'filename': entry.get('filename', f'entry_{i}'),
-                'type': entry.get('type', 'unknown'),
-                'source': entry.get('source', 'unknown'),
-                'title': title,
-                'consultation_text': consultation_text,
-                'consultation_text_expanded': expanded_consultation,
-                'has_sequence': 'treatment_sequence' in entry,
-                'has_enhanced_sequence': 'treatment_sequence_enhanced' in entry,
-                'entry_index': i  # Store index to retrieve full data later
-            }
-            
-            # Add categories if available (for metadata, not for embedding)
-            categories = []
-            if 'treatment_sequence_enhanced' in entry:
-                for appointment in entry['treatment_sequence_enhanced']:
-                    if 'categories' in appointment:
-                        categories.extend(appointment['categories'])
-            
-            metadata['categories'] = ','.join(set(categories)) if categories else ''
-            
-            documents.append(document)
-            metadatas.append(metadata)
-            ids.append(f"enhanced_{i}")
+        ids, documents, metadatas = self._build_index_entries(self.enhanced_knowledge_base)
         
         # Add documents to collection
         self.enhanced_collection.add(
@@ -179,44 +129,98 @@ class EnhancedRAGService:
         
         logger.info(f"✅ Indexed {len(documents)} enhanced documents")
     
-    def _load_abbreviations(self) -> Dict[str, str]:
-        """Load dental abbreviations from JSON file"""
-        try:
-            abbrev_path = Path("DATA/IDEAL_SEQUENCES/dental_abbreviations.json")
-            if abbrev_path.exists():
-                with open(abbrev_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('abbreviations', {})
-            else:
-                logger.warning(f"Abbreviations file not found at {abbrev_path}")
-                return {}
-        except Exception as e:
-            logger.error(f"Error loading abbreviations: {e}")
-            return {}
+    def _build_index_entries(self, knowledge_base: Dict) -> Tuple[List[str], List[str], List[Dict]]:
+        """Ids, documents and metadatas of the knowledge base entries, as stored in the collection"""
+        documents = []
+        metadatas = []
+        ids = []
+        
+        for i, entry in enumerate(knowledge_base['data']):
+            indexed = self._index_entry(i, entry)
+            if indexed is None:
+                continue
+            entry_id, document, metadata = indexed
+            documents.append(document)
+            metadatas.append(metadata)
+            ids.append(entry_id)
+        
+        return ids, documents, metadatas
     
-    def _expand_abbreviations(self, text: str) -> str:
-        """Expand dental abbreviations in text to match indexed content"""
-        if not text or not self.abbreviations:
-            return text
+    def _index_entry(self, i: int, entry: Dict) -> Optional[Tuple[str, str, Dict]]:
+        """Collection id, document and metadata of the entry at position i; None if it has nothing to embed"""
+        # OPTIMIZATION: Use ONLY consultation text for embedding
+        # This ensures direct consultation-to-consultation matching
+        consultation_text = entry.get('consultation_text', entry.get('title', ''))
+        
+        if not consultation_text:
+            logger.warning(f"Skipping entry {i} - no consultation text found")
+            return None
         
-        expanded = text
+        # Create two versions: original and expanded (precomputed by the knowledge base build)
+        original_consultation = consultation_text
+        expanded_consultation = entry.get('consultation_text_expanded') or self._expand_abbreviations(consultation_text)
+        
+        # Combine both for better matching flexibility
+        # This allows matching both "26 CC + TR" and "26 Couronne céramique + Traitement de racine"
+        if original_consultation != expanded_consultation:
+            document = f"{original_consultation}\n{expanded_consultation}"
+        else:
+            document = original_consultation
+        
+        # Create comprehensive metadata with better titles
+        # Use the entry's title if available (especially important for approved sequences)
+        title = entry.get('title', consultation_text)
+        
+        # Make ideal sequence titles more descriptive if no title provided
+        if not entry.get('title') and entry.get('type') == 'ideal_sequence':
+            filename = entry.get('filename', f'entry_{i}')
+            if 'sequence' in filename.lower():
+                # Extract meaningful part from filename
+                clean_filename = filename.replace('_', ' ').replace('.docx', '').replace('.json', '')
+                title = f"{clean_filename} - {consultation_text}".strip(' -')
+        
+        metadata = {
+            'filename': entry.get('filename', f'entry_{i}'),
+            'type': entry.get('type', 'unknown'),
+            'source': entry.get('source', 'unknown'),
+            'title': title,
+            'consultation_text': consultation_text,
+            'consultation_text_expanded': expanded_consultation,
+            'has_sequence': 'treatment_sequence' in entry,
+            'has_enhanced_sequence': 'treatment_sequence_enhanced' in entry,
+            'entry_index': i  # Store index to retrieve full data later
+        }
         
-        # Sort by length (longest first) to avoid partial replacements
-        sorted_abbrevs = sorted(self.abbreviations.items(), key=lambda x: len(x[0]), reverse=True)
+        # Add categories if available (for metadata, not for embedding)
+        categories = list(entry.get('categories') or [])
+        if not categories and 'treatment_sequence_enhanced' in entry:
+            for appointment in entry['treatment_sequence_enhanced']:
+                if 'categories' in appointment:
+                    categories.extend(appointment['categories'])
         
-        for abbrev, full_term in sorted_abbrevs:
-            # Replace whole words only
-            pattern = r'\b' + re.escape(abbrev) + r'\b'
-            expanded = re.sub(pattern, full_term, expanded, flags=re.IGNORECASE)
+        metadata['categories'] = ','.join(sorted(set(categories))) if categories else ''
+        # Lets incremental syncs skip entries whose document and metadata are unchanged
+        metadata['content_hash'] = content_hash([document, metadata])
         
-        return expanded
+        return f"enhanced_{i}", document, metadata
+    
+    def _load_abbreviations(self) -> Dict[str, str]:
+        """Load dental abbreviations from JSON file"""
+        return load_abbreviation_table()['abbreviations']
+    
+    def _expand_abbreviations(self, text: str) -> str:
+        """Expand dental abbreviations in text to match indexed content"""
+        return expand_abbreviations(text, self.abbreviations)
     
     def search_discovered_rules(self, query: str, n_results: int = 5,
                               confidence_threshold: int = 60) -> List[Dict]:
         """Search discovered rules from Brain analysis"""
         try:
             # Get discovered rules collection
-            collection = self.client.get_collection("discovered_rules")
+            collection = self.client.get_collection(
+                "discovered_rules",
+                embedding_function=self.embedding_function
+            )
             
             # Preprocess query
             searchable_query = self._expand_abbreviations(query.strip())
@@ -282,10 +286,11 @@ class EnhancedRAGService:
                 searchable_query = original_query
             
             # Search in enhanced collection
-            results = self.enhanced_collection.query(
-                query_texts=[searchable_query],
-                n_results=n_results
-            )
+            with span('rag.knowledge'):
+                results = self.enhanced_collection.query(
+                    query_texts=[searchable_query],
+                    n_results=n_results
+                )
             
             # Format results with similarity scores and enhanced data
             formatted_results = []
@@ -365,11 +370,12 @@ class EnhancedRAGService:
             else:
                 searchable_query = original_query
             
-            results = self.enhanced_collection.query(
-                query_texts=[searchable_query],
-                n_results=n_results,
-                where={"type": {"$eq": search_type}}
-            )
+            with span(f'rag.{search_type}'):
+                results = self.enhanced_collection.query(
+                    query_texts=[searchable_query],
+                    n_results=n_results,
+                    where={"type": {"$eq": search_type}}
+                )
             
             return self._format_search_results(results)
             
@@ -756,21 +762,22 @@ class EnhancedRAGService:
     def reindex_all(self):
         """Reindex all enhanced knowledge"""
         try:
-            collection_name = "enhanced_dental_knowledge_v3"  # Use v3 for consultation-only embeddings
-            
-            # Delete existing collection
-            if self.enhanced_collection:
-                self.client.delete_collection(name=collection_name)
-            
-            # Recreate collection with new embeddings
-            self.enhanced_collection = self.client.create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
-            )
-            
-            # Reload and reindex
-            self._load_enhanced_knowledge_base()
-            self._index_enhanced_knowledge()
+            with self._index_lock:
+                collection_name = "enhanced_dental_knowledge_v3"  # Use v3 for consultation-only embeddings
+                
+                # Delete existing collection
+                if self.enhanced_collection:
+                    self.client.delete_collection(name=collection_name)
+                
+                # Recreate collection with new embeddings
+                self.enhanced_collection = self.client.create_collection(
+                    name=collection_name,
+                    embedding_function=self.embedding_function
+                )
+                
+                # Reload and reindex
+                self._load_enhanced_knowledge_base()
+                self._index_enhanced_knowledge()
             
             return {
                 'success': True,
@@ -783,4 +790,93 @@ class EnhancedRAGService:
             return {
                 'success': False,
                 'message': str(e)
-            }
\ No newline at end of file
+            }
+    
+    def sync_index(self):
+        """Bring the collection in line with the knowledge base on disk, embedding only changed entries"""
+        try:
+            with self._index_lock:
+                self._load_enhanced_knowledge_base()
+                if self.enhanced_collection is None:
+                    self.enhanced_collection = self.client.get_or_create_collection(
+                        name="enhanced_dental_knowledge_v3",
+                        embedding_function=self.embedding_function,
+                        metadata={"hnsw:space": "cosine"}
+                    )
+                
+                ids, documents, metadatas = self._build_index_entries(self.enhanced_knowledge_base)
+                existing = self.enhanced_collection.get(include=['documents', 'metadatas'])
+                indexed = {
+                    entry_id: (document, metadata or {})
+                    for entry_id, document, metadata in zip(existing['ids'], existing['documents'], existing['metadatas'])
+                }
+                
+                # New or edited consultation text needs an embedding; other changes only touch metadata
+                embed, relabel = [], []
+                for position, entry_id in enumerate(ids):
+                    stored = indexed.get(entry_id)
+                    if stored is None or stored[0] != documents[position]:
+                        embed.append(position)
+                    elif stored[1].get('content_hash') != metadatas[position]['content_hash']:
+                        relabel.append(position)
+                wanted = set(ids)
+                removed = [entry_id for entry_id in indexed if entry_id not in wanted]
+                
+                if embed:
+                    self.enhanced_collection.upsert(
+                        ids=[ids[i] for i in embed],
+                        documents=[documents[i] for i in embed],
+                        metadatas=[metadatas[i] for i in embed]
+                    )
+                if relabel:
+                    self.enhanced_collection.update(
+                        ids=[ids[i] for i in relabel],
+                        metadatas=[metadatas[i] for i in relabel]
+                    )
+                if removed:
+                    self.enhanced_collection.delete(ids=removed)
+                
+                logger.info(f"🔄 Index synced: {len(embed)} embedded, {len(relabel)} updated, "
+                            f"{len(removed)} removed, {len(ids) - len(embed) - len(relabel)} unchanged")
+                return {
+                    'success': True,
+                    'entries': len(ids),
+                    'embedded': len(embed),
+                    'updated': len(relabel),
+                    'deleted': len(removed)
+                }
+        
+        except Exception as e:
+            logger.error(f"❌ Error syncing index: {str(e)}")
+            return {
+                'success': False,
+                'message': str(e)
+            }
+    
+    def ingest_approved_sequence(self, data: Dict, filename: str) -> Dict:
+        """Add one approved sequence to the knowledge base and the collection, embedding only it"""
+        try:
+            entry = approved_sequence_entry(data, filename)
+            with self._index_lock:
+                knowledge_base, position = upsert_entry(entry)
+                self.enhanced_knowledge_base = knowledge_base
+                
+                indexed = self._index_entry(position, entry)
+                if indexed is not None and self.enhanced_collection is not None:
+                    entry_id, document, metadata = indexed
+                    self.enhanced_collection.upsert(ids=[entry_id], documents=[document], metadatas=[metadata])
+            
+            logger.info(f"✅ Ingested approved sequence {filename} as entry {position}")
+            return {
+                'success': True,
+                'entry_index': position,
+                'indexed': indexed is not None,
+                'entries': len(knowledge_base['data'])
+            }
+        
+        except Exception as e:
+            logger.error(f"❌ Error ingesting approved sequence {filename}: {str(e)}")
+            return {
+                'success': False,
+                'message': str(e)
+            }
@@ -0,0 +1,125 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 2.0  # Quiet period after the last change before the index is updated
+MAX_DELAY_SECONDS = 10.0  # A steady stream of changes still gets applied this often
+RETRY_SECONDS = 30.0  # Wait before retrying a failed update
+
+
+class IndexMaintenanceWorker:
+    """Background thread applying data changes to the search index.
+
+    Edits report change events with notify() and return immediately. Events
+    are coalesced until no new one has arrived for DEBOUNCE_SECONDS (or the
+    oldest has waited MAX_DELAY_SECONDS), then apply(events) runs once for the
+    whole batch. Every event bumps pending_generation; applied_generation
+    catches up to the last generation included in a successful update, so
+    callers can tell whether their change is searchable yet.
+    """
+
+    def __init__(self, apply: Callable[[List[Dict]], Any],
+                 debounce: float = DEBOUNCE_SECONDS, max_delay: float = MAX_DELAY_SECONDS):
+        self.apply = apply
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.pending_generation = 0
+        self.applied_generation = 0
+        self.last_applied_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._events: List[Dict] = []
+        self._first_event_at: Optional[float] = None
+        self._last_event_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, category: str, item_id: Optional[str] = None, op: str = 'update') -> int:
+        """Queue a change and return its generation"""
+        with self._condition:
+            self.pending_generation += 1
+            now = time.monotonic()
+            self._events.append({
+                'category': category,
+                'item_id': item_id,
+                'op': op,
+                'generation': self.pending_generation
+            })
+            if self._first_event_at is None:
+                self._first_event_at = now
+            self._last_event_at = now
+            self._ensure_thread()
+            self._condition.notify()
+            return self.pending_generation
+
+    def status(self) -> Dict:
+        """Generations and the outcome of the last update"""
+        with self._condition:
+            return {
+                'pending_generation': self.pending_generation,
+                'applied_generation': self.applied_generation,
+                'queued_events': len(self._events),
+                'up_to_date': self.applied_generation >= self.pending_generation,
+                'last_applied_at': self.last_applied_at,
+                'last_error': self.last_error
+            }
+
+    def wait(self, generation: int, timeout: Optional[float] = None) -> bool:
+        """Block until the given generation is applied; False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.applied_generation >= generation, timeout)
+
+    def _ensure_thread(self):
+        """Start the worker thread on first use (condition held)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='index-maintenance', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> List[Dict]:
+        """Wait until the queued events are due and take them"""
+        with self._condition:
+            while True:
+                if not self._events:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                due = min(self._last_event_at + self.debounce, self._first_event_at + self.max_delay)
+                if self._retry_at is not None:
+                    due = max(due, self._retry_at)
+                if now >= due:
+                    batch, self._events = self._events, []
+                    self._first_event_at = self._last_event_at = None
+                    return batch
+                self._condition.wait(due - now)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            generation = batch[-1]['generation']
+            started = time.time()
+            try:
+                result = self.apply(batch)
+                if isinstance(result, dict) and result.get('success') is False:
+                    raise RuntimeError(result.get('message', 'index update failed'))
+            except Exception as e:
+                logger.error(f"❌ Index update for {len(batch)} changes failed, retrying: {e}")
+                with self._condition:
+                    # Put the batch back ahead of anything that arrived meanwhile
+                    self._events = batch + self._events
+                    now = time.monotonic()
+                    self._first_event_at = self._last_event_at = now
+                    self._retry_at = now + RETRY_SECONDS
+                    self.last_error = str(e)
+                continue
+
+            with self._condition:
+                self.applied_generation = max(self.applied_generation, generation)
+                self.last_applied_at = time.time()
+                self.last_error = None
+                self._retry_at = None
+                self._condition.notify_all()
+            logger.info(f"🔄 Applied {len(batch)} data changes to the index in "
+                        f"{time.time() - started:.1f}s (generation {generation})")
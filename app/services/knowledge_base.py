@@ -0,0 +1,388 @@
+import os
+import re
+import json
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_PATH = os.path.join('DATA', 'ENHANCED_KNOWLEDGE', 'comprehensive_knowledge_base.json')
+ABBREVIATIONS_PATH = os.path.join('DATA', 'IDEAL_SEQUENCES', 'dental_abbreviations.json')
+APPROVED_SEQUENCE_MIN_RATING = 9  # Approved sequences rated this high are used by the RAG
+DEFAULT_CATEGORY = 'Général'
+
+# Knowledge base entry type -> directory of its source files under DATA
+SOURCE_DIRECTORIES = {
+    'ideal_sequence': 'IDEAL_SEQUENCES_ENHANCED',
+    'clinical_case': 'TRAITEMENTS_JSON'
+}
+IDEAL_SEQUENCES_SOURCE = 'IDEAL_SEQUENCES_JSON'  # Ideal sequences as extracted, before enhancement
+
+# Data category -> knowledge base entry type of its items and their directory under DATA
+CATEGORY_SOURCES = {
+    'clinical_cases': ('clinical_case', SOURCE_DIRECTORIES['clinical_case']),
+    'ideal_sequences': ('ideal_sequence', SOURCE_DIRECTORIES['ideal_sequence']),
+    'approved_sequences': ('approved_sequence', 'APPROVED_SEQUENCES')
+}
+
+HALF_DAY_MINUTES = 240
+DELAY_UNIT_DAYS = (('sem', 7), ('mois', 30), ('jour', 1), ('j', 1))  # Prefix of the unit -> days
+
+
+def load_abbreviation_table(path: str = ABBREVIATIONS_PATH) -> Dict:
+    """Abbreviations and category keywords; empty tables if the file is missing"""
+    table = {'abbreviations': {}, 'categories': {}}
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                table.update(json.load(f))
+        else:
+            logger.warning(f"Abbreviations file not found at {path}")
+    except Exception as e:
+        logger.error(f"Error loading abbreviations: {e}")
+    return table
+
+
+def expand_abbreviations(text: str, abbreviations: Dict[str, str]) -> str:
+    """Replace whole-word abbreviations with their expansion, longest first"""
+    if not text or not abbreviations:
+        return text
+
+    expanded = text
+    for abbrev, full_term in sorted(abbreviations.items(), key=lambda x: len(x[0]), reverse=True):
+        pattern = r'\b' + re.escape(abbrev) + r'\b'
+        expanded = re.sub(pattern, full_term, expanded, flags=re.IGNORECASE)
+    return expanded
+
+
+def appointment_categories(texts: List[str], category_keywords: Dict[str, List[str]]) -> List[str]:
+    """Categories whose keywords appear in any of the texts; the default category if none does"""
+    found = [
+        category for category, keywords in category_keywords.items()
+        if any(re.search(r'\b' + re.escape(keyword) + r'\b', text, flags=re.IGNORECASE)
+               for keyword in keywords for text in texts if text)
+    ]
+    return found or [DEFAULT_CATEGORY]
+
+
+def parse_duration_minutes(text) -> Optional[int]:
+    """Minutes of an appointment duration ('1h15', '30 min.', '½ jour'); the first one of alternatives"""
+    text = str(text or '').lower().split('/')[0]
+    match = re.search(r'(\d+)\s*h\s*(\d+)?', text)
+    if match:
+        return int(match.group(1)) * 60 + int(match.group(2) or 0)
+    match = re.search(r'(\d+)\s*(?:min|mn)', text)
+    if match:
+        return int(match.group(1))
+    if '½ jour' in text or 'demi' in text:
+        return HALF_DAY_MINUTES
+    return None
+
+
+def parse_delay_days(text) -> Optional[int]:
+    """Days of a delay before an appointment ('1 sem.', '2 à 3 sem', '3.5 mois'); the lower bound of ranges"""
+    match = re.search(r'(\d+(?:[.,]\d+)?)\s*(?:(?:à|-)\s*\d+(?:[.,]\d+)?\s*)?([a-zé]+)', str(text or '').lower())
+    if not match:
+        return None
+    value = float(match.group(1).replace(',', '.'))
+    unit = match.group(2)
+    for prefix, days in DELAY_UNIT_DAYS:
+        if unit.startswith(prefix):
+            return round(value * days)
+    if unit.startswith(('h', 'min', 'mn')):
+        return 0
+    return None
+
+
+def sequence_appointments(sequence) -> List[Dict]:
+    """Appointments of a treatment sequence; those of every option when it has several"""
+    if isinstance(sequence, dict):
+        sequence = [appointment for option in sequence.values() if isinstance(option, list) for appointment in option]
+    return [appointment for appointment in (sequence or []) if isinstance(appointment, dict)]
+
+
+def enhance_appointments(sequence, table: Dict) -> List[Dict]:
+    """Appointments with expanded texts, categories and structured duration and delay"""
+    abbreviations = table.get('abbreviations', {})
+    enhanced = []
+    for appointment in sequence_appointments(sequence):
+        appointment = dict(appointment)
+        for field in ('traitement', 'delai', 'dr', 'remarque'):
+            appointment[f"{field}_expanded"] = expand_abbreviations(str(appointment.get(field) or ''), abbreviations)
+        appointment['categories'] = appointment_categories(
+            [appointment.get('traitement') or '', appointment['traitement_expanded']], table.get('categories', {})
+        )
+        appointment['duree_minutes'] = parse_duration_minutes(appointment.get('duree'))
+        appointment['delai_days'] = parse_delay_days(appointment.get('delai'))
+        enhanced.append(appointment)
+    return enhanced
+
+
+def render_appointment_line(appointment: Dict) -> str:
+    """Context line of an enhanced appointment, as the prompts present structured sequences"""
+    line = f"  RDV {appointment.get('rdv', '')}: {appointment.get('traitement_expanded', appointment.get('traitement', ''))}"
+    if appointment.get('duree'):
+        line += f" ({appointment['duree']})"
+    if appointment.get('delai'):
+        line += f" → attendre {appointment['delai']}"
+    return line
+
+
+def sequence_summary(enhanced: List[Dict]) -> Dict:
+    """Entry fields precomputed from the enhanced appointments"""
+    return {
+        'categories': sorted({category for appointment in enhanced for category in appointment['categories']}),
+        'total_duration_minutes': sum(appointment['duree_minutes'] or 0 for appointment in enhanced),
+        'total_delay_days': sum(appointment['delai_days'] or 0 for appointment in enhanced),
+        'context_lines': [render_appointment_line(appointment) for appointment in enhanced]
+    }
+
+
+def enhanced_ideal_sequence(data: Dict, table: Dict) -> Dict:
+    """Enhanced version of an extracted ideal sequence (the IDEAL_SEQUENCES_ENHANCED file format)"""
+    consultation_text = data.get('consultation_text', '')
+    sequence = data.get('treatment_sequence', [])
+    enhanced = enhance_appointments(sequence, table)
+    summary = sequence_summary(enhanced)
+    consultation_expanded = expand_abbreviations(consultation_text, table.get('abbreviations', {}))
+    searchable_content = '\n'.join([
+        f"Séquence idéale: {consultation_text}",
+        f"Séquence idéale étendue: {consultation_expanded}",
+        f"Traitements: {'; '.join(str(a.get('traitement') or '') for a in sequence_appointments(sequence))}",
+        f"Traitements étendus: {'; '.join(a['traitement_expanded'] for a in enhanced)}",
+        f"Catégories: {', '.join(summary['categories'])}"
+    ])
+    return dict(
+        data,
+        consultation_text_expanded=consultation_expanded,
+        treatment_sequence_enhanced=enhanced,
+        searchable_content=searchable_content,
+        content=searchable_content,
+        **summary
+    )
+
+
+def ideal_sequence_entry(data: Dict, filename: str) -> Dict:
+    """Knowledge base entry for an enhanced ideal sequence file (already expanded and categorized)"""
+    return dict(data, filename=filename, source='dentist_guidelines', type='ideal_sequence')
+
+
+def clinical_case_entry(data: Dict, filename: str, table: Dict) -> Dict:
+    """Knowledge base entry for a clinical case file, with expanded texts, categories and durations"""
+    consultation_text = data.get('consultation_text', '')
+    sequence = data.get('treatment_sequence', [])
+    enhanced = enhance_appointments(sequence, table)
+    summary = sequence_summary(enhanced)
+    consultation_expanded = expand_abbreviations(consultation_text, table.get('abbreviations', {}))
+    return {
+        'consultation_text': consultation_text,
+        'treatment_sequence': sequence,
+        'filename': filename,
+        'source': 'clinical_cases',
+        'type': 'clinical_case',
+        'consultation_text_expanded': consultation_expanded,
+        'treatment_sequence_enhanced': enhanced,
+        'searchable_content': '\n'.join([
+            f"Consultation: {consultation_text}",
+            f"Consultation étendue: {consultation_expanded}",
+            f"Traitements: {', '.join(str(a.get('traitement') or '') for a in sequence_appointments(sequence))}",
+            f"Traitements étendus: {', '.join(a['traitement_expanded'] for a in enhanced)}",
+            f"Catégories: {', '.join(summary['categories'])}"
+        ]),
+        **summary
+    }
+
+
+def source_entry(entry_type: str, data: Dict, filename: str, table: Dict) -> Dict:
+    """Knowledge base entry of a source file of the given type"""
+    if entry_type == 'ideal_sequence':
+        return ideal_sequence_entry(data, filename)
+    if entry_type == 'clinical_case':
+        return clinical_case_entry(data, filename, table)
+    if entry_type == 'approved_sequence':
+        return approved_sequence_entry(data, filename)
+    raise ValueError(f"No source files for entry type: {entry_type}")
+
+
+def approved_sequence_entry(data: Dict, filename: str) -> Dict:
+    """Knowledge base entry for an approved sequence file"""
+    sequence = data.get('sequence', [])
+    return {
+        'type': 'approved_sequence',
+        'source': 'user_approved',
+        'filename': filename,
+        'title': f"Approved: {data.get('original_prompt', 'Treatment Sequence')}",
+        'consultation_text': data.get('original_prompt', ''),
+        'treatment_sequence': sequence,
+        'rating': data.get('rating'),
+        'approved_by': data.get('approved_by'),
+        'approved_date': data.get('approved_date'),
+        'keywords': data.get('keywords', []),
+        'searchable_content': f"Consultation: {data.get('original_prompt', '')}\n" +
+                              f"Séquence approuvée avec note {data.get('rating')}/10\n" +
+                              '\n'.join([f"RDV {seq.get('rdv', i+1)}: {seq.get('traitement', '')}"
+                                         for i, seq in enumerate(sequence)])
+    }
+
+
+def is_rag_approved(data: Dict) -> bool:
+    """Whether an approved sequence belongs in the knowledge base"""
+    return bool(data.get('use_in_rag', False)) and (data.get('rating') or 0) >= APPROVED_SEQUENCE_MIN_RATING
+
+
+def load_knowledge_base(path: str = KNOWLEDGE_BASE_PATH) -> Dict:
+    """The knowledge base on disk; an empty one if the file does not exist"""
+    if not os.path.exists(path):
+        return {'data': [], 'metadata': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_knowledge_base(knowledge_base: Dict, path: str = KNOWLEDGE_BASE_PATH):
+    """Write the knowledge base with refreshed metadata (atomic replace)"""
+    metadata = knowledge_base.setdefault('metadata', {})
+    metadata['last_updated'] = datetime.now().isoformat()
+    metadata['total_entries'] = len(knowledge_base['data'])
+    metadata['approved_sequences'] = sum(
+        1 for entry in knowledge_base['data'] if entry.get('type') == 'approved_sequence'
+    )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(knowledge_base, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def upsert_entry(entry: Dict, path: str = KNOWLEDGE_BASE_PATH) -> Tuple[Dict, int]:
+    """Add an entry to the knowledge base, replacing the one of the same type and file.
+
+    Returns the updated knowledge base and the entry's position. Existing
+    entries keep their positions, so their index ids stay valid.
+    """
+    with knowledge_base_lock(path):
+        knowledge_base = load_knowledge_base(path)
+        position = next(
+            (i for i, existing in enumerate(knowledge_base['data'])
+             if existing.get('type') == entry.get('type') and existing.get('filename') == entry.get('filename')),
+            None
+        )
+        if position is None:
+            position = len(knowledge_base['data'])
+            knowledge_base['data'].append(entry)
+        else:
+            knowledge_base['data'][position] = entry
+        save_knowledge_base(knowledge_base, path)
+    return knowledge_base, position
+
+
+def apply_source_changes(changes: List[Tuple[str, str, Optional[Dict]]], table: Dict,
+                         path: str = KNOWLEDGE_BASE_PATH) -> Dict[str, int]:
+    """Regenerate the entries of changed source files; data None means the file was removed.
+
+    Only the affected entries change. A removed entry is replaced by the last
+    one, so at most one other entry moves and the index ids of all the
+    others stay valid.
+    """
+    counts = {'added': 0, 'updated': 0, 'removed': 0}
+    with knowledge_base_lock(path):
+        knowledge_base = load_knowledge_base(path)
+        entries = knowledge_base['data']
+        positions = {(entry.get('type'), entry.get('filename')): i for i, entry in enumerate(entries)}
+
+        for entry_type, filename, data in changes:
+            key = (entry_type, filename)
+            position = positions.get(key)
+            if data is None:
+                if position is not None:
+                    last = entries.pop()
+                    del positions[key]
+                    if position < len(entries):
+                        entries[position] = last
+                        positions[(last.get('type'), last.get('filename'))] = position
+                    counts['removed'] += 1
+                continue
+
+            entry = source_entry(entry_type, data, filename, table)
+            if position is None:
+                positions[key] = len(entries)
+                entries.append(entry)
+                counts['added'] += 1
+            elif entries[position] != entry:
+                entries[position] = entry
+                counts['updated'] += 1
+
+        if any(counts.values()):
+            save_knowledge_base(knowledge_base, path)
+    return counts
+
+
+def apply_data_events(events: List[Dict], data_dir: str, table: Dict,
+                      path: str = KNOWLEDGE_BASE_PATH) -> Dict[str, int]:
+    """Regenerate the entries of the items named by data change events.
+
+    An event with an item_id re-reads that item (a missing file removes its
+    entry); one without re-reads its whole category, as after an import.
+    Approved sequences below the RAG threshold are removed. Categories that
+    do not feed the knowledge base are ignored.
+    """
+    wanted: Dict[Tuple[str, str], str] = {}
+    for event in events:
+        if event.get('category') not in CATEGORY_SOURCES:
+            continue
+        entry_type, directory = CATEGORY_SOURCES[event['category']]
+        if event.get('item_id'):
+            filenames = [f"{event['item_id']}.json"]
+        else:
+            category_path = os.path.join(data_dir, directory)
+            filenames = sorted(
+                filename for filename in (os.listdir(category_path) if os.path.exists(category_path) else [])
+                if filename.endswith('.json') and not filename.startswith('_')
+            )
+        for filename in filenames:
+            wanted[(entry_type, filename)] = directory
+
+    changes = []
+    for (entry_type, filename), directory in wanted.items():
+        try:
+            with open(os.path.join(data_dir, directory, filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = None
+        except Exception as e:
+            logger.warning(f"Could not read {directory}/{filename}, keeping its entry: {e}")
+            continue
+        if data is not None and not isinstance(data, dict):
+            logger.warning(f"Skipping {directory}/{filename}: not a JSON object")
+            continue
+        if entry_type == 'approved_sequence' and data is not None and not is_rag_approved(data):
+            data = None
+        changes.append((entry_type, filename, data))
+
+    if not changes:
+        return {'added': 0, 'updated': 0, 'removed': 0}
+    return apply_source_changes(changes, table, path)
+
+
+@contextmanager
+def knowledge_base_lock(path: str = KNOWLEDGE_BASE_PATH):
+    """Exclusive lock shared by every process rewriting the knowledge base"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
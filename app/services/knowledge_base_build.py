@@ -0,0 +1,312 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.brain_cache import content_hash
+from app.services.category_catalog import file_signature
+from app.services.knowledge_base import (
+    ABBREVIATIONS_PATH, IDEAL_SEQUENCES_SOURCE, KNOWLEDGE_BASE_PATH, SOURCE_DIRECTORIES,
+    approved_sequence_entry, clinical_case_entry, enhanced_ideal_sequence, ideal_sequence_entry,
+    is_rag_approved, knowledge_base_lock, load_abbreviation_table, load_knowledge_base, save_knowledge_base
+)
+
+logger = logging.getLogger(__name__)
+
+BUILD_VERSION = 1  # Bump when the entry builders change, to rebuild every cached entry
+PARALLEL_MIN_FILES = 32  # Below this, process startup costs more than it saves
+
+# Entry type -> directory of its source files under DATA, in knowledge base order
+BUILD_SOURCES = (
+    ('clinical_case', SOURCE_DIRECTORIES['clinical_case']),
+    ('ideal_sequence', IDEAL_SEQUENCES_SOURCE),
+    ('approved_sequence', 'APPROVED_SEQUENCES')
+)
+ENHANCED_IDEAL_SEQUENCES = SOURCE_DIRECTORIES['ideal_sequence']
+ALL_IDEAL_SEQUENCES_FILE = '_all_ideal_sequences_enhanced.json'
+
+_worker_table: Optional[Dict] = None
+
+
+def natural_key(filename: str) -> List:
+    """Sort key ordering treatment_planning_2 before treatment_planning_10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', filename)]
+
+
+def build_source(entry_type: str, filename: str, raw: bytes, table: Dict) -> Optional[Dict]:
+    """Output of one source file: its knowledge base entry, or the enhanced file of an ideal sequence"""
+    data = json.loads(raw.decode('utf-8'))
+    if not isinstance(data, dict):
+        raise ValueError("not a JSON object")
+    if entry_type == 'clinical_case':
+        return clinical_case_entry(data, filename, table)
+    if entry_type == 'ideal_sequence':
+        return enhanced_ideal_sequence(data, table)
+    return approved_sequence_entry(data, filename) if is_rag_approved(data) else None
+
+
+def _init_worker(table: Dict):
+    global _worker_table
+    _worker_table = table
+
+
+def _build_in_worker(job: Tuple[str, str, bytes]) -> Tuple[Optional[Dict], Optional[str]]:
+    entry_type, filename, raw = job
+    try:
+        return build_source(entry_type, filename, raw, _worker_table), None
+    except Exception as e:
+        return None, str(e)
+
+
+class KnowledgeBaseBuilder:
+    """Derives the knowledge base and its companion files from the DATA source files.
+
+    Sources are the clinical cases, the extracted ideal sequences and the
+    approved sequences. Each file's output (entry with expanded texts,
+    categories, structured durations and rendered context lines) is cached
+    with the file's signature and content hash: unchanged files are not
+    re-read, touched but identical ones are not re-parsed, and the rest are
+    parsed in a process pool. The abbreviation table and BUILD_VERSION are
+    part of the cache key.
+
+    Entries are ordered by type, then file name, so the same sources always
+    give the same files; a file is only rewritten when its content changes.
+    Nothing is deleted: a source that fails to parse keeps its last output,
+    and enhanced ideal sequences without a source are used as they are.
+    """
+
+    def __init__(self, data_dir: str = 'DATA', knowledge_base_path: str = KNOWLEDGE_BASE_PATH,
+                 abbreviations_path: str = ABBREVIATIONS_PATH, workers: Optional[int] = None):
+        self.data_dir = data_dir
+        self.knowledge_base_path = knowledge_base_path
+        self.abbreviations_path = abbreviations_path
+        self.workers = workers or os.cpu_count() or 1
+        self.output_dir = os.path.dirname(knowledge_base_path)
+        self.cache_path = os.path.join(self.output_dir, 'build_cache.json')
+
+    def build(self, force: bool = False) -> Dict:
+        """Build every artifact; force ignores the cache. Returns counts, errors and the files written"""
+        started = time.time()
+        table = load_abbreviation_table(self.abbreviations_path)
+        fingerprint = content_hash([BUILD_VERSION, table])
+        cache = {} if force else self._load_cache(fingerprint)
+
+        previous = dict(cache)
+        outputs, pending, report = self._collect(cache)
+        report['parsed'] = len(pending)
+        for key, output, error in self._parse(pending, table):
+            if error is not None:
+                # Keep the last good output; the source is retried once it changes again
+                report['errors'].append({'file': key, 'error': error})
+                if key in previous:
+                    cache[key] = previous[key]
+                    outputs[key] = previous[key]['output']
+                else:
+                    cache.pop(key, None)
+                    outputs.pop(key, None)
+                continue
+            cache[key]['output'] = output
+            outputs[key] = output
+
+        report['entries'], report['written'] = self._write_artifacts(outputs)
+        # Sources that disappeared drop out of the cache
+        self._save_cache(fingerprint, {key: cache[key] for key in outputs if key in cache})
+        report['seconds'] = round(time.time() - started, 3)
+
+        logger.info(f"🏗️ Knowledge base build: {report['entries']} entries from {report['sources']} files "
+                    f"({report['parsed']} parsed, {len(report['errors'])} errors), "
+                    f"{len(report['written'])} files written in {report['seconds']}s")
+        return report
+
+    def _collect(self, cache: Dict) -> Tuple[Dict, List, Dict]:
+        """Cached outputs of unchanged sources, and the sources to parse"""
+        outputs: Dict[str, Optional[Dict]] = {}
+        pending: List[Tuple[str, str, str, bytes]] = []
+        report = {'sources': 0, 'errors': []}
+
+        for entry_type, directory in BUILD_SOURCES:
+            path = os.path.join(self.data_dir, directory)
+            filenames = [
+                filename for filename in (os.listdir(path) if os.path.exists(path) else [])
+                if filename.endswith('.json') and not filename.startswith('_')
+            ]
+            for filename in sorted(filenames, key=natural_key):
+                key = f"{directory}/{filename}"
+                file_path = os.path.join(path, filename)
+                report['sources'] += 1
+                try:
+                    signature = list(file_signature(os.stat(file_path)))
+                    cached = cache.get(key)
+                    if cached and cached['signature'] == signature:
+                        outputs[key] = cached['output']
+                        continue
+                    with open(file_path, 'rb') as f:
+                        raw = f.read()
+                except OSError as e:
+                    report['errors'].append({'file': key, 'error': str(e)})
+                    continue
+
+                digest = hashlib.sha256(raw).hexdigest()
+                if cached and cached['hash'] == digest:
+                    # Touched, same content
+                    cached['signature'] = signature
+                    outputs[key] = cached['output']
+                    continue
+                cache[key] = {'signature': signature, 'hash': digest, 'output': None}
+                outputs[key] = None
+                pending.append((key, entry_type, filename, raw))
+
+        return outputs, pending, report
+
+    def _parse(self, pending: List[Tuple[str, str, str, bytes]], table: Dict):
+        """(key, output, error) of each pending source, in a process pool when there are many"""
+        if len(pending) < PARALLEL_MIN_FILES or self.workers < 2:
+            for key, entry_type, filename, raw in pending:
+                try:
+                    yield key, build_source(entry_type, filename, raw, table), None
+                except Exception as e:
+                    yield key, None, str(e)
+            return
+
+        jobs = [(entry_type, filename, raw) for _, entry_type, filename, raw in pending]
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(table,)) as executor:
+            for (key, _, _, _), (output, error) in zip(pending, executor.map(_build_in_worker, jobs, chunksize=8)):
+                yield key, output, error
+
+    def _write_artifacts(self, outputs: Dict[str, Optional[Dict]]) -> Tuple[int, List[str]]:
+        """Write the derived files from the outputs (in source order); entry count and the paths rewritten"""
+        entries = {entry_type: [] for entry_type, _ in BUILD_SOURCES}
+        enhanced_sequences = {}
+        for key, output in outputs.items():
+            if output is None:
+                continue  # Approved sequence not used by the RAG
+            directory, filename = key.split('/', 1)
+            if directory == IDEAL_SEQUENCES_SOURCE:
+                enhanced_sequences[filename] = output
+            else:
+                entries[output['type']].append(output)
+
+        written = []
+        enhanced_dir = os.path.join(self.data_dir, ENHANCED_IDEAL_SEQUENCES)
+        for filename, sequence in enhanced_sequences.items():
+            if _write_if_changed(os.path.join(enhanced_dir, filename), sequence):
+                written.append(os.path.join(enhanced_dir, filename))
+        # Enhanced files without an extracted source (dropped in directly, as the watcher
+        # allows, or whose source failed to parse) are kept and used as they are
+        for filename in (os.listdir(enhanced_dir) if os.path.exists(enhanced_dir) else []):
+            if filename.endswith('.json') and not filename.startswith('_') and filename not in enhanced_sequences:
+                try:
+                    with open(os.path.join(enhanced_dir, filename), 'r', encoding='utf-8') as f:
+                        sequence = json.load(f)
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable {filename}: {e}")
+                    continue
+                if isinstance(sequence, dict):
+                    logger.info(f"Using {filename} as is: no source in {IDEAL_SEQUENCES_SOURCE}")
+                    enhanced_sequences[filename] = sequence
+        enhanced_sequences = {
+            filename: enhanced_sequences[filename] for filename in sorted(enhanced_sequences, key=natural_key)
+        }
+        entries['ideal_sequence'] = [
+            ideal_sequence_entry(sequence, filename) for filename, sequence in enhanced_sequences.items()
+        ]
+        entries = [entry for entry_type, _ in BUILD_SOURCES for entry in entries[entry_type]]
+
+        all_sequences = {'total_sequences': len(enhanced_sequences), 'sequences': list(enhanced_sequences.values())}
+        if _write_if_changed(os.path.join(enhanced_dir, ALL_IDEAL_SEQUENCES_FILE), all_sequences):
+            written.append(os.path.join(enhanced_dir, ALL_IDEAL_SEQUENCES_FILE))
+
+        companions = {
+            'enhanced_clinical_cases.json': [entry for entry in entries if entry['type'] == 'clinical_case'],
+            'knowledge_base_index.json': [
+                {
+                    'id': f"{entry['type']}_{i}",
+                    'type': entry['type'],
+                    'title': entry.get('title', entry.get('consultation_text', '')),
+                    'source': entry.get('source'),
+                    'filename': entry.get('filename')
+                }
+                for i, entry in enumerate(entries)
+            ],
+            'search_index.json': [
+                {
+                    'id': entry.get('filename'),
+                    'title': entry.get('title', entry.get('consultation_text', '')),
+                    'content': entry.get('searchable_content', ''),
+                    'type': entry['type'],
+                    'source': entry.get('source'),
+                    'categories': entry.get('categories', [])
+                }
+                for entry in entries
+            ]
+        }
+        for filename, value in companions.items():
+            if _write_if_changed(os.path.join(self.output_dir, filename), value):
+                written.append(os.path.join(self.output_dir, filename))
+
+        if self._write_knowledge_base(entries):
+            written.append(self.knowledge_base_path)
+        return len(entries), written
+
+    def _write_knowledge_base(self, entries: List[Dict]) -> bool:
+        """Replace the knowledge base unless it already holds these entries"""
+        statistics = {}
+        for entry in entries:
+            statistics[entry['type']] = statistics.get(entry['type'], 0) + 1
+        build_hash = content_hash([statistics, entries])
+
+        with knowledge_base_lock(self.knowledge_base_path):
+            try:
+                current = load_knowledge_base(self.knowledge_base_path)
+            except ValueError:
+                current = {}
+            if current.get('metadata', {}).get('build_hash') == build_hash:
+                return False
+            save_knowledge_base({
+                'version': '2.0',
+                'statistics': statistics,
+                'data': entries,
+                'metadata': {'build_hash': build_hash}
+            }, self.knowledge_base_path)
+        return True
+
+    def _load_cache(self, fingerprint: str) -> Dict:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable build cache: {e}")
+            return {}
+        return cache.get('files', {}) if cache.get('fingerprint') == fingerprint else {}
+
+    def _save_cache(self, fingerprint: str, files: Dict):
+        try:
+            _write_if_changed(self.cache_path, {'fingerprint': fingerprint, 'files': files}, indent=None)
+        except Exception as e:
+            logger.error(f"Error saving build cache: {e}")
+
+
+def _write_if_changed(path: str, value, indent: Optional[int] = 2) -> bool:
+    """Atomically write value as JSON unless the file already holds exactly that; whether it was written"""
+    payload = json.dumps(value, indent=indent, ensure_ascii=False)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == payload:
+                return False
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return True
@@ -0,0 +1,155 @@
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens (input, output) - used for cost accounting only
+MODEL_PRICING = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'o4-mini': (1.10, 4.40),
+    'o1-mini': (1.10, 4.40),
+}
+
+# Tier definitions. A tier's model replaces the one chosen in the user settings only when
+# the user opted into downgrades (modelRouting 'economy'); None always uses the chosen model.
+MODEL_TIERS = {
+    'light': {
+        'model': 'gpt-4o-mini',
+        'max_tokens': 2500,
+        'description': 'Questions simples, sans plan de traitement'
+    },
+    'guided': {
+        'model': 'gpt-4o-mini',
+        'max_tokens': 2000,
+        'description': 'Plan de traitement avec une référence quasi identique'
+    },
+    'planning': {
+        'model': None,
+        'max_tokens': 2500,
+        'description': 'Nouveau plan complexe ou modification de plan'
+    },
+}
+
+# Retrieval similarity above which a cheap model only has to adapt the reference
+HIGH_CONFIDENCE_THRESHOLD = 0.9
+
+# 'auto': the chosen model with a token budget per tier, 'economy': also cheaper models
+# per tier, 'fixed': the chosen model with the historic budget
+ROUTING_MODES = ('auto', 'economy', 'fixed')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) when the API doesn't report usage"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class ModelRouter:
+    """Pick a model tier and token budget per chat request, and account latency and cost per tier"""
+
+    def __init__(self, tiers: Dict = None, high_confidence: float = HIGH_CONFIDENCE_THRESHOLD):
+        self.tiers = tiers or MODEL_TIERS
+        self.high_confidence = high_confidence
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, settings: Dict, is_new_plan: bool, is_modification: bool,
+              retrieval_confidence: float) -> Dict:
+        """Return the routing decision: tier, model, max_tokens and reason"""
+        default_model = settings.get('aiModel', 'gpt-4o')
+
+        # Users can pin the previous behaviour: everything on their selected model
+        if settings.get('modelRouting', 'auto') == 'fixed':
+            return {
+                'tier': 'fixed',
+                'model': default_model,
+                'max_tokens': 2000,
+                'reason': 'Modèle fixé par les paramètres utilisateur'
+            }
+
+        if is_modification:
+            tier, reason = 'planning', 'Modification du plan existant'
+        elif is_new_plan and retrieval_confidence >= self.high_confidence:
+            tier, reason = 'guided', f"Référence très proche ({retrieval_confidence:.0%})"
+        elif is_new_plan:
+            tier, reason = 'planning', f"Nouveau plan (meilleure référence {retrieval_confidence:.0%})"
+        else:
+            tier, reason = 'light', 'Question sans plan de traitement'
+
+        config = self.tiers[tier]
+        downgrade = settings.get('modelRouting') == 'economy' and config['model']
+        return {
+            'tier': tier,
+            'model': config['model'] if downgrade else default_model,
+            'max_tokens': config['max_tokens'],
+            'reason': reason
+        }
+
+    def escalate(self, decision: Dict, settings: Dict) -> Optional[Dict]:
+        """Planning-tier decision to retry a truncated answer of a cheaper tier; None if there is none"""
+        if decision['tier'] not in ('light', 'guided'):
+            return None
+        config = self.tiers['planning']
+        model = config['model'] or settings.get('aiModel', 'gpt-4o')
+        if model == decision['model'] and config['max_tokens'] <= decision['max_tokens']:
+            return None  # Same request again
+        return {
+            'tier': 'planning',
+            'model': model,
+            'max_tokens': config['max_tokens'],
+            'reason': f"Réponse tronquée au niveau '{decision['tier']}'"
+        }
+
+    @staticmethod
+    def retrieval_confidence(rag_results: Dict) -> float:
+        """Best similarity among the references that passed the threshold"""
+        filtered = rag_results.get('filtered', rag_results)
+        scores = [
+            item.get('similarity_score', 0)
+            for source in ('approved_sequences', 'clinical_cases', 'ideal_sequences')
+            for item in filtered.get(source, [])
+        ]
+        return max(scores) if scores else 0.0
+
+    def record(self, decision: Dict, latency_ms: int, prompt_tokens: int, completion_tokens: int):
+        """Account one completion against its tier"""
+        model = decision['model']
+        input_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING['gpt-4o'])
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+        with self._lock:
+            stats = self._stats.setdefault(decision['tier'], {
+                'requests': 0,
+                'total_latency_ms': 0,
+                'max_latency_ms': 0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'cost_usd': 0.0,
+                'models': {}
+            })
+            stats['requests'] += 1
+            stats['total_latency_ms'] += latency_ms
+            stats['max_latency_ms'] = max(stats['max_latency_ms'], latency_ms)
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['cost_usd'] += cost
+            stats['models'][model] = stats['models'].get(model, 0) + 1
+
+        logger.info(f"💰 Tier '{decision['tier']}' ({model}): {latency_ms}ms, "
+                    f"{prompt_tokens}+{completion_tokens} tokens, ~${cost:.4f}")
+
+    def get_stats(self) -> Dict:
+        """Per-tier latency and cost summary"""
+        with self._lock:
+            summary = {}
+            for tier, stats in self._stats.items():
+                summary[tier] = {
+                    **stats,
+                    'models': dict(stats['models']),
+                    'avg_latency_ms': int(stats['total_latency_ms'] / stats['requests']) if stats['requests'] else 0,
+                    'cost_usd': round(stats['cost_usd'], 6)
+                }
+            return summary
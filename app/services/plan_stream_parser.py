@@ -0,0 +1,230 @@
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Schema of the structured treatment plan response (JSON mode)
+TREATMENT_PLAN_SCHEMA = {
+    "type": "object",
+    "required": ["reasoning", "consultation_text", "treatment_sequence"],
+    "properties": {
+        "reasoning": {"type": "string"},
+        "consultation_text": {"type": "string"},
+        "treatment_sequence": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["rdv", "traitement"],
+                "properties": {
+                    "rdv": {"type": ["integer", "string"]},
+                    "traitement": {"type": "string"},
+                    "duree": {"type": "string"},
+                    "delai": {"type": "string"},
+                    "dr": {"type": "string"},
+                    "date": {"type": "string"},
+                    "remarque": {"type": "string"}
+                }
+            }
+        }
+    }
+}
+
+# Guard against runaway generations
+MAX_APPOINTMENTS = 40
+
+
+class PlanStreamError(ValueError):
+    """Raised as soon as a streamed plan can no longer become a valid treatment plan"""
+
+
+def validate_appointment(appointment) -> Optional[str]:
+    """Return an error message if an appointment doesn't match the schema"""
+    item_schema = TREATMENT_PLAN_SCHEMA['properties']['treatment_sequence']['items']
+
+    if not isinstance(appointment, dict):
+        return "appointment is not an object"
+
+    for field in item_schema['required']:
+        if field not in appointment:
+            return f"missing field '{field}'"
+
+    rdv = appointment['rdv']
+    if isinstance(rdv, bool) or not isinstance(rdv, (int, str)) or str(rdv).strip() == '':
+        return "invalid 'rdv'"
+
+    if not isinstance(appointment['traitement'], str) or not appointment['traitement'].strip():
+        return "empty 'traitement'"
+
+    for field in item_schema['properties']:
+        if field in ('rdv', 'traitement') or field not in appointment:
+            continue
+        if appointment[field] is not None and not isinstance(appointment[field], str):
+            return f"field '{field}' must be a string"
+
+    return None
+
+
+def validate_treatment_plan(plan) -> Optional[str]:
+    """Return an error message if a complete plan doesn't match the schema"""
+    if not isinstance(plan, dict):
+        return "plan is not an object"
+
+    sequence = plan.get('treatment_sequence')
+    if not isinstance(sequence, list) or not sequence:
+        return "missing or empty 'treatment_sequence'"
+
+    for index, appointment in enumerate(sequence):
+        error = validate_appointment(appointment)
+        if error:
+            return f"appointment {index + 1}: {error}"
+
+    return None
+
+
+class IncrementalPlanParser:
+    """Single-pass parser for a streamed JSON treatment plan.
+
+    Text is fed chunk by chunk. Each character is scanned once; appointments of
+    'treatment_sequence' are decoded and validated as soon as their closing
+    brace arrives, so a malformed response is rejected long before the token
+    budget is exhausted. Chunks are kept in a list; only the text from the
+    start of the open key or appointment on is buffered for decoding.
+    """
+
+    def __init__(self, max_appointments: int = MAX_APPOINTMENTS):
+        self.max_appointments = max_appointments
+        self.appointments: List[Dict] = []
+
+        self._chunks: List[str] = []
+        self._buffer = ''  # Text from absolute offset _buffer_start on
+        self._buffer_start = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._key_start = None  # Offset of the open top-level key string, if any
+        self._in_value = False  # Between ':' and ',' at the top level
+        self._pending_key = None
+        self._expect_sequence = False
+        self._sequence_depth = None
+        self._object_start = None
+        self._started = False
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk and return the appointments completed by it"""
+        if not chunk:
+            return []
+
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        completed = []
+        text, base = self._buffer, self._buffer_start
+        end = base + len(text)
+
+        while self._pos < end:
+            char = text[self._pos - base]
+
+            if not self._started:
+                if not char.isspace():
+                    if char != '{':
+                        raise PlanStreamError("response is not a JSON object")
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._last_key = json.loads(text[self._key_start - base:self._pos + 1 - base])
+                        self._key_start = None
+                self._pos += 1
+                continue
+
+            if self._expect_sequence and not char.isspace():
+                if char != '[':
+                    raise PlanStreamError("'treatment_sequence' is not an array")
+                self._expect_sequence = False
+                self._sequence_depth = self._depth + 1
+
+            if (self._sequence_depth and self._depth == self._sequence_depth
+                    and not char.isspace() and char not in '{],'):
+                raise PlanStreamError("'treatment_sequence' items must be objects")
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and not self._in_value:
+                    self._key_start = self._pos
+            elif char == ':' and self._depth == 1:
+                self._pending_key = self._last_key
+                self._in_value = True
+                self._expect_sequence = self._pending_key == 'treatment_sequence'
+            elif char == ',' and self._depth == 1:
+                self._in_value = False
+            elif char in '{[':
+                self._depth += 1
+                if char == '{' and self._sequence_depth and self._depth == self._sequence_depth + 1:
+                    self._object_start = self._pos
+            elif char in '}]':
+                if char == '}' and self._sequence_depth and self._depth == self._sequence_depth + 1:
+                    completed.append(self._complete_appointment(text[self._object_start - base:self._pos + 1 - base]))
+                    self._object_start = None
+                elif char == ']' and self._sequence_depth and self._depth == self._sequence_depth:
+                    self._sequence_depth = None
+                self._depth -= 1
+                if self._depth < 0:
+                    raise PlanStreamError("unbalanced JSON")
+
+            self._pos += 1
+
+        # Keep only what an open key or appointment still needs
+        keep_from = min(start for start in (self._key_start, self._object_start, self._pos) if start is not None)
+        self._buffer = text[keep_from - base:]
+        self._buffer_start = keep_from
+        return completed
+
+    def _complete_appointment(self, raw: str) -> Dict:
+        """Decode and validate one appointment object"""
+        try:
+            appointment = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise PlanStreamError(f"invalid appointment JSON: {e}")
+
+        error = validate_appointment(appointment)
+        if error:
+            raise PlanStreamError(f"appointment {len(self.appointments) + 1}: {error}")
+
+        self.appointments.append(appointment)
+        if len(self.appointments) > self.max_appointments:
+            raise PlanStreamError(f"more than {self.max_appointments} appointments")
+
+        return appointment
+
+    def finish(self) -> Dict:
+        """Decode the complete response once and validate it against the schema"""
+        try:
+            plan = json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise PlanStreamError(f"incomplete JSON response: {e}")
+
+        error = validate_treatment_plan(plan)
+        if error:
+            raise PlanStreamError(error)
+
+        return plan
@@ -0,0 +1,72 @@
+import json
+import logging
+from typing import Callable, Dict, List
+
+from app.services.model_router import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Token budgets of the brain agent prompts (estimated, ~4 characters per token)
+ANALYZER_PATTERN_BUDGET = 6000  # Patterns of one analyzer call; larger groups are split
+ANALYZER_EVIDENCE_BUDGET = 1500  # Chunk summaries shown to the analyzer
+ANALYZER_MAX_EVIDENCE = 10
+VALIDATOR_CASE_BUDGET = 1000  # Test case summaries shown to the validator
+
+INTEREST_WEIGHTS = {'high': 3, 'medium': 2, 'low': 1}
+
+
+def compact_json(value) -> str:
+    """JSON without indentation or spaces after separators"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def split_by_budget(items: List, budget: int, measure: Callable = None) -> List[List]:
+    """Split items, in order, into consecutive parts whose measured size stays within budget.
+
+    An item larger than the budget on its own gets a part to itself.
+    """
+    measure = measure or (lambda item: estimate_tokens(compact_json(item)))
+    parts, current, used = [], [], 0
+    for item in items:
+        size = measure(item)
+        if current and used + size > budget:
+            parts.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += size
+    if current:
+        parts.append(current)
+    return parts
+
+
+def rank_evidence(patterns: List[Dict], references: Callable[[List[str]], List[Dict]]) -> List[Dict]:
+    """Chunks referenced by the patterns, most relevant first.
+
+    A chunk scores the interest weight of every pattern that references it,
+    so chunks behind several high-interest patterns come first; ties keep
+    chunk order.
+    """
+    scores: Dict[str, int] = {}
+    chunks: Dict[str, Dict] = {}
+    order: Dict[str, int] = {}
+    for pattern in patterns:
+        weight = INTEREST_WEIGHTS.get(pattern.get('interest_level'), 1)
+        for chunk in references(pattern.get('occurrences', [])):
+            name = chunk['name']
+            scores[name] = scores.get(name, 0) + weight
+            chunks[name] = chunk
+            order.setdefault(name, len(order))
+    ranked = sorted(chunks, key=lambda name: (-scores[name], order[name]))
+    return [chunks[name] for name in ranked]
+
+
+def pack_lines(lines: List[str], budget: int, limit: int = None) -> List[str]:
+    """Leading lines that fit the token budget (at least one)"""
+    packed, used = [], 0
+    for line in lines[:limit] if limit is not None else lines:
+        size = estimate_tokens(line)
+        if packed and used + size > budget:
+            break
+        packed.append(line)
+        used += size
+    return packed
@@ -0,0 +1,72 @@
+import threading
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilled bucket; capacity is the per-minute budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        """Add what accumulated since the last update"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it already is)"""
+        missing = amount - self.level
+        return max(0.0, missing / self.refill_per_second) if missing > 0 else 0.0
+
+
+class RateLimiter:
+    """Shared requests-per-minute and tokens-per-minute limiter.
+
+    acquire() blocks until both budgets allow the call, then debits them.
+    Token usage is estimated up front; settle() corrects the token bucket with
+    the usage reported by the API once the call returns.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self.total_wait_seconds = 0.0
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Block until a request of estimated_tokens fits; returns the time waited"""
+        # A single call larger than the whole budget would never fit
+        estimated_tokens = min(estimated_tokens, self.tokens.capacity)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                if delay == 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= estimated_tokens
+                    self.total_wait_seconds += waited
+                    return waited
+
+            time.sleep(delay)
+            waited += delay
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Charge (or refund) the difference between estimated and actual usage"""
+        if actual_tokens is None:
+            return
+        estimated_tokens = min(estimated_tokens, self.tokens.capacity)
+        with self._lock:
+            self.tokens.refill(time.monotonic())
+            # The level may go negative: later callers then wait for the overdraft to refill
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - actual_tokens)
@@ -0,0 +1,153 @@
+import os
+import json
+import logging
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from app.services.brain_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_BATCH_SIZE = 100
+DUPLICATE_THRESHOLD = 0.92  # Cosine similarity above which two rules say the same thing
+
+
+def rule_text(rule: Dict) -> str:
+    """The part of a rule that carries its meaning (no ids, dates or derived fields)"""
+    parts = [rule.get('title', ''), rule.get('description', '')]
+    if rule.get('conditions'):
+        parts.append('; '.join(rule['conditions']))
+    return '\n'.join(part for part in parts if part)
+
+
+class EmbeddingCache:
+    """Rule embeddings on disk, keyed by the hash of the embedded text"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors: Dict[str, List[float]] = {}
+        self._dirty = False
+
+    def load(self) -> 'EmbeddingCache':
+        """Read cached vectors; a missing or corrupt file means a cold cache"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('model') == EMBEDDING_MODEL:
+                    self.vectors = data.get('vectors', {})
+        except Exception as e:
+            logger.error(f"Error loading rule embeddings, starting cold: {e}")
+            self.vectors = {}
+        return self
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """Vectors for texts, calling embed_fn only for texts not seen before"""
+        keys = [content_hash(text) for text in texts]
+        missing = list({key: text for key, text in zip(keys, texts) if key not in self.vectors}.items())
+
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            for (key, _), vector in zip(batch, embed_fn([text for _, text in batch])):
+                self.vectors[key] = list(vector)
+            self._dirty = True
+
+        if missing:
+            logger.info(f"Embedded {len(missing)} rules ({len(texts) - len(missing)} from cache)")
+        return np.array([self.vectors[key] for key in keys], dtype=np.float32)
+
+    def save(self, keep: List[str] = None):
+        """Persist the cache (atomic replace), keeping only the vectors of the given texts"""
+        if keep is not None:
+            wanted = {content_hash(text) for text in keep}
+            pruned = {key: value for key, value in self.vectors.items() if key in wanted}
+            self._dirty = self._dirty or len(pruned) != len(self.vectors)
+            self.vectors = pruned
+        if not self._dirty:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': EMBEDDING_MODEL, 'vectors': self.vectors}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error saving rule embeddings: {e}")
+
+
+def cluster_duplicates(vectors: np.ndarray, threshold: float = DUPLICATE_THRESHOLD) -> List[List[int]]:
+    """Greedy clustering by cosine similarity.
+
+    Rows are taken in order; each unassigned row becomes the canonical member
+    of a cluster with every later unassigned row at least threshold similar
+    to it. Earlier rows therefore win, which keeps existing rule ids stable.
+    """
+    if len(vectors) == 0:
+        return []
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    similarity = unit @ unit.T
+
+    assigned = np.zeros(len(unit), dtype=bool)
+    clusters = []
+    for row in range(len(unit)):
+        if assigned[row]:
+            continue
+        members = np.flatnonzero((similarity[row] >= threshold) & ~assigned)
+        members = members[members >= row]
+        assigned[members] = True
+        clusters.append([row] + [int(m) for m in members if m != row])
+    return clusters
+
+
+def merge_rules(rules: List[Dict]) -> Dict:
+    """Fold duplicates into the first (canonical) rule.
+
+    Evidence, conditions and exceptions are unioned; confidence becomes the
+    evidence-weighted mean and the evidence count the largest observed.
+    """
+    canonical = dict(rules[0])
+    if len(rules) == 1:
+        return canonical
+
+    def union(field):
+        merged = []
+        for rule in rules:
+            for item in rule.get(field) or []:
+                if item not in merged:
+                    merged.append(item)
+        return merged
+
+    weights = [max(1, rule.get('evidenceCount') or 0) for rule in rules]
+    confidence = sum((rule.get('confidence') or 0) * weight for rule, weight in zip(rules, weights)) / sum(weights)
+
+    canonical['evidence'] = union('evidence')
+    canonical['conditions'] = union('conditions')
+    canonical['exceptions'] = union('exceptions')
+    canonical['confidence'] = int(round(confidence))
+    canonical['evidenceCount'] = max(rule.get('evidenceCount') or 0 for rule in rules)
+    canonical['mergedFrom'] = list(dict.fromkeys(
+        (canonical.get('mergedFrom') or []) +
+        [rule['id'] for rule in rules[1:] if rule.get('id')] +
+        [merged_id for rule in rules[1:] for merged_id in rule.get('mergedFrom') or []]
+    ))
+    return canonical
+
+
+def deduplicate_rules(rules: List[Dict], embed_fn: Callable[[List[str]], List[List[float]]],
+                      cache: EmbeddingCache, threshold: float = DUPLICATE_THRESHOLD) -> List[Dict]:
+    """Merge paraphrased rules; rules earlier in the list are kept as canonical"""
+    texts = [rule_text(rule) for rule in rules]
+    vectors = cache.embed(texts, embed_fn)
+    clusters = cluster_duplicates(vectors, threshold)
+    cache.save(keep=texts)
+
+    merged = [merge_rules([rules[index] for index in cluster]) for cluster in clusters]
+    if len(merged) < len(rules):
+        logger.info(f"🧬 Merged {len(rules) - len(merged)} duplicate rules into {len(merged)} canonical rules")
+    return merged
@@ -0,0 +1,245 @@
+import os
+import json
+import uuid
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.services.brain_cache import content_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COMPACT_MIN_RECORDS = 200  # Never compact tiny logs
+COMPACT_GARBAGE_RATIO = 2.0  # Compact once the log holds this many records per live rule
+
+
+class RuleStore:
+    """Append-only JSONL log of discovered rules.
+
+    Each line is {"op": "put", "rule": {...}} or {"op": "delete", "id": ...};
+    replaying the log gives the current rules. Saving appends only what
+    changed, and the log is compacted (rewritten atomically) once superseded
+    records dominate it. Loading is lazy, and readers pick up records appended
+    by other workers by reading the tail of the file.
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._rules: Dict[str, Dict] = {}
+        self._hashes: Dict[str, str] = {}
+        self._by_type: Dict[str, Dict[str, None]] = {}  # Ordered id sets
+        self._by_confidence: List = []  # Sorted (confidence, id), rebuilt on demand
+        self._confidence_dirty = True
+        self._records = 0
+        self._offset = 0
+        self._inode = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # Reading
+
+    def all(self) -> List[Dict]:
+        """Current rules in insertion order"""
+        with self._lock:
+            self._refresh()
+            return list(self._rules.values())
+
+    def get(self, rule_id: str) -> Optional[Dict]:
+        """One rule by id"""
+        with self._lock:
+            self._refresh()
+            return self._rules.get(rule_id)
+
+    def by_type(self, rule_type: str) -> List[Dict]:
+        """Rules of one type"""
+        with self._lock:
+            self._refresh()
+            return [self._rules[rule_id] for rule_id in self._by_type.get(rule_type, ())]
+
+    def with_confidence(self, minimum: int) -> List[Dict]:
+        """Rules with confidence >= minimum, most confident first"""
+        with self._lock:
+            self._refresh()
+            if self._confidence_dirty:
+                self._by_confidence = sorted(
+                    (self._confidence(rule), rule_id) for rule_id, rule in self._rules.items()
+                )
+                self._confidence_dirty = False
+            start = bisect.bisect_left(self._by_confidence, (minimum, ''))
+            return [self._rules[rule_id] for _, rule_id in reversed(self._by_confidence[start:])]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rules)
+
+    # Writing
+
+    def sync(self, rules: List[Dict]) -> Dict[str, int]:
+        """Make the store hold exactly these rules, appending only puts and deletes for the differences"""
+        with self._lock:
+            self._load()
+            with self._file_lock():
+                self._refresh()
+                wanted = {rule['id']: rule for rule in rules}
+                records = [{'op': 'delete', 'id': rule_id} for rule_id in self._rules if rule_id not in wanted]
+                records.extend(
+                    {'op': 'put', 'rule': rule} for rule_id, rule in wanted.items()
+                    if self._hashes.get(rule_id) != content_hash(rule)
+                )
+
+                if records:
+                    self._append(records)
+                self._maybe_compact()
+
+                puts = sum(1 for record in records if record['op'] == 'put')
+                return {'put': puts, 'deleted': len(records) - puts}
+
+    def compact(self):
+        """Rewrite the log with one put per live rule (atomic replace)"""
+        with self._lock:
+            self._load()
+            with self._file_lock():
+                self._refresh()
+                self._write_snapshot(list(self._rules.values()))
+
+    # Internals
+
+    def _load(self):
+        """Seed the log from the legacy file on first use.
+
+        Writers call this before taking the file lock: the import takes it
+        too, and flock does not nest across file descriptors.
+        """
+        if not self._loaded:
+            self._loaded = True
+            if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy()
+
+    def _refresh(self):
+        """Load the log on first use, then apply records appended since the last read"""
+        self._load()
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # First read, or another worker compacted the log
+            self._reset()
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Partially written record; read it next time
+                self._offset += len(line)
+                try:
+                    self._apply(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    logger.error(f"Skipping corrupt rule store record at offset {self._offset}")
+
+    def _reset(self):
+        """Forget everything read so far"""
+        self._rules, self._hashes, self._by_type = {}, {}, {}
+        self._confidence_dirty = True
+        self._records = 0
+        self._offset = 0
+
+    def _apply(self, record: Dict):
+        """Replay one log record into the in-memory view and its indexes"""
+        self._records += 1
+        self._confidence_dirty = True
+        if record.get('op') == 'delete':
+            rule = self._rules.pop(record['id'], None)
+            self._hashes.pop(record['id'], None)
+            if rule is not None:
+                self._by_type.get(rule.get('type', 'general'), {}).pop(record['id'], None)
+            return
+
+        rule = record['rule']
+        previous = self._rules.get(rule['id'])
+        if previous is not None:
+            self._by_type.get(previous.get('type', 'general'), {}).pop(rule['id'], None)
+        self._rules[rule['id']] = rule
+        self._hashes[rule['id']] = content_hash(rule)
+        self._by_type.setdefault(rule.get('type', 'general'), {})[rule['id']] = None
+
+    def _append(self, records: List[Dict]):
+        """Append records durably and apply them (file lock held)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # Our own records are picked up like anyone else's
+        self._refresh()
+
+    def _maybe_compact(self):
+        """Compact once superseded records outnumber live rules by the garbage ratio"""
+        if self._records >= COMPACT_MIN_RECORDS and self._records > COMPACT_GARBAGE_RATIO * max(1, len(self._rules)):
+            logger.info(f"Compacting rule store: {self._records} records for {len(self._rules)} rules")
+            self._write_snapshot(list(self._rules.values()))
+
+    def _write_snapshot(self, rules: List[Dict]):
+        """Replace the log with one put per rule (file lock held)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for rule in rules:
+                f.write(json.dumps({'op': 'put', 'rule': rule}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._refresh()
+
+    def _import_legacy(self):
+        """Seed the log from the old discovered_rules.json array"""
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                rules = json.load(f)
+            missing_ids = [rule for rule in rules if not rule.get('id')]
+            for rule in missing_ids:
+                rule['id'] = str(uuid.uuid4())
+            if missing_ids:
+                logger.warning(f"Gave new ids to {len(missing_ids)} legacy rules without one")
+            with self._file_lock():
+                if not os.path.exists(self.path):
+                    self._write_snapshot(rules)
+                    logger.info(f"Imported {len(rules)} rules from {os.path.basename(self.legacy_path)}")
+        except Exception as e:
+            logger.error(f"Error importing legacy rules: {e}")
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by all workers writing the log"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _confidence(rule: Dict) -> int:
+        try:
+            return int(rule.get('confidence') or 0)
+        except (TypeError, ValueError):
+            return 0
@@ -0,0 +1,188 @@
+import math
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from app.services.chunk_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Weight of a term occurrence per field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'tags': 2.0,
+    'consultation': 2.0,
+    'description': 1.0,
+    'steps': 1.0
+}
+CONSULTATION_KEYS = ('consultation_text', 'consultation_text_expanded', 'original_prompt', 'case_description')
+STEP_KEYS = ('traitement', 'remarque')
+MIN_PREFIX_LENGTH = 3  # Shorter query terms only match whole words
+TF_SATURATION = 1.2  # BM25 k1: repeated terms count less and less
+LENGTH_NORMALIZATION = 0.75  # BM25 b: long items (aggregate files) need more occurrences to score
+
+
+class DataSearchIndex:
+    """Accent-insensitive inverted index over the items of every data category.
+
+    Documents are the items (category, id) with their titles, tags,
+    descriptions, consultation texts and treatment steps, including those of
+    items nested in aggregate files. Dental abbreviations are indexed with
+    their expansion ('CC' also indexes 'couronne ceramique') and expanded in
+    queries too. Items are added, replaced and removed one at a time.
+    """
+
+    def __init__(self, abbreviations: Optional[Dict[str, str]] = None):
+        self._postings: Dict[str, Dict[Tuple[str, str], float]] = defaultdict(dict)
+        self._documents: Dict[Tuple[str, str], Dict] = {}
+        self._terms: Dict[Tuple[str, str], List[str]] = {}
+        self._lengths: Dict[Tuple[str, str], float] = {}
+        self._total_length = 0.0
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._lock = threading.RLock()
+
+        # Abbreviation token runs -> expansion tokens
+        self._abbreviations: Dict[Tuple[str, ...], List[str]] = {}
+        for abbreviation, expansion in (abbreviations or {}).items():
+            key = tuple(tokenize(abbreviation))
+            if key:
+                self._abbreviations[key] = tokenize(expansion)
+        self._longest_abbreviation = max((len(key) for key in self._abbreviations), default=0)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, category: str, item_id: str, data, summary: Dict):
+        """Index an item, replacing its previous version"""
+        key = (category, item_id)
+        weights: Dict[str, float] = defaultdict(float)
+        for field, texts in self._document_fields(data, summary).items():
+            for text in texts:
+                for token in self._expand(tokenize(text)):
+                    weights[token] += FIELD_WEIGHTS[field]
+
+        with self._lock:
+            self._remove(key)
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    self._vocabulary_dirty = True
+                self._postings[token][key] = weight
+            self._terms[key] = list(weights)
+            self._lengths[key] = sum(weights.values())
+            self._total_length += self._lengths[key]
+            self._documents[key] = summary
+
+    def remove(self, category: str, item_id: str):
+        """Drop an item from the index"""
+        with self._lock:
+            self._remove((category, item_id))
+
+    def search(self, query: str, categories: Optional[List[str]] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[List[Tuple[float, str, Dict]], int]:
+        """Ranked (score, category, summary) for a query page, and the total number of matches"""
+        query_tokens = list(dict.fromkeys(self._expand(tokenize(query))))
+        if not query_tokens:
+            return [], 0
+
+        with self._lock:
+            total_documents = max(1, len(self._documents))
+            average_length = max(1.0, self._total_length / total_documents)
+            scores: Dict[Tuple[str, str], float] = defaultdict(float)
+            matched: Dict[Tuple[str, str], int] = defaultdict(int)
+
+            for token in query_tokens:
+                seen = set()
+                for term in self._matching_terms(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total_documents / len(postings))
+                    # Prefix matches ('couronne' -> 'couronnes') count a little less than exact ones
+                    boost = 1.0 if term == token else 0.8
+                    for key, weight in postings.items():
+                        if categories is not None and key[0] not in categories:
+                            continue
+                        saturation = TF_SATURATION * (1 - LENGTH_NORMALIZATION +
+                                                      LENGTH_NORMALIZATION * self._lengths[key] / average_length)
+                        scores[key] += boost * idf * weight * (TF_SATURATION + 1) / (weight + saturation)
+                        if key not in seen:
+                            seen.add(key)
+                            matched[key] += 1
+
+            # Items matching more query terms rank ahead, whatever their score: every term first
+            ranked = sorted(scores, key=lambda key: (-matched[key], -scores[key], key))
+            page = [
+                (round(scores[key], 4), key[0], self._documents[key])
+                for key in ranked[offset:offset + limit]
+            ]
+            return page, len(ranked)
+
+    def _remove(self, key: Tuple[str, str]):
+        """Remove a document's postings (lock held)"""
+        for token in self._terms.pop(key, []):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+        self._total_length -= self._lengths.pop(key, 0.0)
+        self._documents.pop(key, None)
+
+    def _matching_terms(self, token: str) -> List[str]:
+        """Indexed terms equal to the token or, for longer tokens, starting with it (lock held)"""
+        if len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        terms = []
+        position = bisect.bisect_left(self._vocabulary, token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(token):
+            terms.append(self._vocabulary[position])
+            position += 1
+        return terms
+
+    def _expand(self, tokens: List[str]) -> List[str]:
+        """Tokens followed by the expansions of any abbreviations among them"""
+        if not self._abbreviations:
+            return tokens
+        expanded = list(tokens)
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(len(tokens), start + self._longest_abbreviation) + 1):
+                expansion = self._abbreviations.get(tuple(tokens[start:end]))
+                if expansion:
+                    expanded.extend(expansion)
+        return expanded
+
+    def _document_fields(self, data, summary: Dict) -> Dict[str, List[str]]:
+        """Searchable texts of an item per field"""
+        fields = {
+            'title': [str(summary.get('title', ''))],
+            'description': [str(summary.get('description', '')), str(summary.get('treatment_type', ''))],
+            'tags': [str(tag) for tag in summary.get('tags') or []],
+            'consultation': [],
+            'steps': []
+        }
+
+        # Walk nested structures so aggregate files index the items they contain
+        stack = [data]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, list):
+                stack.extend(value)
+            elif isinstance(value, dict):
+                for key, item in value.items():
+                    if isinstance(item, str):
+                        if key in CONSULTATION_KEYS:
+                            fields['consultation'].append(item)
+                        elif key in STEP_KEYS:
+                            fields['steps'].append(item)
+                        elif key == 'keywords':
+                            fields['tags'].append(item)
+                    elif key == 'keywords' and isinstance(item, list):
+                        fields['tags'].extend(str(tag) for tag in item)
+                    elif isinstance(item, (dict, list)):
+                        stack.append(item)
+        return fields
@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 20000]
+
+_active = threading.local()
+
+
+class SpanRecorder:
+    """Collect timed spans for one request on the current thread.
+
+    Code anywhere below the request (services, RAG) opens spans with span();
+    they are recorded only while a recorder is active on the thread, so the
+    same code runs untimed from background jobs and scripts.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict] = []
+        self._start = None
+
+    @classmethod
+    def start(cls) -> 'SpanRecorder':
+        """Create a recorder and make it the active one for this thread"""
+        recorder = cls()
+        recorder._start = time.perf_counter()
+        _active.recorder = recorder
+        return recorder
+
+    def stop(self):
+        """Deactivate the recorder if it is still the active one"""
+        if getattr(_active, 'recorder', None) is self:
+            _active.recorder = None
+
+    def add(self, name: str, duration_ms: float, attrs: Dict):
+        """Record a finished span"""
+        self.spans.append({'name': name, 'ms': duration_ms, **attrs})
+
+    def summary(self) -> Dict:
+        """Per-stage totals in first-seen order; repeated stages are summed"""
+        stages = {}
+        for item in self.spans:
+            stage = stages.get(item['name'])
+            if stage is None:
+                stages[item['name']] = dict(item, count=1)
+                continue
+            stage['count'] += 1
+            for key, value in item.items():
+                if key == 'name':
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[key] = stage.get(key, 0) + value
+                else:
+                    stage[key] = value
+
+        spans = []
+        for stage in stages.values():
+            stage['ms'] = int(round(stage['ms']))
+            if stage['count'] == 1:
+                del stage['count']
+            spans.append(stage)
+
+        total_ms = int((time.perf_counter() - self._start) * 1000) if self._start else 0
+        return {'total_ms': total_ms, 'spans': spans}
+
+
+def current_recorder() -> Optional[SpanRecorder]:
+    """The recorder active on this thread, if any"""
+    return getattr(_active, 'recorder', None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block under the active recorder.
+
+    Yields a dict; keys added to it inside the block (e.g. token counts) are
+    stored with the span.
+    """
+    recorder = current_recorder()
+    if recorder is None:
+        yield attrs
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        recorder.add(name, (time.perf_counter() - start) * 1000, attrs)
+
+
+def record_span(name: str, duration_ms: float, **attrs):
+    """Record an already measured span under the active recorder"""
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.add(name, duration_ms, attrs)
+
+
+class LatencyHistogram:
+    """Rolling per-stage latency distribution over the last N requests"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._tokens: Dict[str, deque] = {}
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, summary: Dict):
+        """Add the span summary of one request"""
+        with self._lock:
+            self._requests += 1
+            self._sample('total', summary.get('total_ms', 0))
+            for item in summary.get('spans', []):
+                self._sample(item['name'], item['ms'])
+                if 'prompt_tokens' in item or 'completion_tokens' in item:
+                    tokens = self._tokens.setdefault(item['name'], deque(maxlen=self.window))
+                    tokens.append((item.get('prompt_tokens', 0), item.get('completion_tokens', 0)))
+
+    def _sample(self, name: str, value_ms: int):
+        """Append one duration to a stage window (lock held)"""
+        self._samples.setdefault(name, deque(maxlen=self.window)).append(value_ms)
+
+    def get_stats(self) -> Dict:
+        """Percentiles, bucket counts and token averages per stage"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            tokens = {name: list(values) for name, values in self._tokens.items()}
+            requests = self._requests
+
+        stages = {}
+        for name, values in samples.items():
+            ordered = sorted(values)
+            buckets = {f"<={bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+            buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+            for value in ordered:
+                for bound in HISTOGRAM_BUCKETS_MS:
+                    if value <= bound:
+                        buckets[f"<={bound}ms"] += 1
+                        break
+                else:
+                    buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+
+            stages[name] = {
+                'count': len(ordered),
+                'avg_ms': int(sum(ordered) / len(ordered)),
+                'p50_ms': _percentile(ordered, 0.50),
+                'p90_ms': _percentile(ordered, 0.90),
+                'p99_ms': _percentile(ordered, 0.99),
+                'max_ms': ordered[-1],
+                'buckets': buckets
+            }
+            if name in tokens and tokens[name]:
+                stages[name]['avg_prompt_tokens'] = int(sum(t[0] for t in tokens[name]) / len(tokens[name]))
+                stages[name]['avg_completion_tokens'] = int(sum(t[1] for t in tokens[name]) / len(tokens[name]))
+
+        return {'requests': requests, 'window': self.window, 'stages': stages}
+
+
+def _percentile(ordered: List[int], fraction: float) -> int:
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
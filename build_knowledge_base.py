@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Build the knowledge base and its derived files from the DATA source files
+
+    python build_knowledge_base.py
+    python build_knowledge_base.py --force --workers 4
+    python build_knowledge_base.py --sync-index
+
+Derives comprehensive_knowledge_base.json, knowledge_base_index.json,
+search_index.json and enhanced_clinical_cases.json (DATA/ENHANCED_KNOWLEDGE)
+and the enhanced ideal sequences (DATA/IDEAL_SEQUENCES_ENHANCED). Unchanged
+source files are taken from the build cache.
+"""
+
+import sys
+import json
+import argparse
+import logging
+
+from app.services.knowledge_base_build import KnowledgeBaseBuilder
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the knowledge base from the DATA source files")
+    parser.add_argument('--force', action='store_true', help="Rebuild every entry, ignoring the build cache")
+    parser.add_argument('--workers', type=int, help="Parsing processes (default: one per CPU)")
+    parser.add_argument('--sync-index', action='store_true', help="Update the RAG index afterwards")
+    args = parser.parse_args()
+
+    report = KnowledgeBaseBuilder(workers=args.workers).build(force=args.force)
+
+    for error in report['errors']:
+        print(f"❌ {error['file']}: {error['error']}", file=sys.stderr)
+    for path in report['written']:
+        print(f"✅ Wrote {path}", file=sys.stderr)
+    if not report['written']:
+        print("✅ Knowledge base already up to date", file=sys.stderr)
+
+    if args.sync_index and report['written']:
+        from app.services.enhanced_rag_service import EnhancedRAGService
+        rag_service = EnhancedRAGService()
+        rag_service.initialize()
+        print(f"🔄 Index sync: {json.dumps(rag_service.sync_index())}", file=sys.stderr)
+
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Export or import DATA items as NDJSON (one {"category", "id", "data"} object per line)
+
+    python data_transfer.py export > dental_data.ndjson
+    python data_transfer.py export --category clinical_cases -o cases.ndjson
+    python data_transfer.py import dental_data.ndjson --sync-index
+
+Uses the storage backend configured by DATA_STORAGE_BACKEND / DATA_STORAGE_PATH.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from app.config import Config
+from app.services.data_service import DataService
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DATA')
+
+
+def export_items(data_service: DataService, categories, output):
+    """Write every item of the categories to output, one line at a time"""
+    count = 0
+    for line in data_service.export_ndjson(categories):
+        output.write(line)
+        count += 1
+    print(f"✅ Exported {count} items", file=sys.stderr)
+
+
+def import_items(data_service: DataService, source, sync_index: bool):
+    """Import the lines of source, then update the RAG index once if asked"""
+    report = data_service.import_ndjson(source)
+
+    for category, count in report['imported'].items():
+        print(f"✅ Imported {count} {category}", file=sys.stderr)
+    if report['rejected']:
+        print(f"⚠️ Rejected {report['rejected']} rows:", file=sys.stderr)
+        for error in report['errors']:
+            print(f"  line {error['line']}: {error['error']}", file=sys.stderr)
+
+    if sync_index and report['imported'] and not data_service.storage.feeds_knowledge_base:
+        print(f"⚠️ {data_service.storage.name} storage is not indexed: skipping the index sync", file=sys.stderr)
+    elif sync_index and report['imported']:
+        from app.services.enhanced_rag_service import EnhancedRAGService
+        from app.services.knowledge_base import apply_data_events, load_abbreviation_table
+        # Regenerate the knowledge base entries of the imported categories first
+        counts = apply_data_events([{'category': category, 'item_id': None} for category in report['imported']],
+                                   DATA_DIR, load_abbreviation_table())
+        print(f"🔄 Knowledge base: {json.dumps(counts)}", file=sys.stderr)
+        rag_service = EnhancedRAGService()
+        rag_service.initialize()
+        print(f"🔄 Index sync: {json.dumps(rag_service.sync_index())}", file=sys.stderr)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import DATA items as NDJSON")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subcommands.add_parser('export', help="Write items to a file or stdout")
+    export_parser.add_argument('--category', action='append', help="Category to export (repeatable, default all)")
+    export_parser.add_argument('-o', '--output', help="Output file (default stdout)")
+
+    import_parser = subcommands.add_parser('import', help="Create or replace items from a file or stdin")
+    import_parser.add_argument('input', nargs='?', help="NDJSON file (default stdin)")
+    import_parser.add_argument('--sync-index', action='store_true', help="Update the RAG index afterwards")
+
+    args = parser.parse_args()
+    data_service = DataService(DATA_DIR, backend=Config.DATA_STORAGE_BACKEND, database_path=Config.DATA_STORAGE_PATH)
+
+    if args.command == 'export':
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output:
+                export_items(data_service, args.category, output)
+        else:
+            export_items(data_service, args.category, sys.stdout)
+        return 0
+
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as source:
+            report = import_items(data_service, source, args.sync_index)
+    else:
+        report = import_items(data_service, sys.stdin, args.sync_index)
+    return 1 if report['rejected'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
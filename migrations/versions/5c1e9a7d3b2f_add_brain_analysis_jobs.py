@@ -0,0 +1,58 @@
+"""Add brain analysis jobs and runner lease
+
+Revision ID: 5c1e9a7d3b2f
+Revises: 243e8c852ef8
+Create Date: 2026-10-19 10:12:41.418236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9a7d3b2f'
+down_revision = '243e8c852ef8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('brain_analysis_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('full', sa.Boolean(), nullable=True),
+    sa.Column('progress_percentage', sa.Integer(), nullable=True),
+    sa.Column('stage', sa.String(length=200), nullable=True),
+    sa.Column('thoughts', sa.JSON(), nullable=True),
+    sa.Column('new_rules', sa.JSON(), nullable=True),
+    sa.Column('partial_results', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('runner_id', sa.String(length=120), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('created_by_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('brain_analysis_jobs', schema=None) as batch_op:
+        batch_op.create_index('idx_brain_job_status', ['status'], unique=False)
+        batch_op.create_index('idx_brain_job_created', ['created_at'], unique=False)
+
+    op.create_table('brain_runner_leases',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=120), nullable=True),
+    sa.Column('job_id', sa.String(length=36), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('brain_runner_leases')
+    with op.batch_alter_table('brain_analysis_jobs', schema=None) as batch_op:
+        batch_op.drop_index('idx_brain_job_created')
+        batch_op.drop_index('idx_brain_job_status')
+
+    op.drop_table('brain_analysis_jobs')
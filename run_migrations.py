@@ -28,10 +28,10 @@ def run_migrations():
             print("Running pending migrations...")
             upgrade()
             
-            # Also ensure evaluation tables exist
+            # Also ensure evaluation and brain job tables exist
             from app.models import (EvaluationTestCase, GeneratedSequence, 
                                    ManualEvaluation, AutomaticEvaluation, 
-                                   EvaluationMetrics)
+                                   EvaluationMetrics, BrainAnalysisJob, BrainRunnerLease)
             db.create_all()
             
             print("✅ All migrations completed successfully!")
@@ -6,7 +6,8 @@ let analysisState = {
     discoveredRules: [],
     agentThoughts: [],
     currentStage: '',
-    analysisId: null
+    analysisId: null,
+    eventSource: null
 };
 
 // Initialize when DOM is ready
@@ -77,18 +78,69 @@ async function startSmartAnalysis() {
         });
         
         const data = await response.json();
-        if (data.status === 'success') {
+        if (data.status === 'success' || data.analysisId) {
+            // If another analysis is already running, follow it instead
             analysisState.analysisId = data.analysisId;
             
-            // Start polling for updates
-            pollAnalysisProgress();
+            // Follow progress as it is pushed by the server
+            followAnalysisProgress();
         } else {
             throw new Error(data.message || 'Failed to start analysis');
         }
     } catch (error) {
         console.error('Error starting analysis:', error);
         alert('Erreur lors du démarrage de l\'analyse: ' + error.message);
-        resetAnalysis();
+        clearAnalysis();
+    }
+}
+
+// Follow analysis progress over server-sent events (polling if unsupported)
+function followAnalysisProgress() {
+    if (!window.EventSource) {
+        pollAnalysisProgress();
+        return;
+    }
+    
+    // The browser reconnects on its own and resumes after the last received event
+    const source = new EventSource(`/api/brain/analysis-stream/${analysisState.analysisId}`);
+    analysisState.eventSource = source;
+    
+    source.addEventListener('progress', (event) => {
+        updateProgress(JSON.parse(event.data).progress);
+    });
+    source.addEventListener('thought', (event) => {
+        addAgentThought(JSON.parse(event.data));
+    });
+    source.addEventListener('rule', (event) => {
+        addDiscoveredRule(JSON.parse(event.data));
+    });
+    source.addEventListener('done', (event) => {
+        const data = JSON.parse(event.data);
+        closeAnalysisStream();
+        
+        if (data.isComplete) {
+            completeAnalysis();
+        } else if (data.analysisStatus === 'error' || data.analysisStatus === 'interrupted') {
+            alert('L\'analyse a échoué: ' + (data.error || data.analysisStatus));
+            clearAnalysis();
+        } else {
+            clearAnalysis();
+        }
+    });
+    source.addEventListener('error', (event) => {
+        // Server-side error event (e.g. unknown analysis); connection drops are retried by the browser
+        if (event.data) {
+            console.error('Analysis stream error:', event.data);
+            closeAnalysisStream();
+            clearAnalysis();
+        }
+    });
+}
+
+function closeAnalysisStream() {
+    if (analysisState.eventSource) {
+        analysisState.eventSource.close();
+        analysisState.eventSource = null;
     }
 }
 
@@ -116,6 +168,11 @@ async function pollAnalysisProgress() {
             // Check if complete
             if (data.isComplete) {
                 completeAnalysis();
+            } else if (data.analysisStatus === 'error' || data.analysisStatus === 'interrupted') {
+                alert('L\'analyse a échoué: ' + (data.error || data.analysisStatus));
+                clearAnalysis();
+            } else if (data.analysisStatus === 'cancelled') {
+                clearAnalysis();
             } else {
                 // Continue polling
                 setTimeout(() => pollAnalysisProgress(), 1000);
@@ -213,29 +270,36 @@ function completeAnalysis() {
 // Reset analysis
 function resetAnalysis() {
     if (confirm('Êtes-vous sûr de vouloir lancer une nouvelle analyse ? Les résultats actuels seront remplacés.')) {
-        analysisState = {
-            isRunning: false,
-            progress: 0,
-            discoveredRules: [],
-            agentThoughts: [],
-            currentStage: '',
-            analysisId: null
-        };
-        
-        // Clear UI
-        document.getElementById('thinkingContainer').innerHTML = '';
-        document.getElementById('rulesGrid').innerHTML = '';
-        document.getElementById('analysisContainer').style.display = 'none';
-        document.getElementById('analysisComplete').style.display = 'none';
-        document.getElementById('welcomeScreen').style.display = 'block';
-        document.getElementById('startAnalysisBtn').style.display = 'block';
-        document.getElementById('resetAnalysisBtn').style.display = 'none';
-        
-        // Reset progress
-        updateProgress({ percentage: 0, stage: 'En attente...' });
+        clearAnalysis();
     }
 }
 
+// Return to the welcome screen without asking (end of an analysis, errors)
+function clearAnalysis() {
+    closeAnalysisStream();
+    analysisState = {
+        isRunning: false,
+        progress: 0,
+        discoveredRules: [],
+        agentThoughts: [],
+        currentStage: '',
+        analysisId: null,
+        eventSource: null
+    };
+    
+    // Clear UI
+    document.getElementById('thinkingContainer').innerHTML = '';
+    document.getElementById('rulesGrid').innerHTML = '';
+    document.getElementById('analysisContainer').style.display = 'none';
+    document.getElementById('analysisComplete').style.display = 'none';
+    document.getElementById('welcomeScreen').style.display = 'block';
+    document.getElementById('startAnalysisBtn').style.display = 'block';
+    document.getElementById('resetAnalysisBtn').style.display = 'none';
+    
+    // Reset progress
+    updateProgress({ percentage: 0, stage: 'En attente...' });
+}
+
 // Show rule detail
 function showRuleDetail(rule) {
     document.getElementById('ruleTitle').textContent = rule.title;
@@ -1377,6 +1377,7 @@ window.window.userSettings = {
     knowledgeCount: 2,
     reasoningMode: 'adaptive',
     aiModel: 'o4-mini', // Default to thinking model
+    modelRouting: 'auto', // 'auto' = aiModel with a budget per request, 'economy' = cheap model when possible, 'fixed' = always aiModel
     showSimilarityScores: true,
     explainReasoning: true,
     autoExpandTreatment: true,
@@ -1402,6 +1403,11 @@ function showSettings() {
             aiModelSelect.dispatchEvent(new Event('change'));
         }
         
+        const modelRoutingSelect = document.getElementById('modelRouting');
+        if (modelRoutingSelect) {
+            modelRoutingSelect.value = window.userSettings.modelRouting || 'auto';
+        }
+        
         document.getElementById('showSimilarityScores').checked = window.userSettings.showSimilarityScores;
         document.getElementById('explainReasoning').checked = window.userSettings.explainReasoning;
         document.getElementById('autoExpandTreatment').checked = window.userSettings.autoExpandTreatment;
@@ -1464,6 +1470,9 @@ async function saveSettings() {
     window.userSettings.knowledgeCount = parseInt(document.getElementById('knowledgeCount').value);
     window.userSettings.reasoningMode = document.getElementById('reasoningMode').value;
     window.userSettings.aiModel = document.getElementById('aiModel').value;
+    if (document.getElementById('modelRouting')) {
+        window.userSettings.modelRouting = document.getElementById('modelRouting').value;
+    }
     window.userSettings.showSimilarityScores = document.getElementById('showSimilarityScores').checked;
     window.userSettings.explainReasoning = document.getElementById('explainReasoning').checked;
     window.userSettings.autoExpandTreatment = document.getElementById('autoExpandTreatment').checked;
@@ -1518,6 +1527,9 @@ function resetSettings() {
     document.getElementById('knowledgeCount').value = 2;
     document.getElementById('reasoningMode').value = 'adaptive';
     document.getElementById('aiModel').value = 'o4-mini';
+    if (document.getElementById('modelRouting')) {
+        document.getElementById('modelRouting').value = 'auto';
+    }
     document.getElementById('showSimilarityScores').checked = true;
     document.getElementById('explainReasoning').checked = true;
     document.getElementById('autoExpandTreatment').checked = true;
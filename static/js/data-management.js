@@ -3,6 +3,11 @@
 let currentCategory = null;
 let currentItem = null;
 let categories = [];
+let nextItemsCursor = null;
+
+// Items are listed a page at a time, with only the fields the cards show
+const ITEMS_PAGE_SIZE = 50;
+const ITEM_CARD_FIELDS = 'id,title,description,treatment_type,tags';
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -83,12 +88,13 @@ function getIconClass(categoryId) {
     return iconClasses[categoryId] || 'knowledge';
 }
 
-// Load items for a category
+// Load items for a category (first page)
 async function loadCategoryItems(categoryId) {
     currentCategory = categoryId;
+    nextItemsCursor = null;
     
     try {
-        const response = await fetch(`/api/data/items/${categoryId}`, {
+        const response = await fetch(`/api/data/items/${categoryId}?limit=${ITEMS_PAGE_SIZE}&fields=${ITEM_CARD_FIELDS}`, {
             credentials: 'same-origin'
         });
         
@@ -96,6 +102,8 @@ async function loadCategoryItems(categoryId) {
         
         if (result.status === 'success') {
             displayItems(result.items);
+            nextItemsCursor = result.next_cursor;
+            updateLoadMoreButton();
             
             // Update UI
             const category = categories.find(c => c.id === categoryId);
@@ -111,15 +119,66 @@ async function loadCategoryItems(categoryId) {
     }
 }
 
-// Display items
-function displayItems(items) {
+// Load the next page of the current category
+async function loadMoreItems() {
+    if (!nextItemsCursor) return;
+    
+    try {
+        const cursor = encodeURIComponent(nextItemsCursor);
+        const response = await fetch(`/api/data/items/${currentCategory}?limit=${ITEMS_PAGE_SIZE}&fields=${ITEM_CARD_FIELDS}&cursor=${cursor}`, {
+            credentials: 'same-origin'
+        });
+        
+        const result = await response.json();
+        
+        if (result.status === 'success') {
+            displayItems(result.items, true);
+            nextItemsCursor = result.next_cursor;
+            updateLoadMoreButton();
+        } else {
+            showNotification('error', 'Erreur lors du chargement des éléments');
+        }
+    } catch (error) {
+        console.error('Error loading more items:', error);
+        showNotification('error', 'Erreur de connexion');
+    }
+}
+
+// Show a "load more" button below the grid while pages remain
+function updateLoadMoreButton() {
     const grid = document.getElementById('itemsGrid');
-    grid.innerHTML = '';
+    let button = document.getElementById('loadMoreItemsBtn');
+    
+    if (!nextItemsCursor) {
+        if (button) button.remove();
+        return;
+    }
+    
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'loadMoreItemsBtn';
+        button.className = 'add-item-btn load-more-btn';
+        button.textContent = 'Charger plus';
+        button.onclick = loadMoreItems;
+        grid.parentElement.appendChild(button);
+    }
+}
+
+// Display items (append adds a page below the ones already shown)
+function displayItems(items, append = false) {
+    const grid = document.getElementById('itemsGrid');
+    if (!append) {
+        grid.innerHTML = '';
+    }
     
     items.forEach(item => {
         const card = document.createElement('div');
         card.className = 'item-card';
-        card.onclick = () => loadItemDetail(item.id);
+        card.onclick = () => {
+            // Search results span categories
+            if (item.category) currentCategory = item.category;
+            loadItemDetail(item.id);
+        };
         
         let tagsHtml = '';
         if (item.tags && item.tags.length > 0) {
@@ -1596,7 +1655,14 @@ async function searchData(event) {
             const result = await response.json();
             
             if (result.status === 'success') {
-                // Display search results
+                // Results replace the grid: the category pages no longer apply
+                nextItemsCursor = null;
+                updateLoadMoreButton();
+                displayItems(result.results);
+                
+                document.getElementById('categoryTitle').textContent = `Résultats pour « ${query} »`;
+                document.getElementById('categoriesGrid').parentElement.style.display = 'none';
+                document.getElementById('itemsSection').style.display = 'block';
                 showNotification('success', `${result.results.length} résultats trouvés`);
             }
         } catch (error) {